@@ -0,0 +1,369 @@
+import logging
+import math
+import threading
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime
+
+import requests
+from gevent.queue import Empty, Queue
+
+import base_datos
+import metricas
+
+# Umbrales de precio por cartera y símbolo. "sobre" y "bajo" son un precio;
+# "variacion" es un porcentaje sobre el precio de costo de la consolidación
+# en el momento de crearla, y se guarda ya convertido a precio en umbral.
+# Cada alerta se dispara una sola vez: disparada queda con la fecha
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS alertas (
+    id INTEGER PRIMARY KEY,
+    cartera_id INTEGER NOT NULL,
+    symbol TEXT NOT NULL,
+    tipo TEXT NOT NULL,
+    valor REAL NOT NULL,
+    umbral REAL NOT NULL,
+    creada TEXT NOT NULL,
+    disparada TEXT,
+    precio_disparo REAL
+)
+"""
+
+INDICES = (
+    "CREATE INDEX IF NOT EXISTS idx_alertas_cartera ON alertas (cartera_id, id)",
+)
+
+TIPOS = ("sobre", "bajo", "variacion")
+
+COLUMNAS = "id, cartera_id, symbol, tipo, valor, umbral, creada, disparada, precio_disparo"
+
+DISPARADAS = metricas.registro.contador(
+    "alertas_disparadas_total", "Alertas de precio disparadas por este proceso"
+)
+NOTIFICACIONES = metricas.registro.contador(
+    "alertas_notificaciones_total", "Alertas entregadas al notificador (ok, error)", ("resultado",)
+)
+
+log = logging.getLogger(__name__)
+
+
+def inicializar(conn):
+    conn.execute(ESQUEMA)
+    for indice in INDICES:
+        conn.execute(indice)
+
+
+def _existe(conn):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'alertas'"
+    ).fetchone() is not None
+
+
+def _fila(fila):
+    id_, cartera_id, symbol, tipo, valor, umbral, creada, disparada, precio_disparo = fila
+    return {
+        "id": id_,
+        "cartera_id": cartera_id,
+        "symbol": symbol,
+        "tipo": tipo,
+        "valor": valor,
+        "umbral": umbral,
+        "creada": creada,
+        "disparada": disparada,
+        "precio_disparo": precio_disparo,
+    }
+
+
+def sube(alerta):
+    # Si se dispara cuando el precio llega al umbral desde abajo
+    return alerta["tipo"] == "sobre" or (alerta["tipo"] == "variacion" and alerta["valor"] > 0)
+
+
+def _validar_valor(tipo, valor):
+    if tipo not in TIPOS:
+        raise ValueError(f"Tipo de alerta no soportado: {tipo} (usar {', '.join(TIPOS)})")
+    try:
+        valor = float(str(valor).strip())
+    except ValueError:
+        raise ValueError("El valor de la alerta debe ser un número")
+    if not math.isfinite(valor):
+        raise ValueError("El valor de la alerta debe ser un número")
+    if tipo != "variacion" and valor <= 0:
+        raise ValueError("El precio de la alerta debe ser mayor a 0")
+    if tipo == "variacion" and (valor == 0 or valor <= -100):
+        raise ValueError("La variación debe ser distinta de 0 y mayor a -100%")
+    return valor
+
+
+def crear(conn, cartera_id, symbol, tipo, valor):
+    # Debe llamarse dentro de base_datos.escritura(). Devuelve la alerta creada
+    if tipo is not None and not isinstance(tipo, str):
+        raise ValueError("El tipo de alerta debe ser un texto")
+    tipo = (tipo or "").strip().lower()
+    valor = _validar_valor(tipo, valor)
+    umbral = valor
+    if tipo == "variacion":
+        # Mismo precio de costo que muestra la consolidación
+        fila = conn.execute(
+            """
+            SELECT ROUND(valor_usd_total / cantidad_total, 2) FROM posiciones
+            WHERE cartera_id = ? AND symbol = ? AND cantidad_total > 0
+            """,
+            (cartera_id, symbol)
+        ).fetchone()
+        if fila is None:
+            raise ValueError(f"No hay una posición abierta de {symbol} para calcular la variación")
+        umbral = round(fila[0] * (1 + valor / 100), 6)
+    inicializar(conn)
+    cursor = conn.execute(
+        "INSERT INTO alertas (cartera_id, symbol, tipo, valor, umbral, creada) VALUES (?, ?, ?, ?, ?, ?)",
+        (cartera_id, symbol, tipo, valor, umbral, datetime.now().isoformat())
+    )
+    return obtener(conn, cursor.lastrowid)
+
+
+def obtener(conn, alerta_id):
+    fila = conn.execute(f"SELECT {COLUMNAS} FROM alertas WHERE id = ?", (alerta_id,)).fetchone()
+    return _fila(fila) if fila else None
+
+
+def listar(conn, cartera_id):
+    if not _existe(conn):
+        return []
+    return [
+        _fila(fila) for fila in conn.execute(
+            f"SELECT {COLUMNAS} FROM alertas WHERE cartera_id = ? ORDER BY id", (cartera_id,)
+        )
+    ]
+
+
+def borrar(conn, cartera_id, alerta_id):
+    # Devuelve False si la alerta no existe en esa cartera
+    if not _existe(conn):
+        return False
+    cursor = conn.execute(
+        "DELETE FROM alertas WHERE id = ? AND cartera_id = ?", (alerta_id, cartera_id)
+    )
+    return cursor.rowcount > 0
+
+
+class IndiceAlertas:
+    """Alertas pendientes ordenadas por umbral para cada símbolo.
+
+    Por símbolo hay una lista de (umbral, id) para las que suben y otra
+    para las que bajan. Un precio nuevo saca con bisect solo las que cruzó:
+    un prefijo de las que suben y un sufijo de las que bajan.
+    """
+
+    def __init__(self):
+        self._suben = {}
+        self._bajan = {}
+        self._alertas = {}
+        self._lock = threading.Lock()
+
+    def agregar(self, alerta):
+        with self._lock:
+            if alerta["id"] in self._alertas:
+                return
+            self._alertas[alerta["id"]] = alerta
+            listas = self._suben if sube(alerta) else self._bajan
+            insort(listas.setdefault(alerta["symbol"], []), (alerta["umbral"], alerta["id"]))
+
+    def quitar(self, alerta_id):
+        with self._lock:
+            alerta = self._alertas.pop(alerta_id, None)
+            if alerta is None:
+                return None
+            listas = self._suben if sube(alerta) else self._bajan
+            lista = listas[alerta["symbol"]]
+            del lista[bisect_left(lista, (alerta["umbral"], alerta_id))]
+            if not lista:
+                del listas[alerta["symbol"]]
+            return alerta
+
+    def cruzadas(self, symbol, precio):
+        # Saca y devuelve las alertas que el precio alcanza
+        with self._lock:
+            ids = []
+            suben = self._suben.get(symbol)
+            if suben:
+                hasta = bisect_right(suben, (precio, math.inf))
+                ids.extend(i for _, i in suben[:hasta])
+                del suben[:hasta]
+                if not suben:
+                    del self._suben[symbol]
+            bajan = self._bajan.get(symbol)
+            if bajan:
+                desde = bisect_left(bajan, (precio, -math.inf))
+                ids.extend(i for _, i in bajan[desde:])
+                del bajan[desde:]
+                if not bajan:
+                    del self._bajan[symbol]
+            return [self._alertas.pop(i) for i in ids]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._alertas)
+
+
+class NotificadorRegistro:
+    """Escribe cada alerta disparada en el log de la aplicación."""
+
+    def __init__(self, logger=log):
+        self.logger = logger
+
+    def notificar(self, evento):
+        self.logger.warning(
+            "Alerta %s: %s a %s (umbral %s, cartera %s)",
+            evento["id"], evento["symbol"], evento["precio_disparo"], evento["umbral"], evento["cartera_id"]
+        )
+
+
+class NotificadorWebhook:
+    """Envía cada alerta disparada como JSON por POST a `url`."""
+
+    def __init__(self, url, timeout=5, session=None):
+        self.url = url
+        self.timeout = timeout
+        self.session = session or requests.Session()
+
+    def notificar(self, evento):
+        respuesta = self.session.post(self.url, json=evento, timeout=self.timeout)
+        respuesta.raise_for_status()
+
+
+class Alertas:
+    """Evalúa las alertas con cada precio nuevo y entrega las disparadas.
+
+    `evaluar({symbol: precio})` se llama después de guardar precios: solo
+    mira las alertas que los precios cruzaron (ver IndiceAlertas) y las
+    marca como disparadas en la base con un UPDATE condicional, así que
+    cada una se dispara una vez aunque varios procesos vean el mismo
+    precio. Las disparadas pasan por una cola a `notificador.notificar`,
+    fuera del camino de quien guardó el precio.
+    """
+
+    def __init__(self, notificador, pool=None):
+        self.notificador = notificador
+        self.pool = pool
+        self.indice = IndiceAlertas()
+        self.cola = Queue()
+        self._ultimo_id = 0
+        self._cargado = False
+        self._lock = threading.Lock()
+        self.disparadas = 0
+        self.entregadas = 0
+        self.errores = 0
+
+    def _conexion(self):
+        return (self.pool or base_datos.pool).conexion()
+
+    def _escritura(self):
+        return (self.pool or base_datos.pool).escritura()
+
+    def sincronizar(self):
+        # Trae las pendientes creadas desde la última vez, también por otros
+        # procesos. Las borradas o disparadas en otro lado se descartan al
+        # cruzarlas: el UPDATE condicional no las encuentra
+        with self._lock:
+            with self._conexion() as conn:
+                if not _existe(conn):
+                    self._cargado = True
+                    return 0
+                alertas = [
+                    _fila(fila) for fila in conn.execute(
+                        f"SELECT {COLUMNAS} FROM alertas WHERE id > ? ORDER BY id", (self._ultimo_id,)
+                    )
+                ]
+            pendientes = [a for a in alertas if a["disparada"] is None]
+            for alerta in pendientes:
+                self.indice.agregar(alerta)
+            if alertas:
+                self._ultimo_id = max(self._ultimo_id, alertas[-1]["id"])
+            self._cargado = True
+            return len(pendientes)
+
+    def limpiar(self):
+        # Olvida el índice y la cola; se vuelve a cargar en el próximo precio
+        with self._lock:
+            self.indice = IndiceAlertas()
+            self.cola = Queue()
+            self._ultimo_id = 0
+            self._cargado = False
+
+    def agregar(self, alerta):
+        # Una alerta recién creada en este proceso, sin esperar a sincronizar
+        if alerta["disparada"] is None:
+            self.indice.agregar(alerta)
+
+    def quitar(self, alerta_id):
+        self.indice.quitar(alerta_id)
+
+    def evaluar(self, precios, fecha=None):
+        if not self._cargado:
+            self.sincronizar()
+        cruzadas = [
+            (alerta, precio)
+            for symbol, precio in precios.items() if precio is not None
+            for alerta in self.indice.cruzadas(symbol, precio)
+        ]
+        if not cruzadas:
+            return []
+
+        fecha = (fecha or datetime.now()).isoformat()
+        try:
+            with self._escritura() as conn:
+                disparadas = [
+                    {**alerta, "disparada": fecha, "precio_disparo": precio}
+                    for alerta, precio in cruzadas
+                    if conn.execute(
+                        "UPDATE alertas SET disparada = ?, precio_disparo = ? "
+                        "WHERE id = ? AND disparada IS NULL",
+                        (fecha, precio, alerta["id"])
+                    ).rowcount
+                ]
+        except Exception:
+            # Siguen pendientes: las vuelve a mirar el próximo precio
+            for alerta, _ in cruzadas:
+                self.indice.agregar(alerta)
+            raise
+
+        for evento in disparadas:
+            self.cola.put(evento)
+        self.disparadas += len(disparadas)
+        DISPARADAS.sumar(len(disparadas))
+        return disparadas
+
+    def _entregar(self, evento):
+        try:
+            self.notificador.notificar(evento)
+        except Exception as e:
+            self.errores += 1
+            NOTIFICACIONES.sumar(resultado="error")
+            log.warning(f"No se pudo notificar la alerta {evento['id']}: {str(e)}")
+        else:
+            self.entregadas += 1
+            NOTIFICACIONES.sumar(resultado="ok")
+
+    def entregar_pendientes(self):
+        # Vacía la cola sin esperar; devuelve cuántas entregó o intentó
+        entregadas = 0
+        while True:
+            try:
+                evento = self.cola.get_nowait()
+            except Empty:
+                return entregadas
+            self._entregar(evento)
+            entregadas += 1
+
+    def ejecutar(self):
+        while True:
+            self._entregar(self.cola.get())
+
+    def estadisticas(self):
+        return {
+            "pendientes": len(self.indice),
+            "en_cola": self.cola.qsize(),
+            "disparadas": self.disparadas,
+            "entregadas": self.entregadas,
+            "errores": self.errores,
+        }
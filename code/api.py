@@ -1,13 +1,47 @@
+if __name__ == "__main__":
+    # Parchear la librería estándar antes de importar requests para que las
+    # llamadas de red cedan el control entre greenlets
+    from gevent import monkey
+    monkey.patch_all()
+
 import decimal
 import requests
-from flask import Flask, render_template, redirect, jsonify, flash, request, url_for
+from flask import Flask, Response, g, render_template, redirect, jsonify, flash, request, url_for
 from gevent.pywsgi import WSGIServer
 from datetime import datetime, timedelta
 import sqlite3
 from dotenv import load_dotenv
 import os
+import json
+import sys
+from functools import partial
+import time
 import locale
 from decimal import Decimal
+from cache_precios import CachePrecios
+from cliente_fmp import ClienteFMP, ErrorAPI, LimiteSolicitudesError, CircuitoAbiertoError
+from indice_simbolos import IndiceSimbolos
+from refrescador import Refrescador
+from difusion import Difusor
+from planificador import Planificador, Cubeta, INTERACTIVA, FONDO, BUSQUEDA
+from proveedores import Cotizador, Grabador, ProveedorArchivo, ProveedorFMP
+from cache_consolidacion import CacheConsolidacion
+import base_datos
+import migraciones
+import prefork
+import carteras
+import posiciones
+import importacion
+import historial
+import exportacion
+import valoracion
+import historico
+import rendimiento
+import riesgo
+import alertas
+import metricas
+from validaciones import validar_compra, validar_symbol, validar_venta
+import gevent
 
 load_dotenv()
 API_KEY = os.getenv("FINANCIAL_MODELING_API_KEY")
@@ -37,33 +71,324 @@ def format_number(value):
     except (ValueError, decimal.InvalidOperation):
         return "0.00"
 
-def obtener_precio_actual(symbol):
-    CACHE_DURATION = timedelta(hours=1)
+CACHE_DURATION = timedelta(hours=1)
+# Símbolos por llamada a /quote y llamadas simultáneas como máximo
+SIMBOLOS_POR_LOTE = 50
+MAX_CONSULTAS_CONCURRENTES = 8
+
+# Sesión HTTP compartida con la API (reintentos y circuito incluidos)
+cliente = ClienteFMP(API_KEY)
+
+# Procesos que atienden el puerto (ver prefork.py). La tabla precios es la
+# caché que comparten: solo el proceso elegido refresca en segundo plano y
+# los demás leen lo que guardó. La cuota de FMP se reparte entre todos
+TRABAJADORES = max(1, int(os.getenv("TRABAJADORES", 1)))
+# Conexiones que atiende a la vez cada proceso. Cada cliente de
+# /stream/precios ocupa una todo el tiempo, así que tiene que alcanzar para
+# ellos más las peticiones comunes; /metrics informa el uso
+# (greenlets_en_uso) y este límite (greenlets_capacidad) del pool "http"
+MAX_CONEXIONES = max(1, int(os.getenv("MAX_CONEXIONES", 10000)))
+
+# Todas las llamadas a la API pasan por el planificador: una cubeta de
+# FMP_LLAMADAS_POR_MINUTO fichas (ráfagas de hasta FMP_RAFAGA) con prioridad
+# para las consultas de precio de los usuarios, luego el refresco en segundo
+# plano y por último la búsqueda. Un usuario espera turno como mucho
+# ESPERA_MAXIMA_INTERACTIVA segundos; la búsqueda, ESPERA_MAXIMA_BUSQUEDA
+planificador = Planificador(
+    cliente,
+    Cubeta(
+        tasa=float(os.getenv("FMP_LLAMADAS_POR_MINUTO", 300)) / 60 / TRABAJADORES,
+        capacidad=max(1, int(os.getenv("FMP_RAFAGA", 10)) // TRABAJADORES)
+    ),
+    max_simbolos=SIMBOLOS_POR_LOTE,
+    esperas_maximas={
+        INTERACTIVA: float(os.getenv("ESPERA_MAXIMA_INTERACTIVA", 5)),
+        FONDO: None,
+        BUSQUEDA: float(os.getenv("ESPERA_MAXIMA_BUSQUEDA", 2)),
+    }
+)
+cliente_fondo = planificador.con_prioridad(FONDO)
+
+# Proveedores de cotizaciones en orden de preferencia (PROVEEDORES_PRECIOS,
+# separados por comas): "fmp" es la API en turno del planificador y
+# "archivo" lee PRECIOS_ARCHIVO sin conexión. Si el primero tarda más que su
+# p95, una consulta de usuario se pide también al siguiente y se usa la
+# primera respuesta válida. GRABAR_PRECIOS=ruta guarda lo que responde el
+# primero para repetirlo después con "archivo"
+PRECIOS_ARCHIVO = os.getenv("PRECIOS_ARCHIVO", "precios_grabados.json")
+
+def crear_proveedor(nombre):
+    if nombre == "fmp":
+        return ProveedorFMP(planificador)
+    if nombre == "archivo":
+        return ProveedorArchivo(PRECIOS_ARCHIVO)
+    raise ValueError(f"Proveedor de precios desconocido: {nombre}")
+
+proveedores = [
+    crear_proveedor(nombre.strip().lower())
+    for nombre in os.getenv("PROVEEDORES_PRECIOS", "fmp").split(",") if nombre.strip()
+]
+if os.getenv("GRABAR_PRECIOS"):
+    proveedores[0] = Grabador(proveedores[0], os.getenv("GRABAR_PRECIOS"))
+cotizador = Cotizador(
+    proveedores,
+    espera_inicial=float(os.getenv("COBERTURA_ESPERA_INICIAL", 1.0))
+)
+
+# Catálogo de símbolos para autocompletar: se carga de SIMBOLOS_ARCHIVO si
+# existe y se refresca desde /stock/list cada INTERVALO_CATALOGO segundos
+indice_simbolos = IndiceSimbolos()
+SIMBOLOS_ARCHIVO = os.getenv("SIMBOLOS_ARCHIVO")
+INTERVALO_CATALOGO = int(os.getenv("INTERVALO_CATALOGO", 24 * 60 * 60))
+
+def refrescar_catalogo():
+    while True:
+        try:
+            indice_simbolos.cargar(cliente_fondo.get("stock/list"))
+        except Exception as e:
+            app.logger.warning(f"No se pudo refrescar el catálogo de símbolos: {str(e)}")
+        gevent.sleep(INTERVALO_CATALOGO)
+
+# Cierres diarios para series y rendimientos: se completan al arrancar y cada
+# INTERVALO_HISTORICO segundos para las acciones en cartera.
+# PROVEEDOR_HISTORICO=simulado usa precios inventados (sin conexión)
+INTERVALO_HISTORICO = int(os.getenv("INTERVALO_HISTORICO", 6 * 60 * 60))
+ANIOS_HISTORICO = int(os.getenv("ANIOS_HISTORICO", historico.ANIOS_POR_DEFECTO))
+if os.getenv("PROVEEDOR_HISTORICO") == "simulado":
+    proveedor_historico = historico.ProveedorSimulado()
+else:
+    proveedor_historico = historico.ProveedorFMP(cliente_fondo)
+
+def actualizar_historico():
+    while True:
+        try:
+            with base_datos.conexion() as conn:
+                # El benchmark también, para la beta de /api/riesgo
+                symbols = historico.simbolos_en_cartera(conn) + [BENCHMARK_RIESGO]
+            resultado = historico.actualizar(proveedor_historico, symbols, anios=ANIOS_HISTORICO)
+            for symbol, error in resultado["errores"].items():
+                app.logger.warning(f"No se pudo actualizar el histórico de {symbol}: {error}")
+        except Exception as e:
+            app.logger.warning(f"No se pudo actualizar el histórico: {str(e)}")
+        gevent.sleep(INTERVALO_HISTORICO)
+
+# Serie diaria de valor y rendimientos, memorizada por versión de cada cartera
+rendimientos = rendimiento.Rendimientos()
+
+# Volatilidad, correlaciones, beta y máxima caída sobre los cierres diarios,
+# memorizadas igual que los rendimientos. BENCHMARK_RIESGO es la referencia
+# de la beta cuando la consulta no pide otra
+BENCHMARK_RIESGO = os.getenv("BENCHMARK_RIESGO", riesgo.BENCHMARK_POR_DEFECTO).strip().upper()
+riesgos = riesgo.Riesgos()
+
+# Precios recientes en memoria para no abrir SQLite en cada consulta
+cache_precios = CachePrecios(CACHE_DURATION, capacidad=1000)
+
+# Métricas para /metrics (ver metricas.py). La frescura se cuenta en la
+# lectura de la tabla precios, detrás de cache_precios
+PETICIONES = metricas.registro.histograma(
+    "http_peticiones_segundos", "Latencia de las peticiones por ruta", ("ruta", "metodo", "estado")
+)
+SEGUNDOS_RENDER = metricas.registro.histograma(
+    "render_segundos", "Tiempo de renderizado de plantillas Jinja", ("plantilla",)
+)
+FRESCURA_PRECIOS = metricas.registro.contador(
+    "precios_frescura_total",
+    "Precios leídos de la tabla precios: fresco, obsoleto (se sirve y se refresca), "
+    "vencido (se pide a la API) o ausente",
+    ("resultado",)
+)
+metricas.registro.medidor(
+    "cache_precios_aciertos_total", "Aciertos de la caché de precios en memoria",
+    lambda: cache_precios.aciertos, tipo="counter"
+)
+metricas.registro.medidor(
+    "cache_precios_fallos_total", "Fallos de la caché de precios en memoria",
+    lambda: cache_precios.fallos, tipo="counter"
+)
+metricas.registro.medidor(
+    "planificador_en_cola", "Llamadas a FMP esperando turno",
+    lambda: {(p,): n for p, n in planificador.estadisticas()["en_cola"].items()}, ("prioridad",)
+)
+metricas.registro.medidor(
+    "cache_precios_entradas", "Precios guardados en la caché en memoria",
+    lambda: cache_precios.estadisticas()["tamano"]
+)
+
+# Un precio vencido hace menos de MAX_OBSOLESCENCIA se sirve igual mientras
+# se refresca en segundo plano; más viejo que eso se espera a la API
+MAX_OBSOLESCENCIA = timedelta(minutes=int(os.getenv("MAX_OBSOLESCENCIA_MIN", 30)))
+# El refresco en segundo plano se adelanta al vencimiento: con 0.8 un precio
+# se renueva cuando cumple el 80% de CACHE_DURATION
+REFRESCO_ANTICIPACION = float(os.getenv("REFRESCO_ANTICIPACION", 0.8))
+
+# Cambios de precio hacia los clientes conectados a /stream/precios
+difusor = Difusor()
+
+# Alertas de precio: se evalúan cada vez que se guarda un precio y las
+# disparadas se entregan en segundo plano a NOTIFICADOR_ALERTAS ("registro"
+# las escribe en el log; "webhook" las envía por POST a ALERTAS_WEBHOOK)
+def crear_notificador(nombre):
+    if nombre == "registro":
+        return alertas.NotificadorRegistro(app.logger)
+    if nombre == "webhook":
+        if not os.getenv("ALERTAS_WEBHOOK"):
+            raise ValueError("ALERTAS_WEBHOOK no configurada en el archivo .env")
+        return alertas.NotificadorWebhook(os.getenv("ALERTAS_WEBHOOK"))
+    raise ValueError(f"Notificador de alertas desconocido: {nombre}")
 
+motor_alertas = alertas.Alertas(crear_notificador(os.getenv("NOTIFICADOR_ALERTAS", "registro").strip().lower()))
+metricas.registro.medidor(
+    "alertas_pendientes", "Alertas de precio sin disparar en el índice de este proceso",
+    lambda: len(motor_alertas.indice)
+)
+
+def evaluar_alertas(precios, fecha):
+    # Un error con las alertas no debe impedir servir ni guardar el precio
+    try:
+        motor_alertas.evaluar(precios, fecha)
+    except Exception as e:
+        app.logger.warning(f"No se pudieron evaluar las alertas: {str(e)}")
+
+# Última consolidación calculada de cada cartera (con su JSON y su HTML) hasta
+# que cambien sus posiciones o la fecha de alguno de sus precios guardados,
+# también si los escribió otro proceso; VIGENCIA_CONSOLIDACION acota igual
+# cuánto se reutiliza. Si falta algún precio (un símbolo con punto, uno que
+# dejó de cotizar) se guarda por VIGENCIA_CONSOLIDACION_INCOMPLETA segundos
+VIGENCIA_CONSOLIDACION = int(os.getenv("VIGENCIA_CONSOLIDACION", 60))
+VIGENCIA_CONSOLIDACION_INCOMPLETA = int(os.getenv("VIGENCIA_CONSOLIDACION_INCOMPLETA", 10))
+
+HUELLA_CONSOLIDACION = """
+SELECT p.symbol, p.cantidad_total, p.valor_usd_total, pr.fecha
+FROM posiciones p LEFT JOIN precios pr ON pr.symbol = p.symbol
+WHERE p.cartera_id = ? AND p.cantidad_total > 0
+ORDER BY p.symbol
+"""
+
+def huella_consolidacion(cartera_id=carteras.PRINCIPAL):
+    # Las posiciones de la cartera y la fecha del precio guardado de cada
+    # una: otras escrituras (alertas, la serie de rendimientos) no la cambian
+    with base_datos.conexion() as conn:
+        return tuple(conn.execute(HUELLA_CONSOLIDACION, (cartera_id,)))
+
+cache_consolidacion = CacheConsolidacion(
+    lambda cartera_id=carteras.PRINCIPAL: obtener_consolidacion(cartera_id),
+    lambda datos: app.json.dumps(datos).encode(),
+    huella_consolidacion,
+    vigencia=VIGENCIA_CONSOLIDACION,
+    completa=lambda datos: all(fila["precio_actual"] for fila in datos),
+    vigencia_incompleta=VIGENCIA_CONSOLIDACION_INCOMPLETA
+)
+
+def simbolos_por_vencer():
+    # Acciones en alguna cartera o seguidas por algún cliente del stream, sin
+    # precio o con un precio cerca de vencer, los más viejos primero. Cada
+    # símbolo se pide una vez aunque lo tengan muchas carteras
+    limite = datetime.now() - CACHE_DURATION * REFRESCO_ANTICIPACION
+    with base_datos.conexion() as conn:
+        filas = conn.execute(
+            """
+            SELECT p.symbol
+            FROM posiciones p
+            LEFT JOIN precios pr ON pr.symbol = p.symbol
+            WHERE p.cantidad_total > 0 AND (pr.fecha IS NULL OR pr.fecha < ?)
+            GROUP BY p.symbol
+            ORDER BY pr.fecha
+            """,
+            (limite.isoformat(),)
+        ).fetchall()
+        symbols = [symbol for symbol, in filas if symbol.isalpha()]
+
+        suscritos = difusor.simbolos() - set(symbols)
+        if suscritos:
+            placeholders = ",".join("?" * len(suscritos))
+            vigentes = {
+                symbol for symbol, in conn.execute(
+                    f"SELECT symbol FROM precios WHERE symbol IN ({placeholders}) AND fecha >= ?",
+                    [*suscritos, limite.isoformat()]
+                )
+            }
+            symbols.extend(sorted(suscritos - vigentes))
+    return symbols
+
+def _vigentes_en_base(symbols):
+    # Los que ya tienen un precio reciente en la tabla, quizás guardado por otro proceso
+    limite = (datetime.now() - CACHE_DURATION * REFRESCO_ANTICIPACION).isoformat()
+    vigentes = set()
+    with base_datos.conexion() as conn:
+        for i in range(0, len(symbols), 500):
+            lote = symbols[i:i + 500]
+            placeholders = ",".join("?" * len(lote))
+            vigentes.update(
+                symbol for symbol, in conn.execute(
+                    f"SELECT symbol FROM precios WHERE symbol IN ({placeholders}) AND fecha >= ?",
+                    [*lote, limite]
+                )
+            )
+    return vigentes
+
+def refrescar_precios(symbols):
+    # Pide los precios sin mirar la caché y los guarda; devuelve {symbol: precio}
+    if TRABAJADORES > 1:
+        vigentes = _vigentes_en_base(symbols)
+        symbols = [s for s in symbols if s not in vigentes]
+    lotes = [
+        symbols[i:i + SIMBOLOS_POR_LOTE]
+        for i in range(0, len(symbols), SIMBOLOS_POR_LOTE)
+    ]
+    nuevos = {}
+    pool = metricas.pool_por_llamada("fmp", MAX_CONSULTAS_CONCURRENTES)
+    for resultado in pool.imap_unordered(partial(_consultar_lote, prioridad=FONDO), lotes):
+        nuevos.update(resultado)
+    _guardar_precios(nuevos)
+    return nuevos
+
+refrescador = Refrescador(
+    simbolos_por_vencer,
+    refrescar_precios,
+    intervalo=int(os.getenv("REFRESCO_INTERVALO", 60)),
+    concurrencia=int(os.getenv("REFRESCO_CONCURRENCIA", 2)),
+    tamano_lote=SIMBOLOS_POR_LOTE,
+    pausa=float(os.getenv("REFRESCO_PAUSA", 1.0))
+)
+
+def obtener_precio_actual(symbol):
     if not symbol or not symbol.isalpha():
         raise ValueError("Símbolo inválido")
 
-    conn = sqlite3.connect('precios.db')
-    cursor = conn.cursor()
+    return cache_precios.obtener_o_cargar(symbol, _cargar_precio)
 
+def _cargar_precio(symbol):
+    # Lee precios.db y, si el precio venció, lo pide a la API.
+    # Devuelve (precio, fecha) para que la caché respete la antigüedad real
     try:
-        cursor.execute("SELECT precio, fecha FROM precios WHERE symbol = ?", (symbol,))
-        resultado = cursor.fetchone()
+        with base_datos.conexion() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT precio, fecha FROM precios WHERE symbol = ?", (symbol,))
+            resultado = cursor.fetchone()
 
         if resultado:
             precio, fecha = resultado
             fecha_precio = datetime.fromisoformat(fecha)
-            if datetime.now() - fecha_precio < CACHE_DURATION:
-                return precio
-
-        API_URL = f"https://financialmodelingprep.com/api/v3/quote/{symbol}"
-        response = requests.get(API_URL, params={"apikey": API_KEY}, timeout=5)
-        
-        if response.status_code == 429:
-            raise ValueError("Se ha excedido el límite de solicitudes a la API")  # Cambiado aquí
-        elif response.status_code != 200:
-            raise ValueError(f"Error al obtener datos de la API: {response.status_code}")
-        data = response.json()
+            antiguedad = datetime.now() - fecha_precio
+            if antiguedad < CACHE_DURATION:
+                FRESCURA_PRECIOS.sumar(resultado="fresco")
+                return precio, fecha_precio
+            if antiguedad < CACHE_DURATION + MAX_OBSOLESCENCIA:
+                FRESCURA_PRECIOS.sumar(resultado="obsoleto")
+                refrescador.solicitar([symbol])
+                return precio, fecha_precio
+            FRESCURA_PRECIOS.sumar(resultado="vencido")
+        else:
+            FRESCURA_PRECIOS.sumar(resultado="ausente")
+
+        try:
+            data = cotizador.cotizaciones([symbol], INTERACTIVA)
+        except (CircuitoAbiertoError, LimiteSolicitudesError):
+            # Mientras la API esté caída o sin cuota se sirve el último precio conocido
+            if resultado:
+                return precio, fecha_precio
+            raise
 
         if not data or not isinstance(data, list) or len(data) == 0:
             raise ValueError("No se encontraron datos para este símbolo")
@@ -72,12 +397,17 @@ def obtener_precio_actual(symbol):
         if precio_actual is None:
             raise ValueError("No se pudo obtener el precio actual")
 
-        cursor.execute(
-            "REPLACE INTO precios (symbol, precio, fecha) VALUES (?, ?, ?)",
-            (symbol, precio_actual, datetime.now().isoformat())
-        )
-        conn.commit()
-        return precio_actual
+        # La conexión se pide recién ahora para no retenerla durante la llamada HTTP
+        fecha_precio = datetime.now()
+        with base_datos.escritura() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "REPLACE INTO precios (symbol, precio, fecha) VALUES (?, ?, ?)",
+                (symbol, precio_actual, fecha_precio.isoformat())
+            )
+        difusor.publicar(symbol, precio_actual, fecha_precio)
+        evaluar_alertas({symbol: precio_actual}, fecha_precio)
+        return precio_actual, fecha_precio
 
     except requests.exceptions.Timeout:
         raise ValueError("Tiempo de espera agotado al contactar la API")
@@ -85,10 +415,137 @@ def obtener_precio_actual(symbol):
         raise ValueError(f"Error de conexión: {str(e)}")
     except sqlite3.Error as e:
         raise ValueError(f"Error de base de datos: {str(e)}")
+    except ValueError:
+        raise
     except Exception as e:
         raise ValueError(f"Error inesperado: {str(e)}")
-    finally:
-        conn.close()
+
+def _consultar_cotizaciones(symbols, prioridad=INTERACTIVA):
+    # Una sola llamada a /quote con varios símbolos separados por comas
+    data = cotizador.cotizaciones(symbols, prioridad)
+    if not isinstance(data, list):
+        raise ValueError("Respuesta inesperada de la API")
+
+    return {
+        item["symbol"]: item["price"]
+        for item in data
+        if item.get("symbol") in symbols and item.get("price") is not None
+    }
+
+def _consultar_lote(lote, prioridad=INTERACTIVA):
+    try:
+        return _consultar_cotizaciones(lote, prioridad)
+    except (LimiteSolicitudesError, CircuitoAbiertoError):
+        # Pedir símbolo por símbolo solo gastaría más cuota
+        return {}
+    except (ValueError, requests.exceptions.RequestException):
+        pass
+
+    # El lote no se pudo pedir de una vez: un símbolo por llamada
+    precios = {}
+    pool = metricas.pool_por_llamada("fmp", MAX_CONSULTAS_CONCURRENTES)
+    for resultado in pool.imap_unordered(partial(_consultar_simbolo, prioridad=prioridad), lote):
+        precios.update(resultado)
+    return precios
+
+def _consultar_simbolo(symbol, prioridad=INTERACTIVA):
+    try:
+        return _consultar_cotizaciones([symbol], prioridad)
+    except (ValueError, requests.exceptions.RequestException):
+        return {}
+
+def _guardar_precios(nuevos):
+    # Todos los precios nuevos en una sola transacción
+    if not nuevos:
+        return
+    fecha = datetime.now()
+    with base_datos.escritura() as conn:
+        conn.executemany(
+            "REPLACE INTO precios (symbol, precio, fecha) VALUES (?, ?, ?)",
+            [(symbol, precio, fecha.isoformat()) for symbol, precio in nuevos.items()]
+        )
+    for symbol, precio in nuevos.items():
+        cache_precios.guardar(symbol, precio, fecha)
+        difusor.publicar(symbol, precio, fecha)
+    evaluar_alertas(nuevos, fecha)
+
+def obtener_precios(symbols):
+    # Versión por lotes de obtener_precio_actual: devuelve {symbol: precio}
+    # y omite los símbolos inválidos o sin precio disponible
+    symbols = list(dict.fromkeys(s for s in symbols if s and s.isalpha()))
+    precios = {}
+    for symbol in symbols:
+        precio = cache_precios.obtener(symbol)
+        if precio is not None:
+            precios[symbol] = precio
+
+    faltantes = [s for s in symbols if s not in precios]
+    if not faltantes:
+        return precios
+
+    try:
+        placeholders = ",".join("?" * len(faltantes))
+        with base_datos.conexion() as conn:
+            filas = conn.execute(
+                f"SELECT symbol, precio, fecha FROM precios WHERE symbol IN ({placeholders})",
+                faltantes
+            ).fetchall()
+        ahora = datetime.now()
+        viejos = {}
+        a_revalidar = []
+        for symbol, precio, fecha in filas:
+            fecha_precio = datetime.fromisoformat(fecha)
+            if ahora - fecha_precio < CACHE_DURATION:
+                precios[symbol] = precio
+                cache_precios.guardar(symbol, precio, fecha_precio)
+                FRESCURA_PRECIOS.sumar(resultado="fresco")
+            elif ahora - fecha_precio < CACHE_DURATION + MAX_OBSOLESCENCIA:
+                precios[symbol] = precio
+                a_revalidar.append(symbol)
+                FRESCURA_PRECIOS.sumar(resultado="obsoleto")
+            else:
+                viejos[symbol] = precio
+                FRESCURA_PRECIOS.sumar(resultado="vencido")
+        if len(filas) < len(faltantes):
+            FRESCURA_PRECIOS.sumar(len(faltantes) - len(filas), resultado="ausente")
+
+        if a_revalidar:
+            refrescador.solicitar(a_revalidar)
+
+        vencidos = [s for s in faltantes if s not in precios]
+        if not vencidos:
+            return precios
+
+        # Los lotes se piden en paralelo: la espera total es la del más lento
+        lotes = [
+            vencidos[i:i + SIMBOLOS_POR_LOTE]
+            for i in range(0, len(vencidos), SIMBOLOS_POR_LOTE)
+        ]
+        nuevos = {}
+        pool = metricas.pool_por_llamada("fmp", MAX_CONSULTAS_CONCURRENTES)
+        for resultado in pool.imap_unordered(_consultar_lote, lotes):
+            nuevos.update(resultado)
+
+        _guardar_precios(nuevos)
+
+        if cliente.circuito.abierto:
+            # Con la API caída se sirve el último precio conocido
+            for symbol, precio in viejos.items():
+                nuevos.setdefault(symbol, precio)
+
+        precios.update(nuevos)
+        return precios
+
+    except sqlite3.Error as e:
+        raise ValueError(f"Error de base de datos: {str(e)}")
+
+def _respuesta_limite(error):
+    # 429 con Retry-After cuando se sabe cuánto falta para tener cuota
+    response = jsonify({"error": str(error)})
+    response.status_code = 429
+    if error.retry_after:
+        response.headers["Retry-After"] = str(max(1, round(error.retry_after)))
+    return response
 
 @app.route('/precio_actual', methods=['GET'])
 def precio_actual():
@@ -103,18 +560,270 @@ def precio_actual():
         else:
             return jsonify({"error": "No se pudo obtener el precio actual"}), 404
 
+    except LimiteSolicitudesError as e:
+        return _respuesta_limite(e)
+    except CircuitoAbiertoError as e:
+        return jsonify({"error": str(e)}), 503
     except ValueError as e:
-        error_message = str(e)
-    
-    # Manejo específico para el error de límite de solicitudes
-        if "límite de solicitudes" in error_message.lower():
-            return jsonify({"error": error_message}), 429
-    
-        return jsonify({"error": error_message}), 400  # Código 400 si es otro ValueError
+        return jsonify({"error": str(e)}), 400  # Código 400 si es otro ValueError
     
     except Exception:
         return jsonify({"error": "Error interno del servidor"}), 500
 
+MAX_SIMBOLOS_STREAM = 200
+# Cada cuántos segundos se manda un comentario para mantener viva la conexión
+INTERVALO_PING = 15
+
+def _evento_sse(datos):
+    return f"event: precio\ndata: {json.dumps(datos)}\n\n"
+
+@app.route('/stream/precios', methods=['GET'])
+def stream_precios():
+    symbols = [
+        s for s in dict.fromkeys(request.args.get("symbols", "").upper().split(","))
+        if s and s.isalpha()
+    ]
+    if not symbols:
+        return jsonify({"error": "Símbolos no proporcionados"}), 400
+    if len(symbols) > MAX_SIMBOLOS_STREAM:
+        return jsonify({"error": f"Máximo {MAX_SIMBOLOS_STREAM} símbolos por conexión"}), 400
+
+    suscripcion = difusor.suscribir(symbols)
+
+    def eventos():
+        try:
+            # Primero los precios conocidos; después solo los cambios
+            try:
+                iniciales = obtener_precios(symbols)
+            except Exception:
+                iniciales = {}
+            for symbol, precio in iniciales.items():
+                yield _evento_sse({"symbol": symbol, "precio": precio})
+
+            while True:
+                cambios = suscripcion.esperar(INTERVALO_PING)
+                if not cambios:
+                    yield ": ping\n\n"
+                for datos in cambios:
+                    yield _evento_sse(datos)
+        finally:
+            difusor.cancelar(suscripcion)
+
+    return Response(
+        eventos(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Con esta cabecera la respuesta trae Server-Timing con el tiempo que se fue
+# en SQLite, en la API y en las plantillas
+CABECERA_DESGLOSE = "X-Desglose-Tiempos"
+
+@app.before_request
+def iniciar_medicion():
+    g.inicio_peticion = time.perf_counter()
+    if request.headers.get(CABECERA_DESGLOSE):
+        metricas.iniciar_desglose()
+
+@app.after_request
+def registrar_medicion(response):
+    inicio = g.pop("inicio_peticion", None)
+    desglose = metricas.terminar_desglose()
+    if inicio is None:
+        return response
+    transcurrido = time.perf_counter() - inicio
+    # La regla ("/precio_actual") y no la URL, para no abrir una serie por símbolo
+    ruta = request.url_rule.rule if request.url_rule else "sin_ruta"
+    PETICIONES.observar(transcurrido, ruta=ruta, metodo=request.method, estado=response.status_code)
+    if desglose is not None:
+        response.headers["Server-Timing"] = metricas.server_timing(desglose, transcurrido)
+    return response
+
+@app.before_request
+def validar_cartera():
+    # Las rutas con /carteras/<id> responden 404 si la cartera no existe
+    cartera_id = (request.view_args or {}).get("cartera_id")
+    if cartera_id is None or cartera_id == carteras.PRINCIPAL:
+        return None
+    try:
+        with base_datos.conexion() as conn:
+            existe = carteras.obtener(conn, cartera_id)
+    except sqlite3.Error:
+        existe = None
+    if existe is None:
+        return jsonify({"error": "Cartera no encontrada"}), 404
+    return None
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(metricas.registro.exponer(), mimetype="text/plain; version=0.0.4")
+
+@app.route('/estado/refresco', methods=['GET'])
+def estado_refresco():
+    return jsonify({
+        **refrescador.estadisticas(),
+        "stream": difusor.estadisticas(),
+        "consolidacion": cache_consolidacion.estadisticas(),
+        "planificador": planificador.estadisticas(),
+        "proveedores": cotizador.estadisticas(),
+        "alertas": motor_alertas.estadisticas(),
+        "proceso": {"pid": os.getpid(), "lider": candidato.lider, "trabajadores": TRABAJADORES}
+    })
+
+@app.route('/api/carteras', methods=['GET'])
+def api_carteras():
+    try:
+        with base_datos.conexion() as conn:
+            return jsonify({"carteras": carteras.listar(conn)})
+    except sqlite3.Error as e:
+        return jsonify({"error": f"Error de base de datos: {str(e)}"}), 500
+
+@app.route('/api/carteras', methods=['POST'])
+def crear_cartera():
+    datos = request.get_json(silent=True) or request.form
+    try:
+        with base_datos.escritura() as conn:
+            cartera = carteras.crear(conn, datos.get("nombre"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except sqlite3.Error as e:
+        return jsonify({"error": f"Error de base de datos: {str(e)}"}), 500
+    return jsonify(cartera), 201
+
+@app.route('/api/alertas', methods=['GET'], defaults={'cartera_id': carteras.PRINCIPAL})
+@app.route('/carteras/<int:cartera_id>/api/alertas', methods=['GET'])
+def api_alertas(cartera_id):
+    try:
+        with base_datos.conexion() as conn:
+            return jsonify({"alertas": alertas.listar(conn, cartera_id)})
+    except sqlite3.Error as e:
+        return jsonify({"error": f"Error de base de datos: {str(e)}"}), 500
+
+@app.route('/api/alertas', methods=['POST'], defaults={'cartera_id': carteras.PRINCIPAL})
+@app.route('/carteras/<int:cartera_id>/api/alertas', methods=['POST'])
+def crear_alerta(cartera_id):
+    datos = request.get_json(silent=True) or request.form
+    try:
+        symbol = validar_symbol(datos.get("symbol"))
+        with base_datos.escritura() as conn:
+            alerta = alertas.crear(conn, cartera_id, symbol, datos.get("tipo"), datos.get("valor"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except sqlite3.Error as e:
+        return jsonify({"error": f"Error de base de datos: {str(e)}"}), 500
+    motor_alertas.agregar(alerta)
+    # Con un precio ya conocido no hace falta esperar al próximo refresco
+    precio = cache_precios.obtener(symbol)
+    if precio is not None:
+        evaluar_alertas({symbol: precio}, datetime.now())
+    return jsonify(alerta), 201
+
+@app.route('/api/alertas/<int:alerta_id>', methods=['DELETE'], defaults={'cartera_id': carteras.PRINCIPAL})
+@app.route('/carteras/<int:cartera_id>/api/alertas/<int:alerta_id>', methods=['DELETE'])
+def borrar_alerta(cartera_id, alerta_id):
+    try:
+        with base_datos.escritura() as conn:
+            borrada = alertas.borrar(conn, cartera_id, alerta_id)
+    except sqlite3.Error as e:
+        return jsonify({"error": f"Error de base de datos: {str(e)}"}), 500
+    if not borrada:
+        return jsonify({"error": "Alerta no encontrada"}), 404
+    motor_alertas.quitar(alerta_id)
+    return "", 204
+
+@app.route('/api/consolidacion', methods=['GET'], defaults={'cartera_id': carteras.PRINCIPAL})
+@app.route('/carteras/<int:cartera_id>/api/consolidacion', methods=['GET'])
+def api_consolidacion(cartera_id):
+    try:
+        instantanea = cache_consolidacion.obtener(cartera_id)
+    except Exception as e:
+        return jsonify({"error": f"Error al obtener la consolidación: {str(e)}"}), 500
+
+    # ETag fuerte: el mismo cuerpo siempre da la misma etiqueta; con
+    # If-None-Match igual se responde 304 sin cuerpo
+    response = Response(instantanea.cuerpo, mimetype="application/json")
+    response.set_etag(instantanea.etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
+
+@app.route('/api/historico', methods=['GET'])
+def api_historico():
+    symbols = [
+        s for s in dict.fromkeys(request.args.get("symbols", "").upper().split(","))
+        if s and s.isalpha()
+    ]
+    if not symbols:
+        return jsonify({"error": "Símbolos no proporcionados"}), 400
+    try:
+        desde = request.args.get("desde")
+        hasta = request.args.get("hasta")
+        desde = datetime.strptime(desde, '%Y-%m-%d').date() if desde else None
+        hasta = datetime.strptime(hasta, '%Y-%m-%d').date() if hasta else None
+    except ValueError:
+        return jsonify({"error": "Fecha inválida"}), 400
+
+    try:
+        with base_datos.conexion() as conn:
+            series = historico.leer(conn, symbols, desde, hasta)
+    except sqlite3.Error as e:
+        return jsonify({"error": f"Error de base de datos: {str(e)}"}), 500
+
+    return jsonify({
+        symbol: {"fechas": fechas.astype(str).tolist(), "cierres": cierres.tolist()}
+        for symbol, (fechas, cierres) in series.items()
+    })
+
+@app.route('/api/rendimiento', methods=['GET'], defaults={'cartera_id': carteras.PRINCIPAL})
+@app.route('/carteras/<int:cartera_id>/api/rendimiento', methods=['GET'])
+def api_rendimiento(cartera_id):
+    # Aunque es un GET, puede escribir: si la serie guardada quedó atrás de
+    # compras, ventas o cierres nuevos, se recalcula el tramo pendiente y se
+    # guarda antes de responder (ver rendimiento.Rendimientos.obtener)
+    try:
+        return jsonify(rendimientos.obtener(cartera_id))
+    except sqlite3.Error as e:
+        return jsonify({"error": f"Error de base de datos: {str(e)}"}), 500
+
+@app.route('/api/riesgo', methods=['GET'], defaults={'cartera_id': carteras.PRINCIPAL})
+@app.route('/carteras/<int:cartera_id>/api/riesgo', methods=['GET'])
+def api_riesgo(cartera_id):
+    benchmark = request.args.get("benchmark", BENCHMARK_RIESGO).strip().upper()
+    if not benchmark.isalpha():
+        return jsonify({"error": "Símbolo de referencia inválido"}), 400
+    try:
+        dias = int(request.args.get("dias", riesgo.DIAS_POR_DEFECTO))
+        ventana = int(request.args.get("ventana", riesgo.VENTANA_POR_DEFECTO))
+    except ValueError:
+        return jsonify({"error": "dias y ventana deben ser números enteros"}), 400
+    if not 30 <= dias <= 20 * 365 or not 2 <= ventana <= 252:
+        return jsonify({"error": "dias debe estar entre 30 y 7300 y ventana entre 2 y 252"}), 400
+    try:
+        return jsonify(riesgos.obtener(cartera_id, benchmark, dias, ventana))
+    except sqlite3.Error as e:
+        return jsonify({"error": f"Error de base de datos: {str(e)}"}), 500
+
+@app.route('/api/ventas', methods=['POST'], defaults={'cartera_id': carteras.PRINCIPAL})
+@app.route('/carteras/<int:cartera_id>/api/ventas', methods=['POST'])
+def registrar_venta(cartera_id):
+    datos = request.get_json(silent=True) or request.form
+    try:
+        fecha, symbol, cantidad, precio, metodo = validar_venta(datos)
+        with base_datos.escritura() as conn:
+            venta = posiciones.registrar_venta(conn, fecha, symbol, cantidad, precio, metodo, cartera_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except sqlite3.Error as e:
+        return jsonify({"error": f"Error de base de datos: {str(e)}"}), 500
+    return jsonify(venta), 201
+
+@app.route('/api/ganancias', methods=['GET'], defaults={'cartera_id': carteras.PRINCIPAL})
+@app.route('/carteras/<int:cartera_id>/api/ganancias', methods=['GET'])
+def api_ganancias(cartera_id):
+    try:
+        return jsonify(obtener_ganancias(cartera_id))
+    except sqlite3.Error as e:
+        return jsonify({"error": f"Error de base de datos: {str(e)}"}), 500
+
 @app.route('/buscar_simbolo', methods=['GET'])
 def buscar_simbolo():
     term = request.args.get("term", "").upper()
@@ -122,17 +831,13 @@ def buscar_simbolo():
         return jsonify({"simbolos": []})
     
     try:
-        url = "https://financialmodelingprep.com/api/v3/search"
-        response = requests.get(
-            url,
-            params={"query": term, "limit": 10, "apikey": API_KEY},
-            timeout=5
-        )
-        
-        if response.status_code != 200:
-            raise ValueError(f"Error en la API: {response.status_code}")
+        # Primero el catálogo local; la API solo para términos que no están
+        simbolos = indice_simbolos.buscar(term, limite=10)
+        if simbolos is not None:
+            return jsonify({"simbolos": simbolos})
 
-        data = response.json()
+        data = planificador.ejecutar(BUSQUEDA, cliente.buscar, term, limite=10)
+        indice_simbolos.recordar(term, data)
         simbolos = [
             {
                 "symbol": item["symbol"],
@@ -148,37 +853,102 @@ def buscar_simbolo():
         return jsonify({"error": "Tiempo de espera agotado"}), 504
     except requests.exceptions.RequestException as e:
         return jsonify({"error": f"Error de conexión: {str(e)}"}), 503
+    except LimiteSolicitudesError as e:
+        return _respuesta_limite(e)
+    except CircuitoAbiertoError as e:
+        return jsonify({"error": str(e)}), 503
+    except ErrorAPI as e:
+        return jsonify({"error": f"Error en la API: {e.status_code}"}), 400
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": "Error interno del servidor"}), 500
 
+@app.route('/importar', methods=['POST'], defaults={'cartera_id': carteras.PRINCIPAL})
+@app.route('/carteras/<int:cartera_id>/importar', methods=['POST'])
+def importar_compras(cartera_id):
+    archivo = request.files.get("archivo")
+    if not archivo or not archivo.filename:
+        return jsonify({"error": "Archivo no proporcionado"}), 400
+
+    try:
+        resultado = importacion.importar_subida(archivo, request.form.get("formato"), cartera_id)
+        return jsonify(resultado)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception:
+        return jsonify({"error": "Error interno del servidor"}), 500
+
+def obtener_historial(args, cartera_id=carteras.PRINCIPAL):
+    # Los mismos parámetros de la URL sirven para la vista HTML y para la API
+    with base_datos.conexion() as conn:
+        return historial.consultar_historial(
+            conn,
+            ordenar_por=args.get("ordenar_por"),
+            direccion=args.get("direccion"),
+            fecha_inicio=args.get("fecha_inicio"),
+            fecha_fin=args.get("fecha_fin"),
+            symbol=args.get("symbol"),
+            cursor=args.get("cursor"),
+            limite=args.get("limite"),
+            cartera_id=cartera_id
+        )
+
+@app.route('/api/historial', methods=['GET'], defaults={'cartera_id': carteras.PRINCIPAL})
+@app.route('/carteras/<int:cartera_id>/api/historial', methods=['GET'])
+def api_historial(cartera_id):
+    try:
+        return jsonify(obtener_historial(request.args, cartera_id))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception:
+        return jsonify({"error": "Error interno del servidor"}), 500
+
+def _respuesta_exportacion(nombre, filas, columnas):
+    formato = request.args.get("formato", "csv").lower()
+    if formato not in exportacion.FORMATOS:
+        return jsonify({"error": f"Formato no soportado: {formato}"}), 400
+
+    # El generador se consume mientras se envía: memoria constante
+    return Response(
+        exportacion.serializar(filas, columnas, formato),
+        mimetype=exportacion.FORMATOS[formato],
+        headers={"Content-Disposition": f"attachment; filename={nombre}.{formato}"}
+    )
+
+@app.route('/exportar/historial', methods=['GET'], defaults={'cartera_id': carteras.PRINCIPAL})
+@app.route('/carteras/<int:cartera_id>/exportar/historial', methods=['GET'])
+def exportar_historial(cartera_id):
+    return _respuesta_exportacion(
+        "historial", exportacion.filas_historial(cartera_id=cartera_id),
+        exportacion.COLUMNAS_HISTORIAL
+    )
+
+@app.route('/exportar/consolidacion', methods=['GET'], defaults={'cartera_id': carteras.PRINCIPAL})
+@app.route('/carteras/<int:cartera_id>/exportar/consolidacion', methods=['GET'])
+def exportar_consolidacion(cartera_id):
+    return _respuesta_exportacion(
+        "consolidacion", iterar_consolidacion(cartera_id=cartera_id),
+        exportacion.COLUMNAS_CONSOLIDACION
+    )
+
 # Modificar la ruta principal para manejar los filtros:
-@app.route('/', methods=['GET', 'POST'])
-def home():
+def _renderizar(plantilla, **contexto):
+    with metricas.cronometro(SEGUNDOS_RENDER, "render", plantilla=plantilla):
+        return render_template(plantilla, **contexto)
+
+@app.route('/', methods=['GET', 'POST'], defaults={'cartera_id': carteras.PRINCIPAL})
+@app.route('/carteras/<int:cartera_id>/', methods=['GET', 'POST'])
+def home(cartera_id):
     if request.method == "POST":
         try:
-            fecha_compra = request.form.get("fecha_compra")
-            if not fecha_compra:
-                flash("La fecha de compra es obligatoria", "danger")
-                return redirect(request.url)
-            
-            try:
-                fecha_parsed = datetime.strptime(fecha_compra, '%Y-%m-%d')
-                if fecha_parsed > datetime.now():
-                    flash("La fecha no puede ser futura", "danger")
-                    return redirect(request.url)
-            except ValueError:
-                flash("Fecha inválida", "danger")
-                return redirect(request.url)
-
-            symbol = request.form.get("empresa", "").strip().upper()
-            if not symbol:
-                flash("El símbolo de la empresa es obligatorio", "danger")
-                return redirect(request.url)
-            
+            # Las mismas validaciones que usa la importación masiva
+            fecha, symbol, cantidad, valor = validar_compra(request.form)
+            with base_datos.escritura() as conn:
+                posiciones.registrar_compra(conn, fecha, symbol, cantidad, valor, cartera_id)
+
             flash("Registro guardado exitosamente", "success")
-            return redirect(url_for('home'))
+            return redirect(url_for('home', cartera_id=cartera_id))
 
         except ValueError as e:
             flash(str(e), "danger")
@@ -188,60 +958,234 @@ def home():
             return redirect(request.url)
 
     try:
-        # Obtener datos de consolidación
-        consolidacion = obtener_consolidacion()
-        return render_template("index.html", consolidacion=consolidacion)
+        compras = obtener_historial(request.args, cartera_id)
+    except ValueError as e:
+        flash(str(e), "danger")
+        compras = {"compras": [], "siguiente": None}
     except Exception as e:
-        flash(f"Error al obtener la consolidación: {str(e)}", "danger")
-        return render_template("index.html", consolidacion=[])
+        flash(f"Error al obtener el historial: {str(e)}", "danger")
+        compras = {"compras": [], "siguiente": None}
+
+    siguiente_url = None
+    if compras["siguiente"]:
+        parametros = request.args.to_dict()
+        parametros["cursor"] = compras["siguiente"]
+        siguiente_url = url_for('home', cartera_id=cartera_id, **parametros)
 
-# Modificar la función obtener_consolidacion para usar Decimal
-def obtener_consolidacion():
-    conn = sqlite3.connect("precios.db")
-    cursor = conn.cursor()
-    
     try:
-        query = """
-        SELECT 
-            symbol,
-            SUM(cantidad_acciones) as cantidad_total,
-            SUM(valor_total) as valor_usd_total,
-            ROUND(SUM(valor_total) / SUM(cantidad_acciones), 2) as precio_costo
-        FROM historial_compras
-        GROUP BY symbol
-        """
-        cursor.execute(query)
-        resultados = cursor.fetchall()
-        
+        # La consolidación y su HTML se reutilizan mientras no cambie nada
+        instantanea = cache_consolidacion.obtener(cartera_id)
+        consolidacion = instantanea.datos
+        consolidacion_html = instantanea.fragmento(
+            "tabla",
+            lambda datos: _renderizar(
+                "_consolidacion.html", consolidacion=datos, textos=valoracion.formatear_filas(datos)
+            )
+        )
+    except Exception as e:
+        flash(f"Error al obtener la consolidación: {str(e)}", "danger")
         consolidacion = []
-        for row in resultados:
-            symbol, cantidad_total, valor_usd_total, precio_costo = row
-            
-            try:
-                precio_actual = Decimal(str(obtener_precio_actual(symbol)))
-                valor_actual_total = precio_actual * Decimal(str(cantidad_total))
-                ganancia_perdida = valor_actual_total - Decimal(str(valor_usd_total))
-                porcentaje = (ganancia_perdida / Decimal(str(valor_usd_total)) * 100).quantize(Decimal('0.01'))
-            except Exception:
-                precio_actual = Decimal('0')
-                ganancia_perdida = Decimal('0')
-                porcentaje = Decimal('0')
-            
-            consolidacion.append({
-                'accion': symbol,
-                'cantidad_total': cantidad_total,
-                'valor_usd_total': Decimal(str(valor_usd_total)).quantize(Decimal('0.01')),
-                'precio_costo': Decimal(str(precio_costo)).quantize(Decimal('0.01')),
-                'precio_actual': precio_actual.quantize(Decimal('0.01')),
-                'ganancia_perdida': ganancia_perdida.quantize(Decimal('0.01')),
-                'porcentaje': porcentaje
-            })
-        
-        return consolidacion
-    finally:
-        conn.close()
+        consolidacion_html = _renderizar("_consolidacion.html", consolidacion=[], textos=[])
+
+    return _renderizar(
+        "index.html",
+        consolidacion=consolidacion,
+        consolidacion_html=consolidacion_html,
+        historial=compras["compras"],
+        # Prefijo de las rutas de esta cartera ("" en la principal)
+        prefijo=url_for('home', cartera_id=cartera_id).rstrip("/"),
+        siguiente_url=siguiente_url,
+        ordenar_por=request.args.get("ordenar_por", "fecha_compra"),
+        direccion=request.args.get("direccion", "asc"),
+        fecha_inicio=request.args.get("fecha_inicio", ""),
+        fecha_fin=request.args.get("fecha_fin", "")
+    )
+
+# posiciones ya tiene los totales por símbolo: una fila por acción
+CONSULTA_POSICIONES = """
+SELECT 
+    symbol,
+    cantidad_total,
+    valor_usd_total,
+    ROUND(valor_usd_total / cantidad_total, 2) as precio_costo
+FROM posiciones
+WHERE cartera_id = ? AND cantidad_total > 0
+ORDER BY symbol
+"""
+
+# Un lote de CONSULTA_POSICIONES desde el símbolo que sigue al último
+# leído, por la clave primaria (cartera_id, symbol)
+PAGINA_POSICIONES = """
+SELECT 
+    symbol,
+    cantidad_total,
+    valor_usd_total,
+    ROUND(valor_usd_total / cantidad_total, 2) as precio_costo
+FROM posiciones
+WHERE cartera_id = ? AND symbol > ? AND cantidad_total > 0
+ORDER BY symbol
+LIMIT ?
+"""
+
+# La valoración se hace de una sola pasada para toda la cartera (ver valoracion.py)
+def obtener_consolidacion(cartera_id=carteras.PRINCIPAL):
+    with base_datos.conexion() as conn:
+        cursor = conn.cursor()
+        cursor.execute(CONSULTA_POSICIONES, (cartera_id,))
+        resultados = cursor.fetchall()
+
+    # Todos los precios en una sola pasada en lugar de uno por fila
+    try:
+        precios = obtener_precios([row[0] for row in resultados])
+    except Exception:
+        precios = {}
+
+    return valoracion.valorar(resultados, precios).filas()
+
+def obtener_ganancias(cartera_id=carteras.PRINCIPAL):
+    # Realizada (ventas, guardada en posiciones) y no realizada (la de la
+    # consolidación) por símbolo, incluidas las posiciones ya cerradas
+    with base_datos.conexion() as conn:
+        filas = conn.execute(
+            """
+            SELECT symbol, cantidad_total, ganancia_realizada FROM posiciones
+            WHERE cartera_id = ? AND (cantidad_total > 0 OR ganancia_realizada != 0)
+            ORDER BY symbol
+            """,
+            (cartera_id,)
+        ).fetchall()
+    no_realizadas = {
+        fila["accion"]: fila["ganancia_perdida"]
+        for fila in cache_consolidacion.obtener(cartera_id).datos
+    }
+
+    ganancias = []
+    for symbol, cantidad_total, realizada in filas:
+        ganancias.append({
+            "accion": symbol,
+            "cantidad_total": cantidad_total,
+            "ganancia_realizada": Decimal(str(realizada)).quantize(valoracion.CENTAVO),
+            "ganancia_no_realizada": no_realizadas.get(symbol, Decimal("0.00")),
+        })
+    return {
+        "ganancias": ganancias,
+        "realizada": sum((g["ganancia_realizada"] for g in ganancias), Decimal("0.00")),
+        "no_realizada": sum((g["ganancia_no_realizada"] for g in ganancias), Decimal("0.00")),
+    }
+
+def iterar_consolidacion(tamano_lote=SIMBOLOS_POR_LOTE, cartera_id=carteras.PRINCIPAL):
+    # Igual que obtener_consolidacion pero de a un lote por clave (symbol) y
+    # con los precios pedidos por lote, para exportar carteras grandes sin
+    # listas enteras. La conexión se devuelve al pool antes de pedir precios
+    ultimo = ""
+    while True:
+        with base_datos.conexion() as conn:
+            lote = conn.execute(PAGINA_POSICIONES, (cartera_id, ultimo, tamano_lote)).fetchall()
+        if not lote:
+            return
+        ultimo = lote[-1][0]
+        try:
+            precios = obtener_precios([row[0] for row in lote])
+        except Exception:
+            precios = {}
+        yield from valoracion.valorar(lote, precios).filas()
+
+# Un solo proceso (entre trabajadores e instancias con la misma base) corre
+# el refresco de precios y de cierres: el que tiene el bloqueo de este archivo
+candidato = prefork.Candidato(base_datos.pool.ruta + ".lider")
+metricas.registro.medidor(
+    "proceso_lider", "1 si este proceso corre las tareas de fondo", lambda: int(candidato.lider)
+)
+# Cada cuánto un trabajador trae de la tabla precios los cambios que
+# guardaron otros, para sus clientes de /stream/precios
+INTERVALO_SINCRONIZACION = float(os.getenv("INTERVALO_SINCRONIZACION", 5))
+
+def iniciar_tareas_de_fondo():
+    if refrescador.intervalo > 0:
+        gevent.spawn(refrescador.ejecutar)
+    if INTERVALO_HISTORICO > 0:
+        gevent.spawn(actualizar_historico)
+
+def publicar_guardados(symbols):
+    # Precios de la tabla a la caché en memoria y al stream; el difusor
+    # descarta los que no cambiaron. Devuelve los que están por vencer
+    symbols = sorted(symbols)
+    limite = datetime.now() - CACHE_DURATION * REFRESCO_ANTICIPACION
+    por_vencer = set(symbols)
+    with base_datos.conexion() as conn:
+        for i in range(0, len(symbols), 500):
+            lote = symbols[i:i + 500]
+            placeholders = ",".join("?" * len(lote))
+            filas = conn.execute(
+                f"SELECT symbol, precio, fecha FROM precios WHERE symbol IN ({placeholders})", lote
+            ).fetchall()
+            for symbol, precio, fecha in filas:
+                fecha_precio = datetime.fromisoformat(fecha)
+                cache_precios.guardar(symbol, precio, fecha_precio)
+                difusor.publicar(symbol, precio, fecha_precio)
+                if fecha_precio >= limite:
+                    por_vencer.discard(symbol)
+    return por_vencer
+
+def sincronizar_precios():
+    while True:
+        gevent.sleep(INTERVALO_SINCRONIZACION)
+        try:
+            # Las alertas creadas en otros procesos también se evalúan aquí
+            motor_alertas.sincronizar()
+            por_vencer = publicar_guardados(difusor.simbolos())
+            # Lo que sigue solo este proceso no lo refresca nadie más
+            if por_vencer and not candidato.lider:
+                refrescador.solicitar(sorted(por_vencer))
+        except Exception as e:
+            app.logger.warning(f"No se pudieron sincronizar los precios: {str(e)}")
+
+def crear_servidor(listener):
+    # Se llama en cada proceso que atiende, después del fork
+    if INTERVALO_CATALOGO > 0:
+        gevent.spawn(refrescar_catalogo)
+    gevent.spawn(candidato.competir, iniciar_tareas_de_fondo)
+    gevent.spawn(motor_alertas.ejecutar)
+    if TRABAJADORES > 1 and INTERVALO_SINCRONIZACION > 0:
+        gevent.spawn(sincronizar_precios)
+    # Con límite explícito (MAX_CONEXIONES) para ver en /metrics qué tan
+    # cerca está de llenarse; al llenarse las conexiones nuevas esperan
+    return WSGIServer(listener, app, spawn=metricas.pool("http", MAX_CONEXIONES))
 
 if __name__ == "__main__":
-    http_server = WSGIServer(('0.0.0.0', 5000), app)
-    print("Servidor corriendo en http://127.0.0.1:5000")
-    http_server.serve_forever()
\ No newline at end of file
+    heredado = prefork.listener_heredado()
+    if heredado is not None:
+        # Trabajador lanzado por el maestro: este proceso ya leyó el código y
+        # el .env del disco, así que un SIGHUP al maestro los actualiza
+        if SIMBOLOS_ARCHIVO and os.path.exists(SIMBOLOS_ARCHIVO):
+            indice_simbolos.cargar_archivo(SIMBOLOS_ARCHIVO)
+        prefork.servir(crear_servidor, heredado, float(os.getenv("GRACIA_TRABAJADORES", prefork.GRACIA)))
+        raise SystemExit(0)
+
+    # Por lotes, para no bloquear la base si otra instancia la está usando.
+    # Con una base grande conviene correr antes `python migraciones.py`
+    migraciones.migrar(base_datos.pool)
+    with base_datos.escritura() as conn:
+        posiciones.inicializar(conn)
+        historial.inicializar(conn)
+        historico.inicializar(conn)
+        rendimiento.inicializar(conn)
+        alertas.inicializar(conn)
+    # Los trabajadores abren sus propias conexiones
+    base_datos.pool.cerrar()
+
+    if SIMBOLOS_ARCHIVO and os.path.exists(SIMBOLOS_ARCHIVO):
+        indice_simbolos.cargar_archivo(SIMBOLOS_ARCHIVO)
+
+    puerto = int(os.getenv("PUERTO", 5000))
+    print(f"Servidor corriendo en http://127.0.0.1:{puerto}")
+    if TRABAJADORES > 1:
+        # kill -HUP <pid del maestro> renueva los trabajadores sin cortar
+        # peticiones; cada uno vuelve a ejecutar este archivo desde el disco
+        maestro = prefork.Maestro(
+            crear_servidor, TRABAJADORES, ('0.0.0.0', puerto),
+            gracia=float(os.getenv("GRACIA_TRABAJADORES", prefork.GRACIA)),
+            comando=[sys.executable, os.path.abspath(__file__)]
+        )
+        raise SystemExit(maestro.ejecutar())
+    crear_servidor(('0.0.0.0', puerto)).serve_forever()
@@ -0,0 +1,148 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import metricas
+
+RUTA_DB = os.getenv(
+    "PRECIOS_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "precios.db")
+)
+
+# Configuración aplicada a cada conexión nueva: WAL permite leer mientras
+# otro escribe y synchronous=NORMAL es seguro en ese modo
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-8000",
+    "PRAGMA foreign_keys=ON",
+)
+
+SEGUNDOS_SQLITE = metricas.registro.histograma(
+    "sqlite_segundos", "Tiempo con una conexión SQLite tomada", ("tipo",)
+)
+ESPERA_ESCRITURA = metricas.registro.histograma(
+    "sqlite_espera_escritura_segundos", "Espera por el turno de escritura dentro del proceso"
+)
+
+
+class PoolConexiones:
+    """Reutiliza conexiones SQLite entre peticiones y serializa las escrituras."""
+
+    def __init__(self, ruta, max_inactivas=8, sentencias_en_cache=256):
+        self.ruta = ruta
+        self.max_inactivas = max_inactivas
+        self.sentencias_en_cache = sentencias_en_cache
+        self._inactivas = []
+        self._lock = threading.Lock()
+        self._lock_escritura = threading.Lock()
+        # Cambia con cada escritura confirmada desde este proceso
+        self.version = 0
+        # Conexión propia para preguntar si otro proceso escribió
+        self._vigia = None
+
+    def _conectar(self):
+        # isolation_level=None: las lecturas no abren transacciones implícitas
+        # y las escrituras las delimita escritura() con BEGIN IMMEDIATE.
+        # cached_statements guarda las sentencias preparadas de cada conexión
+        conn = sqlite3.connect(
+            self.ruta,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=self.sentencias_en_cache
+        )
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _tomar(self):
+        with self._lock:
+            if self._inactivas:
+                return self._inactivas.pop()
+        return self._conectar()
+
+    def _devolver(self, conn):
+        with self._lock:
+            if len(self._inactivas) < self.max_inactivas:
+                self._inactivas.append(conn)
+                return
+        conn.close()
+
+    @contextmanager
+    def conexion(self):
+        with metricas.cronometro(SEGUNDOS_SQLITE, "sqlite", tipo="lectura"), self._conexion() as conn:
+            yield conn
+
+    @contextmanager
+    def _conexion(self):
+        conn = self._tomar()
+        try:
+            yield conn
+        except sqlite3.Error:
+            # Una conexión que falló no vuelve al pool
+            conn.close()
+            raise
+        except BaseException:
+            self._devolver(conn)
+            raise
+        else:
+            self._devolver(conn)
+
+    @contextmanager
+    def escritura(self):
+        # Un solo escritor a la vez dentro del proceso; BEGIN IMMEDIATE toma
+        # el bloqueo de escritura de SQLite al empezar y no a mitad de camino
+        with metricas.cronometro(ESPERA_ESCRITURA):
+            self._lock_escritura.acquire()
+        try:
+            with metricas.cronometro(SEGUNDOS_SQLITE, "sqlite", tipo="escritura"), \
+                    self._conexion() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    yield conn
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+                conn.execute("COMMIT")
+                self.version += 1
+        finally:
+            self._lock_escritura.release()
+
+    def version_externa(self):
+        # PRAGMA data_version cambia cuando otra conexión confirma cambios,
+        # sea de este proceso o de otro: lo que escriben los demás
+        # trabajadores también se nota
+        with self._lock:
+            if self._vigia is None:
+                self._vigia = self._conectar()
+            return self._vigia.execute("PRAGMA data_version").fetchone()[0]
+
+    def cerrar(self):
+        # Hay que llamarlo antes de os.fork(): una conexión SQLite no se
+        # comparte entre procesos
+        with self._lock:
+            inactivas, self._inactivas = self._inactivas, []
+            vigia, self._vigia = self._vigia, None
+        for conn in inactivas + ([vigia] if vigia else []):
+            conn.close()
+
+
+pool = PoolConexiones(RUTA_DB)
+
+
+def conexion():
+    return pool.conexion()
+
+
+def escritura():
+    return pool.escritura()
+
+
+def configurar(ruta):
+    # Cambia la base de datos del pool global (p. ej. en las pruebas)
+    pool.cerrar()
+    pool.ruta = ruta
+    pool.version += 1
@@ -0,0 +1,310 @@
+import argparse
+import json
+import os
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import requests
+
+import base_datos
+import posiciones
+from stub_fmp import ServidorFMP, simbolos_sinteticos
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+# Bases sembradas que se reutilizan entre corridas (ignoradas por git)
+DIRECTORIO_BASES = os.path.join(DIRECTORIO, ".benchmark")
+BASE_POR_DEFECTO = os.path.join(DIRECTORIO, "benchmark_base.json")
+# El esquema se copia de la base del repositorio para no divergir
+ESQUEMA_ORIGEN = os.path.join(DIRECTORIO, "precios.db")
+
+TAMANOS = (10, 1000, 100000)
+MAX_SIMBOLOS_CARTERA = 500
+# Cuánto puede empeorar una métrica respecto de la línea base sin avisar
+TOLERANCIA = 0.25
+
+
+def _esquema():
+    with sqlite3.connect(ESQUEMA_ORIGEN) as origen:
+        return [
+            sql for nombre, sql in origen.execute(
+                "SELECT name, sql FROM sqlite_master WHERE type = 'table'"
+            )
+            if nombre in ("precios", "historial_compras")
+        ]
+
+
+def sembrar(ruta, filas, semilla=0):
+    """Crea una base con `filas` compras inventadas y sus posiciones.
+
+    Las compras se reparten entre hasta MAX_SIMBOLOS_CARTERA símbolos en los
+    últimos cinco años; con la misma semilla el resultado es el mismo.
+    """
+    azar = random.Random(semilla)
+    symbols = simbolos_sinteticos(max(1, min(filas, MAX_SIMBOLOS_CARTERA)))
+    hoy = date.today()
+    compras = [
+        (
+            (hoy - timedelta(days=azar.randrange(5 * 365))).isoformat(),
+            azar.choice(symbols),
+            azar.randint(1, 200),
+            round(azar.uniform(5, 500), 2),
+        )
+        for _ in range(filas)
+    ]
+
+    pool = base_datos.PoolConexiones(ruta)
+    try:
+        with pool.escritura() as conn:
+            for sql in _esquema():
+                conn.execute(sql)
+            posiciones.inicializar(conn)
+            posiciones.registrar_compras(conn, compras)
+    finally:
+        pool.cerrar()
+    return symbols
+
+
+def preparar_base(filas, semilla=0):
+    # Siembra una sola vez por tamaño y deja los precios recién actualizados
+    # para que la corrida no dependa de cuándo se sembró
+    os.makedirs(DIRECTORIO_BASES, exist_ok=True)
+    ruta = os.path.join(DIRECTORIO_BASES, f"compras_{filas}_{semilla}.db")
+    if not os.path.exists(ruta):
+        sembrar(ruta, filas, semilla)
+
+    pool = base_datos.PoolConexiones(ruta)
+    try:
+        with pool.escritura() as conn:
+            symbols = [s for s, in conn.execute("SELECT symbol FROM posiciones ORDER BY symbol")]
+            ahora = datetime.now().isoformat()
+            conn.executemany(
+                "REPLACE INTO precios (symbol, precio, fecha) VALUES (?, ?, ?)",
+                [(s, round(random.Random(s).uniform(5, 500), 2), ahora) for s in symbols]
+            )
+    finally:
+        pool.cerrar()
+    return ruta, symbols
+
+
+def _puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class ServidorApp:
+    """api.py en un proceso aparte, con el mismo WSGIServer de gevent que en producción."""
+
+    def __init__(self, ruta_db, url_fmp, puerto=None):
+        self.puerto = puerto or _puerto_libre()
+        self.url = f"http://127.0.0.1:{self.puerto}"
+        self.entorno = dict(
+            os.environ,
+            PRECIOS_DB=ruta_db,
+            FMP_URL_BASE=url_fmp,
+            PUERTO=str(self.puerto),
+            FINANCIAL_MODELING_API_KEY=os.getenv("FINANCIAL_MODELING_API_KEY", "benchmark"),
+            FLASK_SECRET_KEY=os.getenv("FLASK_SECRET_KEY", "benchmark"),
+            # La cuota real de FMP limitaría la carga: se mide la app, no el plan
+            FMP_LLAMADAS_POR_MINUTO=os.getenv("FMP_LLAMADAS_POR_MINUTO", "60000"),
+            FMP_RAFAGA=os.getenv("FMP_RAFAGA", "1000"),
+            # Sin tareas de fondo: solo se mide lo que piden los clientes
+            INTERVALO_CATALOGO="0",
+            INTERVALO_HISTORICO="0",
+            REFRESCO_INTERVALO="0",
+        )
+        self.proceso = None
+        # gevent registra cada pedido en stderr: a un archivo, que no se llena
+        self.registro = None
+
+    def iniciar(self, espera=30):
+        self.registro = tempfile.TemporaryFile()
+        self.proceso = subprocess.Popen(
+            [sys.executable, os.path.join(DIRECTORIO, "api.py")],
+            cwd=DIRECTORIO, env=self.entorno,
+            stdout=subprocess.DEVNULL, stderr=self.registro
+        )
+        limite = time.monotonic() + espera
+        while time.monotonic() < limite:
+            if self.proceso.poll() is not None:
+                self.registro.seek(0)
+                raise RuntimeError(f"api.py terminó al iniciar:\n{self.registro.read().decode()}")
+            try:
+                requests.get(f"{self.url}/estado/refresco", timeout=1)
+                return self
+            except requests.exceptions.ConnectionError:
+                time.sleep(0.1)
+        self.detener()
+        raise RuntimeError("api.py no respondió a tiempo")
+
+    def detener(self):
+        if self.proceso and self.proceso.poll() is None:
+            self.proceso.terminate()
+            try:
+                self.proceso.wait(5)
+            except subprocess.TimeoutExpired:
+                self.proceso.kill()
+        if self.registro:
+            self.registro.close()
+
+
+def escenarios(symbols):
+    # Ruta -> generador de URLs relativas para cada pedido
+    catalogo = simbolos_sinteticos(2000)
+    return {
+        "/": lambda i: "/",
+        # Mitad símbolos con precio en la base, mitad que van a la API
+        "/precio_actual": lambda i: "/precio_actual?symbol="
+        + (symbols[i % len(symbols)] if i % 2 else catalogo[-1 - i % 1000]),
+        "/buscar_simbolo": lambda i: f"/buscar_simbolo?term={catalogo[i % len(catalogo)][:2]}",
+    }
+
+
+def medir(url, generar, pedidos, concurrencia, calentamiento=5):
+    """Lanza `pedidos` GET con `concurrencia` hilos y resume las latencias."""
+    with requests.Session() as sesion:
+        for i in range(calentamiento):
+            sesion.get(url + generar(i), timeout=30)
+
+    latencias = []
+    estados = {}
+    lock = threading.Lock()
+    siguiente = iter(range(pedidos))
+
+    def trabajar():
+        with requests.Session() as sesion:
+            while True:
+                with lock:
+                    i = next(siguiente, None)
+                if i is None:
+                    return
+                inicio = time.perf_counter()
+                try:
+                    estado = sesion.get(url + generar(i), timeout=30).status_code
+                except requests.exceptions.RequestException:
+                    estado = 0
+                transcurrido = time.perf_counter() - inicio
+                with lock:
+                    latencias.append(transcurrido)
+                    estados[estado] = estados.get(estado, 0) + 1
+
+    hilos = [threading.Thread(target=trabajar) for _ in range(concurrencia)]
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    duracion = time.perf_counter() - inicio
+
+    p50, p95, p99 = np.percentile(np.array(latencias) * 1000, [50, 95, 99])
+    return {
+        "p50_ms": round(float(p50), 2),
+        "p95_ms": round(float(p95), 2),
+        "p99_ms": round(float(p99), 2),
+        "req_s": round(pedidos / duracion, 1),
+        "errores": sum(n for estado, n in estados.items() if not 200 <= estado < 400),
+        "estados": {str(estado): n for estado, n in sorted(estados.items())},
+    }
+
+
+def comparar(base, actual, tolerancia=TOLERANCIA):
+    """Lista de regresiones de `actual` respecto de `base`.
+
+    Ambos son {escenario: {ruta: métricas}}; solo se comparan los que están
+    en los dos. Cuentan como regresión un p95 o p99 más de `tolerancia` por
+    encima, menos req/s en la misma proporción o errores nuevos.
+    """
+    regresiones = []
+    for escenario, rutas in actual.items():
+        for ruta, metricas in rutas.items():
+            anterior = base.get(escenario, {}).get(ruta)
+            if anterior is None:
+                continue
+            for clave in ("p95_ms", "p99_ms"):
+                if metricas[clave] > anterior[clave] * (1 + tolerancia):
+                    regresiones.append(
+                        f"{escenario} {ruta}: {clave} {anterior[clave]} -> {metricas[clave]}"
+                    )
+            if metricas["req_s"] < anterior["req_s"] * (1 - tolerancia):
+                regresiones.append(
+                    f"{escenario} {ruta}: req_s {anterior['req_s']} -> {metricas['req_s']}"
+                )
+            if metricas["errores"] > anterior["errores"]:
+                regresiones.append(
+                    f"{escenario} {ruta}: errores {anterior['errores']} -> {metricas['errores']}"
+                )
+    return regresiones
+
+
+def ejecutar(tamanos, pedidos, concurrencia, latencia=0.0, errores=0.0, limite=0.0, salida=print):
+    resultados = {}
+    stub = ServidorFMP(latencia=latencia, tasa_error=errores, tasa_limite=limite).iniciar()
+    try:
+        for filas in tamanos:
+            ruta, symbols = preparar_base(filas)
+            app = ServidorApp(ruta, stub.url_base).iniciar()
+            try:
+                escenario = resultados[f"{filas}_filas"] = {}
+                for ruta_http, generar in escenarios(symbols).items():
+                    metricas = escenario[ruta_http] = medir(app.url, generar, pedidos, concurrencia)
+                    salida(
+                        f"{filas:>7} filas {ruta_http:<16} p50 {metricas['p50_ms']:>8.2f} ms  "
+                        f"p95 {metricas['p95_ms']:>8.2f} ms  p99 {metricas['p99_ms']:>8.2f} ms  "
+                        f"{metricas['req_s']:>8.1f} req/s  errores {metricas['errores']}"
+                    )
+            finally:
+                app.detener()
+    finally:
+        stub.detener()
+    return resultados
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Mide latencias y req/s de la app contra un FMP simulado"
+    )
+    parser.add_argument("--filas", type=int, nargs="+", default=list(TAMANOS),
+                        help="tamaños de historial_compras a sembrar")
+    parser.add_argument("--pedidos", type=int, default=300, help="pedidos por ruta")
+    parser.add_argument("--concurrencia", type=int, default=8)
+    parser.add_argument("--latencia", type=float, default=0.05,
+                        help="segundos que tarda el FMP simulado")
+    parser.add_argument("--errores", type=float, default=0.0, help="proporción de 503 del FMP")
+    parser.add_argument("--limite", type=float, default=0.0, help="proporción de 429 del FMP")
+    parser.add_argument("--base", default=BASE_POR_DEFECTO, help="línea base JSON")
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA)
+    parser.add_argument("--guardar-base", action="store_true",
+                        help="guarda esta corrida como nueva línea base")
+    args = parser.parse_args(argv)
+
+    resultados = ejecutar(args.filas, args.pedidos, args.concurrencia,
+                          args.latencia, args.errores, args.limite)
+
+    if args.guardar_base:
+        with open(args.base, "w", encoding="utf-8") as archivo:
+            json.dump(resultados, archivo, indent=2, sort_keys=True)
+            archivo.write("\n")
+        print(f"Línea base guardada en {args.base}")
+        return 0
+
+    if not os.path.exists(args.base):
+        print("Sin línea base para comparar (usar --guardar-base)")
+        return 0
+    with open(args.base, encoding="utf-8") as archivo:
+        base = json.load(archivo)
+    regresiones = comparar(base, resultados, args.tolerancia)
+    for regresion in regresiones:
+        print(f"REGRESIÓN {regresion}", file=sys.stderr)
+    return 1 if regresiones else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+class Instantanea:
+    # Una consolidación ya calculada con su JSON, su ETag y los fragmentos
+    # HTML que se renderizaron a partir de ella
+    def __init__(self, datos, cuerpo, version, creada, vigencia):
+        self.datos = datos
+        self.cuerpo = cuerpo
+        self.etag = hashlib.sha256(cuerpo).hexdigest()[:32]
+        self.version = version
+        self.creada = creada
+        self.vigencia = vigencia
+        self.fragmentos = {}
+
+    def fragmento(self, clave, renderizar):
+        # renderizar(datos) se ejecuta una sola vez por instantánea y clave
+        html = self.fragmentos.get(clave)
+        if html is None:
+            html = self.fragmentos[clave] = renderizar(self.datos)
+        return html
+
+
+class CacheConsolidacion:
+    """Guarda la última consolidación calculada de cada clave mientras siga vigente.
+
+    `obtener(*clave)` devuelve la instantánea de `calcular(*clave)`; sin
+    argumentos hay una sola. Una instantánea vale mientras `version(*clave)`
+    no cambie (una huella de lo que se usó para calcularla) y como mucho
+    `vigencia` segundos. Las que `completa(datos)` rechaza, por ejemplo por
+    faltar precios, valen solo `vigencia_incompleta` segundos: se reintenta
+    pronto pero sin recalcular en cada consulta. Se conservan las
+    `capacidad` claves usadas más recientemente.
+    """
+
+    def __init__(self, calcular, serializar, version, vigencia=60, completa=None,
+                 vigencia_incompleta=10, capacidad=256):
+        self.calcular = calcular
+        self.serializar = serializar
+        self.version = version
+        self.vigencia = vigencia
+        self.completa = completa
+        self.vigencia_incompleta = vigencia_incompleta
+        self.capacidad = capacidad
+        self._instantaneas = OrderedDict()
+        self._locks = {}  # clave -> lock del cálculo en curso
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.calculos = 0
+
+    def _vigente(self, instantanea, clave):
+        return (
+            instantanea is not None
+            and time.monotonic() - instantanea.creada < instantanea.vigencia
+            and instantanea.version == self.version(*clave)
+        )
+
+    def _lock_de(self, clave):
+        with self._lock:
+            return self._locks.setdefault(clave, threading.Lock())
+
+    def obtener(self, *clave):
+        instantanea = self._instantaneas.get(clave)
+        if self._vigente(instantanea, clave):
+            self.aciertos += 1
+            return instantanea
+
+        # Un solo cálculo a la vez por clave: los demás esperan y reutilizan el
+        # resultado; claves distintas se calculan en paralelo
+        with self._lock_de(clave):
+            instantanea = self._instantaneas.get(clave)
+            if self._vigente(instantanea, clave):
+                self.aciertos += 1
+                return instantanea
+
+            # La versión se toma antes de calcular: si algo se escribe mientras
+            # tanto, la instantánea ya nace vencida
+            version = self.version(*clave)
+            datos = self.calcular(*clave)
+            completa = self.completa is None or self.completa(datos)
+            instantanea = Instantanea(
+                datos, self.serializar(datos), version, time.monotonic(),
+                self.vigencia if completa else min(self.vigencia, self.vigencia_incompleta)
+            )
+            self.calculos += 1
+            with self._lock:
+                self._instantaneas[clave] = instantanea
+                self._instantaneas.move_to_end(clave)
+                while len(self._instantaneas) > self.capacidad:
+                    vieja, _ = self._instantaneas.popitem(last=False)
+                    self._locks.pop(vieja, None)
+            return instantanea
+
+    def limpiar(self):
+        with self._lock:
+            self._instantaneas.clear()
+            self._locks.clear()
+            self.aciertos = self.calculos = 0
+
+    def estadisticas(self):
+        return {"aciertos": self.aciertos, "calculos": self.calculos}
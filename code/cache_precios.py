@@ -0,0 +1,96 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+
+class _Vuelo:
+    # Carga en curso de un símbolo que comparten todos los que lo esperan
+    def __init__(self):
+        self.evento = threading.Event()
+        self.resultado = None
+        self.error = None
+
+
+class CachePrecios:
+    """Caché LRU en memoria de precios por símbolo con vencimiento por tiempo."""
+
+    def __init__(self, duracion, capacidad=1000):
+        self.duracion = duracion
+        self.capacidad = capacidad
+        self._datos = OrderedDict()  # symbol -> (precio, fecha)
+        self._en_vuelo = {}
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+
+    def obtener(self, symbol):
+        with self._lock:
+            entrada = self._datos.get(symbol)
+            if entrada is not None:
+                precio, fecha = entrada
+                if datetime.now() - fecha < self.duracion:
+                    self._datos.move_to_end(symbol)
+                    self.aciertos += 1
+                    return precio
+                del self._datos[symbol]
+            self.fallos += 1
+            return None
+
+    def guardar(self, symbol, precio, fecha=None):
+        fecha = fecha or datetime.now()
+        if datetime.now() - fecha >= self.duracion:
+            return
+        with self._lock:
+            self._datos[symbol] = (precio, fecha)
+            self._datos.move_to_end(symbol)
+            while len(self._datos) > self.capacidad:
+                self._datos.popitem(last=False)
+                self.desalojos += 1
+
+    def obtener_o_cargar(self, symbol, cargar):
+        # cargar(symbol) devuelve (precio, fecha); si varios piden el mismo
+        # símbolo a la vez solo el primero la ejecuta y el resto espera
+        precio = self.obtener(symbol)
+        if precio is not None:
+            return precio
+
+        with self._lock:
+            vuelo = self._en_vuelo.get(symbol)
+            lider = vuelo is None
+            if lider:
+                vuelo = self._en_vuelo[symbol] = _Vuelo()
+
+        if not lider:
+            vuelo.evento.wait()
+            if vuelo.error is not None:
+                raise vuelo.error
+            return vuelo.resultado
+
+        try:
+            precio, fecha = cargar(symbol)
+            self.guardar(symbol, precio, fecha)
+            vuelo.resultado = precio
+            return precio
+        except Exception as e:
+            vuelo.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._en_vuelo[symbol]
+            vuelo.evento.set()
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+            self.aciertos = self.fallos = self.desalojos = 0
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "desalojos": self.desalojos,
+                "tamano": len(self._datos),
+                "capacidad": self.capacidad,
+            }
@@ -0,0 +1,59 @@
+from datetime import datetime
+
+# Cada compra pertenece a una cartera por cartera_id. Los índices de
+# compras y la clave de posiciones empiezan por cartera_id, así que
+# leer o agregar una cartera recorre solo sus filas. precios y el histórico
+# de cierres son de todas: un símbolo se cotiza una vez para todas las
+# carteras que lo tengan
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS carteras (
+    id INTEGER PRIMARY KEY,
+    nombre TEXT NOT NULL UNIQUE,
+    creada TEXT NOT NULL
+)
+"""
+
+# La cartera de las rutas sin prefijo y de las bases anteriores a carteras
+PRINCIPAL = 1
+NOMBRE_PRINCIPAL = "Principal"
+MAX_NOMBRE = 100
+
+
+def inicializar(conn):
+    conn.execute(ESQUEMA)
+    conn.execute(
+        "INSERT OR IGNORE INTO carteras (id, nombre, creada) VALUES (?, ?, ?)",
+        (PRINCIPAL, NOMBRE_PRINCIPAL, datetime.now().isoformat())
+    )
+
+
+def crear(conn, nombre):
+    # Debe llamarse dentro de base_datos.escritura(). Devuelve la cartera creada
+    if nombre is not None and not isinstance(nombre, str):
+        raise ValueError("El nombre de la cartera debe ser un texto")
+    nombre = (nombre or "").strip()
+    if not nombre:
+        raise ValueError("El nombre de la cartera es obligatorio")
+    if len(nombre) > MAX_NOMBRE:
+        raise ValueError(f"El nombre de la cartera no puede superar {MAX_NOMBRE} caracteres")
+    if conn.execute("SELECT 1 FROM carteras WHERE nombre = ?", (nombre,)).fetchone():
+        raise ValueError("Ya existe una cartera con ese nombre")
+    cursor = conn.execute(
+        "INSERT INTO carteras (nombre, creada) VALUES (?, ?)", (nombre, datetime.now().isoformat())
+    )
+    return {"id": cursor.lastrowid, "nombre": nombre}
+
+
+def obtener(conn, cartera_id):
+    # La principal existe siempre, aunque la base todavía no tenga la tabla
+    if cartera_id == PRINCIPAL:
+        return {"id": PRINCIPAL, "nombre": NOMBRE_PRINCIPAL}
+    fila = conn.execute("SELECT id, nombre FROM carteras WHERE id = ?", (cartera_id,)).fetchone()
+    return {"id": fila[0], "nombre": fila[1]} if fila else None
+
+
+def listar(conn):
+    return [
+        {"id": id_, "nombre": nombre}
+        for id_, nombre in conn.execute("SELECT id, nombre FROM carteras ORDER BY id")
+    ]
@@ -0,0 +1,179 @@
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metricas
+
+# FMP_URL_BASE permite apuntar a otro servidor (p. ej. stub_fmp.py)
+URL_BASE = os.getenv("FMP_URL_BASE", "https://financialmodelingprep.com/api/v3")
+
+# Códigos que suelen resolverse solos y vale la pena reintentar
+ESTADOS_TRANSITORIOS = {500, 502, 503, 504}
+
+# Cada intento cuenta por separado, reintentos incluidos
+LLAMADAS_FMP = metricas.registro.contador(
+    "fmp_llamadas_total", "Llamadas HTTP a FMP por recurso y código de estado", ("recurso", "estado")
+)
+SEGUNDOS_FMP = metricas.registro.histograma(
+    "fmp_llamadas_segundos", "Latencia de las llamadas HTTP a FMP", ("recurso",)
+)
+LIMITADAS_FMP = metricas.registro.contador(
+    "fmp_limite_total", "Respuestas 429 de FMP (cuota agotada)", ("recurso",)
+)
+
+
+class ErrorAPI(ValueError):
+    """Respuesta no exitosa de la API de Financial Modeling Prep."""
+
+    def __init__(self, mensaje, status_code=None):
+        super().__init__(mensaje)
+        self.status_code = status_code
+
+
+class LimiteSolicitudesError(ErrorAPI):
+    def __init__(self, retry_after=None):
+        super().__init__("Se ha excedido el límite de solicitudes a la API", 429)
+        self.retry_after = retry_after
+
+
+class CircuitoAbiertoError(ErrorAPI):
+    def __init__(self):
+        super().__init__("La API no está disponible temporalmente")
+
+
+class Circuito:
+    """Corta las llamadas a la API tras varios fallos seguidos.
+
+    Abierto: toda llamada falla sin salir a la red hasta que pasa `espera`.
+    Después deja pasar una sola llamada de prueba que lo cierra o lo reabre.
+    """
+
+    def __init__(self, umbral=5, espera=30):
+        self.umbral = umbral
+        self.espera = espera
+        self._fallos = 0
+        self._abierto_desde = None
+        self._probando = False
+        self._lock = threading.Lock()
+
+    @property
+    def abierto(self):
+        with self._lock:
+            return self._abierto_desde is not None
+
+    def permitir(self):
+        with self._lock:
+            if self._abierto_desde is None:
+                return
+            if self._probando or time.monotonic() - self._abierto_desde < self.espera:
+                raise CircuitoAbiertoError()
+            self._probando = True
+
+    def exito(self):
+        with self._lock:
+            self._fallos = 0
+            self._abierto_desde = None
+            self._probando = False
+
+    def fallo(self):
+        with self._lock:
+            self._fallos += 1
+            if self._probando or self._fallos >= self.umbral:
+                self._abierto_desde = time.monotonic()
+            self._probando = False
+
+    def reiniciar(self):
+        self.exito()
+
+
+class ClienteFMP:
+    """Cliente HTTP compartido para la API con conexiones persistentes."""
+
+    def __init__(self, api_key, url_base=URL_BASE, timeout=5, reintentos=2,
+                 espera_base=0.2, espera_max=2.0, max_conexiones=20, circuito=None):
+        self.api_key = api_key
+        self.url_base = url_base.rstrip("/")
+        self.timeout = timeout
+        self.reintentos = reintentos
+        self.espera_base = espera_base
+        self.espera_max = espera_max
+        self.circuito = circuito or Circuito()
+
+        self.session = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=4, pool_maxsize=max_conexiones)
+        self.session.mount("https://", adaptador)
+        self.session.mount("http://", adaptador)
+
+    def _esperar(self, intento):
+        # Backoff exponencial con jitter completo para no reintentar todos a la vez
+        time.sleep(random.uniform(0, min(self.espera_max, self.espera_base * 2 ** intento)))
+
+    def get(self, ruta, **params):
+        self.circuito.permitir()
+        params["apikey"] = self.api_key
+        url = f"{self.url_base}/{ruta.lstrip('/')}"
+        # Solo el primer tramo de la ruta: "quote/AAPL,MSFT" cuenta como "quote"
+        recurso = ruta.lstrip("/").split("/")[0]
+
+        for intento in range(self.reintentos + 1):
+            ultimo = intento == self.reintentos
+            try:
+                with metricas.cronometro(SEGUNDOS_FMP, "fmp", recurso=recurso):
+                    response = self.session.get(url, params=params, timeout=self.timeout)
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
+                LLAMADAS_FMP.sumar(recurso=recurso, estado="error")
+                if ultimo:
+                    self.circuito.fallo()
+                    raise
+                self._esperar(intento)
+                continue
+            except Exception:
+                LLAMADAS_FMP.sumar(recurso=recurso, estado="error")
+                self.circuito.fallo()
+                raise
+
+            LLAMADAS_FMP.sumar(recurso=recurso, estado=response.status_code)
+            if response.status_code in ESTADOS_TRANSITORIOS and not ultimo:
+                self._esperar(intento)
+                continue
+            break
+
+        if response.status_code == 429:
+            LIMITADAS_FMP.sumar(recurso=recurso)
+            # Es una cuota, no una falla del servicio: no abre el circuito
+            self.circuito.exito()
+            raise LimiteSolicitudesError(_segundos(response.headers.get("Retry-After")))
+        if response.status_code in ESTADOS_TRANSITORIOS:
+            self.circuito.fallo()
+        else:
+            self.circuito.exito()
+        if response.status_code != 200:
+            raise ErrorAPI(
+                f"Error al obtener datos de la API: {response.status_code}",
+                response.status_code
+            )
+        return response.json()
+
+    def cotizaciones(self, symbols):
+        return self.get(f"quote/{','.join(symbols)}")
+
+    def buscar(self, term, limite=10):
+        return self.get("search", query=term, limit=limite)
+
+    def historico(self, symbol, desde, hasta):
+        # Solo la serie de cierres: serietype=line omite el resto de columnas
+        return self.get(
+            f"historical-price-full/{symbol}",
+            serietype="line", **{"from": desde.isoformat(), "to": hasta.isoformat()}
+        )
+
+
+def _segundos(valor):
+    try:
+        return float(valor)
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,29 @@
+import pytest
+
+import base_datos
+
+HISTORIAL = """
+CREATE TABLE historial_compras (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    fecha_compra TEXT,
+    symbol TEXT,
+    cantidad_acciones INTEGER,
+    valor_compra REAL,
+    precio_actual REAL,
+    valor_total REAL,
+    valor_actual REAL,
+    ganancia_perdida REAL,
+    porcentaje REAL
+)
+"""
+
+
+@pytest.fixture
+def db(tmp_path):
+    """Fixture con historial_compras en una base temporal"""
+    ruta_original = base_datos.pool.ruta
+    base_datos.configurar(str(tmp_path / "precios.db"))
+    with base_datos.escritura() as conn:
+        conn.execute(HISTORIAL)
+    yield base_datos.pool
+    base_datos.configurar(ruta_original)
@@ -0,0 +1,79 @@
+import threading
+from collections import OrderedDict
+
+
+class Suscripcion:
+    # Cambios pendientes de un cliente: solo el último por símbolo, así un
+    # cliente lento nunca acumula más de un evento por acción
+    def __init__(self, symbols):
+        self.symbols = frozenset(symbols)
+        self._pendientes = OrderedDict()
+        self._lock = threading.Lock()
+        self._hay_datos = threading.Event()
+
+    def _agregar(self, symbol, datos):
+        with self._lock:
+            self._pendientes[symbol] = datos
+            self._pendientes.move_to_end(symbol)
+        self._hay_datos.set()
+
+    def esperar(self, timeout=None):
+        # Devuelve los cambios acumulados o [] si pasó el timeout sin novedades
+        self._hay_datos.wait(timeout)
+        with self._lock:
+            cambios = list(self._pendientes.values())
+            self._pendientes.clear()
+            self._hay_datos.clear()
+        return cambios
+
+
+class Difusor:
+    """Reparte los cambios de precio a todos los clientes suscritos.
+
+    Los precios se refrescan una sola vez por símbolo y cada cambio se copia
+    a las suscripciones que lo siguen, sin importar cuántas sean.
+    """
+
+    def __init__(self):
+        self._por_symbol = {}
+        self._ultimos = {}
+        self._lock = threading.Lock()
+
+    def suscribir(self, symbols):
+        suscripcion = Suscripcion(symbols)
+        with self._lock:
+            for symbol in suscripcion.symbols:
+                self._por_symbol.setdefault(symbol, set()).add(suscripcion)
+        return suscripcion
+
+    def cancelar(self, suscripcion):
+        with self._lock:
+            for symbol in suscripcion.symbols:
+                suscritos = self._por_symbol.get(symbol)
+                if suscritos is None:
+                    continue
+                suscritos.discard(suscripcion)
+                if not suscritos:
+                    del self._por_symbol[symbol]
+
+    def publicar(self, symbol, precio, fecha):
+        datos = {"symbol": symbol, "precio": precio, "fecha": fecha.isoformat()}
+        with self._lock:
+            # Solo se difunden cambios reales de precio
+            if self._ultimos.get(symbol, {}).get("precio") == precio:
+                self._ultimos[symbol] = datos
+                return 0
+            self._ultimos[symbol] = datos
+            suscritos = list(self._por_symbol.get(symbol, ()))
+        for suscripcion in suscritos:
+            suscripcion._agregar(symbol, datos)
+        return len(suscritos)
+
+    def simbolos(self):
+        with self._lock:
+            return set(self._por_symbol)
+
+    def estadisticas(self):
+        with self._lock:
+            clientes = set().union(*self._por_symbol.values()) if self._por_symbol else set()
+            return {"simbolos": len(self._por_symbol), "suscripciones": len(clientes)}
@@ -0,0 +1,66 @@
+import csv
+import io
+import json
+
+import base_datos
+import carteras
+import libro
+
+FORMATOS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+# Filas leídas de SQLite y escritas a la respuesta por cada vuelta
+TAMANO_BLOQUE = 1000
+
+COLUMNAS_HISTORIAL = ("id", "fecha_compra", "symbol", "cantidad_acciones", "valor_compra", "valor_total")
+COLUMNAS_CONSOLIDACION = (
+    "accion", "cantidad_total", "valor_usd_total", "precio_costo",
+    "precio_actual", "ganancia_perdida", "porcentaje"
+)
+
+
+def filas_historial(tamano_bloque=TAMANO_BLOQUE, cartera_id=carteras.PRINCIPAL):
+    # Un bloque por consulta desde el último id: nunca hay más de un bloque
+    # en memoria y la conexión vuelve al pool antes de entregar filas, así
+    # que un cliente lento no retiene una lectura abierta
+    ultimo = 0
+    while True:
+        with base_datos.conexion() as conn:
+            bloque = conn.execute(
+                "SELECT id, dia, symbol, cantidad, precio_micros FROM compras "
+                "WHERE cartera_id = ? AND id > ? ORDER BY id LIMIT ?",
+                (cartera_id, ultimo, tamano_bloque)
+            ).fetchall()
+        if not bloque:
+            return
+        ultimo = bloque[-1][0]
+        for fila in bloque:
+            yield libro.fila(*fila)
+
+
+def serializar(filas, columnas, formato, tamano_bloque=TAMANO_BLOQUE):
+    """Convierte un iterable de dicts en trozos de texto CSV o NDJSON."""
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato no soportado: {formato}")
+
+    buffer = io.StringIO()
+    if formato == "csv":
+        escritor = csv.DictWriter(buffer, fieldnames=columnas, extrasaction="ignore")
+        escritor.writeheader()
+        escribir = escritor.writerow
+    else:
+        def escribir(fila):
+            buffer.write(json.dumps({c: fila[c] for c in columnas}, default=str))
+            buffer.write("\n")
+
+    pendientes = 0
+    for fila in filas:
+        escribir(fila)
+        pendientes += 1
+        if pendientes >= tamano_bloque:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pendientes = 0
+
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -0,0 +1,140 @@
+import base64
+import json
+from datetime import datetime
+
+import carteras
+import libro
+import migraciones
+
+# Columnas por las que se permite ordenar y su expresión sobre compras
+# (nunca se interpola otra cosa en el SQL). Los índices de libro.ESQUEMA
+# cubren el orden por fecha, con o sin símbolo; libro.INDICES_ORDEN, los demás
+COLUMNAS_ORDEN = {
+    "fecha_compra": "dia",
+    "symbol": "symbol",
+    "cantidad_acciones": "cantidad",
+    "valor_compra": "precio_micros",
+    "valor_total": "cantidad * precio_micros",
+}
+# Las que pueden ser NULL (una fecha que no se pudo leer al migrar)
+COLUMNAS_NULAS = ("fecha_compra",)
+DIRECCIONES = ("asc", "desc")
+LIMITE_POR_DEFECTO = 50
+LIMITE_MAXIMO = 500
+
+
+def inicializar(conn):
+    migraciones.aplicar(conn)
+    carteras.inicializar(conn)
+
+
+def _validar_fecha(valor):
+    if not valor:
+        return None
+    try:
+        return datetime.strptime(valor, '%Y-%m-%d').strftime('%Y-%m-%d')
+    except ValueError:
+        raise ValueError("Fecha inválida")
+
+
+def codificar_cursor(ordenar_por, direccion, valor, id_):
+    # valor es el de la columna en compras (el día, los micros), no el que se muestra
+    datos = json.dumps([ordenar_por, direccion, valor, id_]).encode()
+    return base64.urlsafe_b64encode(datos).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor, ordenar_por, direccion):
+    try:
+        relleno = "=" * (-len(cursor) % 4)
+        orden, sentido, valor, id_ = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+    except (ValueError, TypeError):
+        raise ValueError("Cursor inválido")
+    # Un cursor solo vale para el orden con el que se generó
+    if (orden, sentido) != (ordenar_por, direccion) or not isinstance(id_, int):
+        raise ValueError("Cursor inválido")
+    return valor, id_
+
+
+def consultar_historial(conn, ordenar_por="fecha_compra", direccion="asc", fecha_inicio=None,
+                        fecha_fin=None, symbol=None, cursor=None, limite=LIMITE_POR_DEFECTO,
+                        cartera_id=carteras.PRINCIPAL):
+    """Página de compras con orden, filtros y paginación por cursor.
+
+    La página siguiente continúa desde (columna, id) de la última fila, así
+    que cuesta lo mismo que la primera sin importar la profundidad. El orden
+    es (columna IS NULL, columna, id): las filas sin valor van al final en
+    orden ascendente y al principio en descendente, cada tramo con su propia
+    consulta por índice.
+    """
+    ordenar_por = ordenar_por or "fecha_compra"
+    direccion = (direccion or "asc").lower()
+    if ordenar_por not in COLUMNAS_ORDEN:
+        raise ValueError(f"No se puede ordenar por {ordenar_por}")
+    if direccion not in DIRECCIONES:
+        raise ValueError("Dirección de ordenamiento inválida")
+    try:
+        limite = max(1, min(int(limite or LIMITE_POR_DEFECTO), LIMITE_MAXIMO))
+    except (TypeError, ValueError):
+        raise ValueError("Límite inválido")
+
+    orden = COLUMNAS_ORDEN[ordenar_por]
+    condiciones = ["cartera_id = ?"]
+    parametros = [cartera_id]
+    fecha_inicio = _validar_fecha(fecha_inicio)
+    fecha_fin = _validar_fecha(fecha_fin)
+    if fecha_inicio and fecha_fin and fecha_inicio > fecha_fin:
+        raise ValueError("La fecha de inicio no puede ser posterior a la fecha final")
+    if fecha_inicio:
+        condiciones.append("dia >= ?")
+        parametros.append(libro.a_dia(fecha_inicio))
+    if fecha_fin:
+        condiciones.append("dia <= ?")
+        parametros.append(libro.a_dia(fecha_fin))
+    if symbol:
+        condiciones.append("symbol = ?")
+        parametros.append(symbol.strip().upper())
+
+    # Tramos en el orden en que se recorren: con valor y sin valor. Una
+    # compra sin fecha no entra en un filtro por fechas
+    nulas = ordenar_por in COLUMNAS_NULAS and not (fecha_inicio or fecha_fin)
+    tramos = [False, True] if nulas else [False]
+    if direccion == "desc":
+        tramos.reverse()
+    desde = None
+    if cursor:
+        desde = decodificar_cursor(cursor, ordenar_por, direccion)
+        if (desde[0] is None) not in tramos:
+            raise ValueError("Cursor inválido")
+        tramos = tramos[tramos.index(desde[0] is None):]
+
+    operador = ">" if direccion == "asc" else "<"
+    filas = []
+    for nulo in tramos:
+        tramo, valores = [f"{orden} IS NULL" if nulo else f"{orden} IS NOT NULL"], []
+        if desde is not None and nulo == (desde[0] is None):
+            # Solo en el tramo del cursor; el siguiente empieza de cero
+            if nulo:
+                tramo.append(f"id {operador} ?")
+                valores.append(desde[1])
+            else:
+                tramo.append(f"({orden}, id) {operador} (?, ?)")
+                valores.extend(desde)
+        query = f"""
+        SELECT id, dia, symbol, cantidad, precio_micros, {orden}
+        FROM compras
+        WHERE {" AND ".join(condiciones + tramo)}
+        ORDER BY {orden} {direccion}, id {direccion}
+        LIMIT ?
+        """
+        # Se pide una fila de más para saber si hay página siguiente
+        filas += conn.execute(query, parametros + valores + [limite + 1 - len(filas)]).fetchall()
+        if len(filas) > limite:
+            break
+
+    compras = [libro.fila(*fila[:5]) for fila in filas[:limite]]
+    siguiente = None
+    if len(filas) > limite:
+        ultima = filas[limite - 1]
+        siguiente = codificar_cursor(ordenar_por, direccion, ultima[5], ultima[0])
+
+    return {"compras": compras, "siguiente": siguiente}
@@ -0,0 +1,240 @@
+import argparse
+import sys
+import zlib
+from datetime import date, timedelta
+
+import numpy as np
+
+import base_datos
+
+# Un cierre por símbolo y día. WITHOUT ROWID guarda cada fila dentro del
+# índice de la clave primaria, ordenada por (simbolo_id, dia) y sin rowid
+# aparte. El símbolo va como entero, el día como días desde 1970 y el cierre
+# en diezmilésimas de dólar: cada fila ocupa unos 15 bytes en disco
+ESQUEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS simbolos_historico (
+        id INTEGER PRIMARY KEY,
+        symbol TEXT NOT NULL UNIQUE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS precios_diarios (
+        simbolo_id INTEGER NOT NULL,
+        dia INTEGER NOT NULL,
+        cierre INTEGER NOT NULL,
+        PRIMARY KEY (simbolo_id, dia)
+    ) WITHOUT ROWID
+    """,
+    # Cada guardado anota el primer día que tocó: quien deriva datos de los
+    # cierres (la serie de la cartera) recalcula solo desde ahí
+    """
+    CREATE TABLE IF NOT EXISTS precios_diarios_cambios (
+        id INTEGER PRIMARY KEY,
+        dia INTEGER NOT NULL
+    )
+    """,
+)
+
+ESCALA = 10 ** 4
+EPOCA = date(1970, 1, 1)
+ANIOS_POR_DEFECTO = 20
+
+
+def inicializar(conn):
+    for sentencia in ESQUEMA:
+        conn.execute(sentencia)
+
+
+def a_dia(fecha):
+    return (fecha - EPOCA).days
+
+
+def a_fecha(dia):
+    return EPOCA + timedelta(days=dia)
+
+
+def _simbolo_id(conn, symbol):
+    conn.execute("INSERT OR IGNORE INTO simbolos_historico (symbol) VALUES (?)", (symbol,))
+    return conn.execute(
+        "SELECT id FROM simbolos_historico WHERE symbol = ?", (symbol,)
+    ).fetchone()[0]
+
+
+def guardar(conn, symbol, cierres):
+    # Debe llamarse dentro de base_datos.escritura(). cierres: [(date, precio)]
+    if not cierres:
+        return 0
+    simbolo_id = _simbolo_id(conn, symbol)
+    filas = [(simbolo_id, a_dia(fecha), round(precio * ESCALA)) for fecha, precio in cierres]
+    conn.executemany(
+        "REPLACE INTO precios_diarios (simbolo_id, dia, cierre) VALUES (?, ?, ?)", filas
+    )
+    conn.execute(
+        "INSERT INTO precios_diarios_cambios (dia) VALUES (?)", (min(f[1] for f in filas),)
+    )
+    return len(filas)
+
+
+def ultima_fecha(conn, symbol):
+    # Dos búsquedas en índices: el id por el UNIQUE de symbol y después el
+    # MAX sobre la clave primaria (simbolo_id, dia)
+    simbolo = conn.execute(
+        "SELECT id FROM simbolos_historico WHERE symbol = ?", (symbol,)
+    ).fetchone()
+    if simbolo is None:
+        return None
+    dia = conn.execute(
+        "SELECT MAX(dia) FROM precios_diarios WHERE simbolo_id = ?", simbolo
+    ).fetchone()[0]
+    return a_fecha(dia) if dia is not None else None
+
+
+def leer(conn, symbols, desde=None, hasta=None):
+    """Cierres de varios símbolos entre dos fechas (inclusive) en una consulta.
+
+    Devuelve {symbol: (fechas, cierres)} con arreglos NumPy datetime64[D] y
+    float64, ordenados por fecha. Los símbolos sin datos no aparecen.
+    """
+    symbols = list(dict.fromkeys(symbols))
+    if not symbols:
+        return {}
+    placeholders = ",".join("?" * len(symbols))
+    filas = conn.execute(
+        f"""
+        SELECT s.symbol, d.dia, d.cierre
+        FROM simbolos_historico s
+        JOIN precios_diarios d ON d.simbolo_id = s.id
+        WHERE s.symbol IN ({placeholders}) AND d.dia BETWEEN ? AND ?
+        ORDER BY s.symbol, d.dia
+        """,
+        [*symbols, a_dia(desde) if desde else 0, a_dia(hasta) if hasta else 2 ** 31]
+    ).fetchall()
+    if not filas:
+        return {}
+
+    nombres, dias, cierres = zip(*filas)
+    dias = np.array(dias, dtype="datetime64[D]")
+    cierres = np.array(cierres, dtype=np.float64) / ESCALA
+    # Las filas vienen agrupadas por símbolo: se corta en cada cambio
+    cortes = [0] + [i for i in range(1, len(nombres)) if nombres[i] != nombres[i - 1]] + [len(nombres)]
+    return {
+        nombres[inicio]: (dias[inicio:fin], cierres[inicio:fin])
+        for inicio, fin in zip(cortes, cortes[1:])
+    }
+
+
+class ProveedorFMP:
+    """Cierres diarios desde /historical-price-full de Financial Modeling Prep."""
+
+    def __init__(self, cliente):
+        self.cliente = cliente
+
+    def cierres(self, symbol, desde, hasta):
+        datos = self.cliente.historico(symbol, desde, hasta)
+        historico = datos.get("historical", []) if isinstance(datos, dict) else []
+        return sorted(
+            (date.fromisoformat(item["date"]), float(item["close"]))
+            for item in historico
+            if item.get("date") and item.get("close") is not None
+        )
+
+
+class ProveedorSimulado:
+    """Cierres inventados pero estables para trabajar y probar sin conexión.
+
+    Cada símbolo sigue un paseo aleatorio en días hábiles desde `origen`,
+    con semilla derivada del símbolo: el mismo día siempre da el mismo precio
+    sin importar el rango pedido.
+    """
+
+    def __init__(self, semilla=0, origen=date(2000, 1, 3), precio_inicial=100.0):
+        self.semilla = semilla
+        self.origen = origen
+        self.precio_inicial = precio_inicial
+        self.llamadas = 0
+
+    def cierres(self, symbol, desde, hasta):
+        self.llamadas += 1
+        if hasta < self.origen:
+            return []
+        dias = np.arange(np.datetime64(self.origen), np.datetime64(hasta) + 1)
+        dias = dias[np.is_busday(dias)]
+        azar = np.random.default_rng(zlib.crc32(symbol.encode()) ^ self.semilla)
+        precios = self.precio_inicial * np.exp(np.cumsum(azar.normal(0.0003, 0.015, len(dias))))
+        elegidos = dias >= np.datetime64(desde)
+        return [
+            (fecha, round(precio, 2))
+            for fecha, precio in zip(dias[elegidos].tolist(), precios[elegidos].tolist())
+        ]
+
+
+def actualizar(proveedor, symbols, hasta=None, anios=ANIOS_POR_DEFECTO):
+    """Trae los cierres que faltan de cada símbolo y los guarda.
+
+    Un símbolo sin datos se completa `anios` hacia atrás; uno con datos solo
+    pide los días posteriores al último guardado. Devuelve
+    {"guardados": filas, "errores": {symbol: mensaje}}.
+    """
+    hasta = hasta or date.today()
+    resultado = {"guardados": 0, "errores": {}}
+    for symbol in dict.fromkeys(symbols):
+        with base_datos.conexion() as conn:
+            ultima = ultima_fecha(conn, symbol)
+        desde = ultima + timedelta(days=1) if ultima else hasta - timedelta(days=365 * anios)
+        if desde > hasta:
+            continue
+
+        # La API se consulta fuera de la transacción
+        try:
+            cierres = [(f, p) for f, p in proveedor.cierres(symbol, desde, hasta) if desde <= f <= hasta]
+        except Exception as e:
+            resultado["errores"][symbol] = str(e)
+            continue
+        if cierres:
+            with base_datos.escritura() as conn:
+                resultado["guardados"] += guardar(conn, symbol, cierres)
+    return resultado
+
+
+def simbolos_en_cartera(conn):
+    # De todas las carteras: los cierres se guardan una vez por símbolo
+    return [
+        symbol for symbol, in
+        conn.execute("SELECT DISTINCT symbol FROM posiciones WHERE cantidad_total > 0 ORDER BY symbol")
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Completa el histórico de cierres diarios")
+    parser.add_argument("symbols", nargs="*",
+                        help="por defecto, las acciones en cartera")
+    parser.add_argument("--anios", type=int, default=ANIOS_POR_DEFECTO,
+                        help="años hacia atrás para los símbolos sin datos")
+    parser.add_argument("--simulado", action="store_true",
+                        help="usa precios inventados en lugar de la API")
+    args = parser.parse_args(argv)
+
+    with base_datos.escritura() as conn:
+        inicializar(conn)
+        symbols = [s.upper() for s in args.symbols] or simbolos_en_cartera(conn)
+
+    if args.simulado:
+        proveedor = ProveedorSimulado()
+    else:
+        # Importación tardía: la API solo hace falta con el proveedor real
+        import os
+        from dotenv import load_dotenv
+        from cliente_fmp import ClienteFMP
+        load_dotenv()
+        proveedor = ProveedorFMP(ClienteFMP(os.getenv("FINANCIAL_MODELING_API_KEY")))
+
+    resultado = actualizar(proveedor, symbols, anios=args.anios)
+    for symbol, error in resultado["errores"].items():
+        print(f"{symbol}: {error}", file=sys.stderr)
+    print(f"{resultado['guardados']} cierre(s) guardado(s) para {len(symbols)} símbolo(s)")
+    return 1 if resultado["errores"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+import argparse
+import csv
+import io
+import json
+import sqlite3
+import sys
+
+import base_datos
+import carteras
+import historial
+import posiciones
+from validaciones import validar_compra
+
+# Filas por transacción y máximo de errores que se devuelven en detalle
+TAMANO_LOTE = 1000
+MAX_ERRORES = 1000
+
+FORMATOS = ("csv", "ndjson")
+
+
+def leer_csv(archivo):
+    # Recorre el archivo de a una fila; la fila 1 es la cabecera
+    for numero, fila in enumerate(csv.DictReader(archivo), start=2):
+        yield numero, fila
+
+
+def leer_ndjson(archivo):
+    for numero, linea in enumerate(archivo, start=1):
+        if not linea.strip():
+            continue
+        try:
+            fila = json.loads(linea)
+        except json.JSONDecodeError:
+            yield numero, None
+            continue
+        yield numero, fila if isinstance(fila, dict) else None
+
+
+def formato_de(nombre):
+    nombre = (nombre or "").lower()
+    if nombre.endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    return "csv"
+
+
+def importar(archivo, formato="csv", tamano_lote=TAMANO_LOTE, cartera_id=carteras.PRINCIPAL):
+    """Importa compras a historial_compras desde un archivo de texto abierto.
+
+    Las filas inválidas se informan y se saltan; las válidas se guardan en
+    transacciones de `tamano_lote` filas.
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato no soportado: {formato}")
+    filas = leer_ndjson(archivo) if formato == "ndjson" else leer_csv(archivo)
+
+    resultado = {"importadas": 0, "rechazadas": 0, "errores": []}
+    lote, numeros = [], []
+
+    def rechazar(numero, error):
+        resultado["rechazadas"] += 1
+        if len(resultado["errores"]) < MAX_ERRORES:
+            resultado["errores"].append({"fila": numero, "error": error})
+
+    def guardar():
+        try:
+            with base_datos.escritura() as conn:
+                posiciones.registrar_compras(conn, lote, cartera_id)
+            resultado["importadas"] += len(lote)
+        except (ValueError, OverflowError, sqlite3.IntegrityError):
+            # Una fila que la base no acepta no tira el lote entero: se
+            # guardan de a una y se informa solo la que falla
+            for numero, compra in zip(numeros, lote):
+                try:
+                    with base_datos.escritura() as conn:
+                        posiciones.registrar_compras(conn, [compra], cartera_id)
+                    resultado["importadas"] += 1
+                except (ValueError, OverflowError, sqlite3.IntegrityError) as e:
+                    rechazar(numero, f"No se pudo guardar: {str(e)}")
+        lote.clear()
+        numeros.clear()
+
+    for numero, fila in filas:
+        try:
+            if fila is None:
+                raise ValueError("Fila con formato inválido")
+            compra = validar_compra(fila)
+        except (ValueError, TypeError, AttributeError, OverflowError) as e:
+            # Los validadores rechazan con ValueError; lo demás es un valor de
+            # un tipo inesperado en la fila, que tampoco corta la importación
+            rechazar(numero, str(e) if isinstance(e, ValueError) else "Fila con valores inválidos")
+            continue
+        lote.append(compra)
+        numeros.append(numero)
+
+        if len(lote) >= tamano_lote:
+            guardar()
+
+    if lote:
+        guardar()
+    return resultado
+
+
+def importar_subida(archivo_subido, formato=None, cartera_id=carteras.PRINCIPAL):
+    # archivo_subido: FileStorage de Flask; se lee en streaming sin cargarlo entero
+    formato = formato or formato_de(archivo_subido.filename)
+    texto = io.TextIOWrapper(archivo_subido.stream, encoding="utf-8-sig", newline="")
+    return importar(texto, formato, cartera_id=cartera_id)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Importa compras a historial_compras")
+    parser.add_argument("archivo", help="archivo CSV o NDJSON ('-' para stdin)")
+    parser.add_argument("--formato", choices=FORMATOS,
+                        help="por defecto se deduce de la extensión")
+    parser.add_argument("--lote", type=int, default=TAMANO_LOTE,
+                        help="filas por transacción")
+    parser.add_argument("--cartera", type=int, default=carteras.PRINCIPAL,
+                        help="id de la cartera a la que van las compras")
+    args = parser.parse_args(argv)
+
+    formato = args.formato or formato_de(args.archivo)
+    with base_datos.escritura() as conn:
+        posiciones.inicializar(conn)
+        historial.inicializar(conn)
+        if carteras.obtener(conn, args.cartera) is None:
+            print(f"No existe la cartera {args.cartera}", file=sys.stderr)
+            return 2
+
+    if args.archivo == "-":
+        resultado = importar(sys.stdin, formato, args.lote, args.cartera)
+    else:
+        with open(args.archivo, encoding="utf-8-sig", newline="") as archivo:
+            resultado = importar(archivo, formato, args.lote, args.cartera)
+
+    for error in resultado["errores"]:
+        print(f"Fila {error['fila']}: {error['error']}", file=sys.stderr)
+    print(f"{resultado['importadas']} compra(s) importada(s), "
+          f"{resultado['rechazadas']} rechazada(s)")
+    return 1 if resultado["rechazadas"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
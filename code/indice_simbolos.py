@@ -0,0 +1,123 @@
+import json
+import re
+import threading
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from itertools import islice
+
+# Prioridad de cada tipo de clave al ordenar las sugerencias
+SIMBOLO, NOMBRE, PALABRA = 0, 1, 2
+
+
+class IndiceSimbolos:
+    """Catálogo local de símbolos para autocompletar sin llamar a la API.
+
+    Las claves se guardan en una lista ordenada por prioridad: símbolos,
+    nombres completos y cada palabra del nombre. Una búsqueda por prefijo es
+    un bisect en cada lista, en ese orden, más el recorrido del rango que
+    coincide hasta juntar `limite` símbolos: un símbolo que empieza con el
+    término no queda afuera por nombres que van antes en orden alfabético.
+    Las listas no se modifican: agregar() arma otras y las reemplaza, así
+    que una búsqueda las recorre sin el lock.
+    """
+
+    def __init__(self, max_remotos=1000):
+        self._claves = ([], [], [])  # por prioridad: (clave, symbol) ordenadas
+        self._nombres = {}
+        self._remotos = OrderedDict()  # términos ya respondidos por la API
+        self.max_remotos = max_remotos
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._nombres)
+
+    @staticmethod
+    def _claves_de(symbol, nombre):
+        nombre = nombre.upper()
+        claves = [(symbol, SIMBOLO, symbol), (nombre, NOMBRE, symbol)]
+        for palabra in re.findall(r"[A-Z0-9]+", nombre)[1:]:
+            claves.append((palabra, PALABRA, symbol))
+        return claves
+
+    @staticmethod
+    def _validos(items):
+        for item in items:
+            if item.get("symbol") and item.get("name"):
+                yield item["symbol"].upper(), item["name"]
+
+    def cargar(self, items):
+        # Reemplaza el catálogo completo (p. ej. la lista de la API o un archivo)
+        nombres = dict(self._validos(items))
+        claves = ([], [], [])
+        for clave, prioridad, symbol in (c for s, n in nombres.items() for c in self._claves_de(s, n)):
+            claves[prioridad].append((clave, symbol))
+        for lista in claves:
+            lista.sort()
+        with self._lock:
+            self._nombres = nombres
+            self._claves = claves
+            self._remotos.clear()
+
+    def cargar_archivo(self, ruta):
+        with open(ruta, encoding="utf-8") as archivo:
+            self.cargar(json.load(archivo))
+
+    def agregar(self, items):
+        with self._lock:
+            claves = tuple(list(lista) for lista in self._claves)
+            for symbol, nombre in self._validos(items):
+                if symbol in self._nombres:
+                    continue
+                self._nombres[symbol] = nombre
+                for clave, prioridad, _ in self._claves_de(symbol, nombre):
+                    insort(claves[prioridad], (clave, symbol))
+            self._claves = claves
+
+    def recordar(self, term, items):
+        # Guarda la respuesta de la API para un término que no estaba en el índice
+        self.agregar(items)
+        with self._lock:
+            self._remotos[term] = [s for s, _ in self._validos(items)]
+            self._remotos.move_to_end(term)
+            while len(self._remotos) > self.max_remotos:
+                self._remotos.popitem(last=False)
+
+    @staticmethod
+    def _coincidencias(claves, term):
+        # Los símbolos del rango del prefijo, sin repetir: primero los de
+        # clave símbolo, después nombre y después palabra
+        vistos = set()
+        for prioridad, lista in enumerate(claves):
+            for i in range(bisect_left(lista, (term,)), len(lista)):
+                clave, symbol = lista[i]
+                if not clave.startswith(term):
+                    break
+                if symbol not in vistos:
+                    vistos.add(symbol)
+                    yield symbol, prioridad
+
+    def buscar(self, term, limite=10):
+        # Devuelve None si el término no tiene coincidencias locales
+        term = term.upper()
+        with self._lock:
+            claves, nombres = self._claves, self._nombres
+            remotos = self._remotos.get(term)
+
+        candidatos = dict(islice(self._coincidencias(claves, term), limite))
+        if candidatos:
+            orden = sorted(candidatos, key=lambda s: (s != term, candidatos[s], len(s), s))
+        elif remotos is not None:
+            orden = remotos
+        else:
+            return None
+
+        return [
+            {"symbol": s, "nombre": f"{nombres[s]} ({s})"}
+            for s in orden[:limite]
+        ]
+
+    def limpiar(self):
+        with self._lock:
+            self._claves = ([], [], [])
+            self._nombres = {}
+            self._remotos.clear()
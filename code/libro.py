@@ -0,0 +1,120 @@
+from datetime import date
+
+import carteras
+import historico
+
+# Libro de compras. Solo se guarda lo que ingresó el usuario: el día como
+# días desde 1970 (como en precios_diarios), el precio unitario en
+# millonésimas de dólar y la cantidad, todo entero. El total es
+# cantidad * precio_micros y el valor actual sale de los precios del día,
+# así que nada guardado queda viejo cuando cambian los precios
+ESCALA = 10 ** 6
+
+# Los índices llevan todas las columnas que leen la consolidación, el
+# historial y la serie de rendimiento: esas consultas no visitan la tabla.
+# El id va justo después del día para que el orden (día, id) del historial
+# salga del índice sin ordenar aparte
+ESQUEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS compras (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        cartera_id INTEGER NOT NULL,
+        dia INTEGER,
+        symbol TEXT NOT NULL,
+        cantidad INTEGER NOT NULL,
+        precio_micros INTEGER NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_compras_cartera ON compras (cartera_id)",
+    "CREATE INDEX IF NOT EXISTS idx_compras_cartera_dia "
+    "ON compras (cartera_id, dia, id, symbol, cantidad, precio_micros)",
+    "CREATE INDEX IF NOT EXISTS idx_compras_cartera_symbol_dia "
+    "ON compras (cartera_id, symbol, dia, id, cantidad, precio_micros)",
+)
+
+# Los demás órdenes del historial (ver historial.COLUMNAS_ORDEN), por
+# (cartera_id, columna, id) como los recorre la paginación por cursor: una
+# página lee solo sus filas en lugar de ordenar la cartera entera. No son de
+# cobertura para no multiplicar el espacio: son pocas filas por página
+INDICES_ORDEN = (
+    "CREATE INDEX IF NOT EXISTS idx_compras_cartera_symbol_id ON compras (cartera_id, symbol, id)",
+    "CREATE INDEX IF NOT EXISTS idx_compras_cartera_cantidad ON compras (cartera_id, cantidad, id)",
+    "CREATE INDEX IF NOT EXISTS idx_compras_cartera_precio ON compras (cartera_id, precio_micros, id)",
+    "CREATE INDEX IF NOT EXISTS idx_compras_cartera_total "
+    "ON compras (cartera_id, cantidad * precio_micros, id)",
+)
+
+# Un texto 'AAAA-MM-DD' (o con hora) como días desde 1970, en SQL
+DIA_SQL = "CAST(julianday(date({})) - 2440587.5 AS INTEGER)"
+
+COLUMNAS = ("id", "cartera_id", "dia", "symbol", "cantidad", "precio_micros")
+# Las de historial_compras que tienen equivalente en compras
+COLUMNAS_ANTERIORES = (
+    "id", "cartera_id", "fecha_compra", "symbol", "cantidad_acciones", "valor_compra", "valor_total"
+)
+
+
+def conversion(columnas, prefijo=""):
+    """Expresiones SQL que llevan una fila de historial_compras a COLUMNAS.
+
+    `columnas` son las que tiene la tabla (una base anterior a las carteras
+    no tiene cartera_id); `prefijo` es "NEW." dentro de un disparador. El
+    precio sale de valor_compra o, si falta, de valor_total / cantidad.
+    """
+    def columna(nombre, sino="NULL"):
+        return f"{prefijo}{nombre}" if nombre in columnas else sino
+
+    cantidad = columna("cantidad_acciones")
+    precio = f"{columna('valor_total')} * 1.0 / {cantidad}"
+    return (
+        columna("id"),
+        f"COALESCE({columna('cartera_id')}, {carteras.PRINCIPAL})",
+        DIA_SQL.format(columna("fecha_compra")),
+        f"COALESCE({columna('symbol')}, '')",
+        f"COALESCE({cantidad}, 0)",
+        f"CAST(ROUND(COALESCE({columna('valor_compra')}, {precio}, 0) * {ESCALA}) AS INTEGER)",
+    )
+
+
+# historial_compras con las columnas de siempre para quien todavía la lea o
+# escriba (otras herramientas, un trabajador con la versión anterior durante
+# una recarga). Las consultas de la aplicación van directo a compras
+VISTA = (
+    f"""
+    CREATE VIEW IF NOT EXISTS historial_compras AS
+    SELECT id, cartera_id, date(dia * 86400, 'unixepoch') AS fecha_compra, symbol,
+           cantidad AS cantidad_acciones,
+           precio_micros * 1.0 / {ESCALA} AS valor_compra,
+           cantidad * precio_micros * 1.0 / {ESCALA} AS valor_total
+    FROM compras
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS historial_compras_insertar
+    INSTEAD OF INSERT ON historial_compras
+    BEGIN
+        INSERT INTO compras ({", ".join(COLUMNAS)})
+        VALUES ({", ".join(conversion(COLUMNAS_ANTERIORES, "NEW."))});
+    END
+    """,
+)
+
+
+def a_dia(fecha):
+    # 'AAAA-MM-DD' (o None) como se guarda en compras
+    return historico.a_dia(date.fromisoformat(fecha)) if fecha else None
+
+
+def a_micros(valor):
+    return round(valor * ESCALA)
+
+
+def fila(id_, dia, symbol, cantidad, precio_micros):
+    # Una compra con los nombres y unidades que muestran la API y las exportaciones
+    return {
+        "id": id_,
+        "fecha_compra": None if dia is None else historico.a_fecha(dia).isoformat(),
+        "symbol": symbol,
+        "cantidad_acciones": cantidad,
+        "valor_compra": precio_micros / ESCALA,
+        "valor_total": cantidad * precio_micros / ESCALA,
+    }
@@ -0,0 +1,147 @@
+import libro
+
+METODOS = ("fifo", "lifo", "promedio")
+
+# Lotes abiertos: lo que queda de cada compra. WITHOUT ROWID los guarda
+# ordenados por (cartera_id, symbol, fecha, compra_id), así que los de un
+# símbolo son un tramo contiguo que se lee desde el más viejo (FIFO) o desde
+# el más nuevo (LIFO); los lotes agotados se borran, de modo que vender
+# recorre solo los lotes que consume
+ESQUEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS lotes (
+        cartera_id INTEGER NOT NULL,
+        symbol TEXT NOT NULL,
+        fecha TEXT NOT NULL,
+        compra_id INTEGER NOT NULL,
+        cantidad INTEGER NOT NULL,
+        costo_unitario REAL NOT NULL,
+        PRIMARY KEY (cartera_id, symbol, fecha, compra_id)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS historial_ventas (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        cartera_id INTEGER NOT NULL,
+        fecha_venta TEXT NOT NULL,
+        symbol TEXT NOT NULL,
+        cantidad INTEGER NOT NULL,
+        precio_venta REAL NOT NULL,
+        metodo TEXT NOT NULL,
+        costo REAL NOT NULL,
+        ganancia REAL NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_ventas_cartera ON historial_ventas (cartera_id)",
+    "CREATE INDEX IF NOT EXISTS idx_ventas_cartera_fecha ON historial_ventas (cartera_id, fecha_venta)",
+)
+
+# Lotes de las compras con id mayor a ? (las que se acaban de guardar)
+ABRIR_LOTES = f"""
+INSERT INTO lotes (cartera_id, symbol, fecha, compra_id, cantidad, costo_unitario)
+SELECT cartera_id, symbol, COALESCE(date(dia * 86400, 'unixepoch'), ''), id, cantidad,
+       precio_micros * 1.0 / {libro.ESCALA}
+FROM compras
+WHERE id > ? AND cantidad > 0
+"""
+
+
+def inicializar(conn):
+    # La primera vez cada compra del historial es un lote entero: todavía no
+    # hay ventas que los hayan consumido
+    existia = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'lotes'"
+    ).fetchone()
+    for sentencia in ESQUEMA:
+        conn.execute(sentencia)
+    if not existia:
+        conn.execute(ABRIR_LOTES, (0,))
+
+
+def ultima_compra(conn):
+    return conn.execute("SELECT MAX(id) FROM compras").fetchone()[0] or 0
+
+
+def abrir(conn, desde_compra):
+    # Un lote por cada compra guardada después de `desde_compra`
+    conn.execute(ABRIR_LOTES, (desde_compra,))
+
+
+def _a_consumir(conn, cartera_id, symbol, cantidad, fecha, metodo):
+    # Lee lotes en el orden del método solo hasta cubrir `cantidad`; los que
+    # se compraron después de la venta no cuentan
+    orden = "DESC" if metodo == "lifo" else "ASC"
+    cursor = conn.execute(
+        f"""
+        SELECT fecha, compra_id, cantidad, costo_unitario FROM lotes
+        WHERE cartera_id = ? AND symbol = ? AND fecha <= ?
+        ORDER BY fecha {orden}, compra_id {orden}
+        """,
+        (cartera_id, symbol, fecha)
+    )
+    consumidos = []
+    restante = cantidad
+    try:
+        for lote_fecha, compra_id, disponible, costo_unitario in cursor:
+            tomada = min(disponible, restante)
+            consumidos.append((lote_fecha, compra_id, disponible - tomada, tomada, costo_unitario))
+            restante -= tomada
+            if not restante:
+                break
+    finally:
+        cursor.close()
+    if restante:
+        raise ValueError(
+            f"No hay {cantidad} acciones de {symbol} compradas hasta el {fecha} para vender"
+        )
+    return consumidos
+
+
+def consumir(conn, cartera_id, symbol, cantidad, fecha, metodo):
+    """Descuenta `cantidad` acciones de los lotes abiertos del símbolo.
+
+    Debe llamarse dentro de base_datos.escritura(). Con "fifo" se consumen
+    primero los lotes más viejos y con "lifo" los más nuevos; devuelve el
+    costo de lo consumido. Con "promedio" las cantidades salen de los lotes
+    más viejos y el costo lo calcula quien llama con el precio promedio de
+    la posición, así que se devuelve None; después hay que repreciar() los
+    lotes que quedan.
+    """
+    if metodo not in METODOS:
+        raise ValueError(f"Método no soportado: {metodo}")
+    consumidos = _a_consumir(
+        conn, cartera_id, symbol, cantidad, fecha, "lifo" if metodo == "lifo" else "fifo"
+    )
+    conn.executemany(
+        "DELETE FROM lotes WHERE cartera_id = ? AND symbol = ? AND fecha = ? AND compra_id = ?",
+        [(cartera_id, symbol, f, i) for f, i, queda, _, _ in consumidos if not queda]
+    )
+    conn.executemany(
+        "UPDATE lotes SET cantidad = ? "
+        "WHERE cartera_id = ? AND symbol = ? AND fecha = ? AND compra_id = ?",
+        [(queda, cartera_id, symbol, f, i) for f, i, queda, _, _ in consumidos if queda]
+    )
+    if metodo == "promedio":
+        return None
+    return sum(tomada * costo_unitario for _, _, _, tomada, costo_unitario in consumidos)
+
+
+def repreciar(conn, cartera_id, symbol, costo_unitario):
+    # Tras una venta a costo promedio los lotes que quedan pasan a costar ese
+    # promedio: su suma sigue siendo el costo de la posición y una venta
+    # fifo o lifo posterior no usa el costo de lo que ya se vendió
+    conn.execute(
+        "UPDATE lotes SET costo_unitario = ? WHERE cartera_id = ? AND symbol = ?",
+        (costo_unitario, cartera_id, symbol)
+    )
+
+
+def abiertos(conn, cartera_id, symbol):
+    return conn.execute(
+        """
+        SELECT fecha, cantidad, costo_unitario FROM lotes
+        WHERE cartera_id = ? AND symbol = ?
+        ORDER BY fecha, compra_id
+        """,
+        (cartera_id, symbol)
+    ).fetchall()
@@ -0,0 +1,276 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from gevent.pool import Pool
+
+# Límites de los histogramas de latencia, en segundos
+LIMITES = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _etiquetas(nombres, valores, extra=""):
+    pares = [f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class _Metrica:
+    tipo = None
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._lock = threading.Lock()
+
+    def _clave(self, etiquetas):
+        return tuple(str(etiquetas[n]) for n in self.etiquetas)
+
+    def exponer(self):
+        yield f"# HELP {self.nombre} {self.ayuda}"
+        yield f"# TYPE {self.nombre} {self.tipo}"
+        yield from self._muestras()
+
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        super().__init__(nombre, ayuda, etiquetas)
+        self._valores = {}
+
+    def sumar(self, cantidad=1, **etiquetas):
+        clave = self._clave(etiquetas)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + cantidad
+
+    def valor(self, **etiquetas):
+        return self._valores.get(self._clave(etiquetas), 0)
+
+    def _muestras(self):
+        with self._lock:
+            valores = sorted(self._valores.items())
+        for clave, valor in valores:
+            yield f"{self.nombre}{_etiquetas(self.etiquetas, clave)} {_numero(valor)}"
+
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nombre, ayuda, etiquetas=(), limites=LIMITES):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.limites = tuple(limites)
+        self._series = {}  # etiquetas -> [cuentas por intervalo..., total, suma]
+
+    def observar(self, valor, **etiquetas):
+        clave = self._clave(etiquetas)
+        posicion = bisect_left(self.limites, valor)
+        with self._lock:
+            serie = self._series.get(clave)
+            if serie is None:
+                serie = self._series[clave] = [0] * (len(self.limites) + 1) + [0.0]
+            if posicion < len(self.limites):
+                serie[posicion] += 1
+            serie[-2] += 1
+            serie[-1] += valor
+
+    def total(self, **etiquetas):
+        serie = self._series.get(self._clave(etiquetas))
+        return serie[-2] if serie else 0
+
+    def _muestras(self):
+        with self._lock:
+            series = sorted((clave, list(serie)) for clave, serie in self._series.items())
+        for clave, serie in series:
+            # Las cuentas se guardan por intervalo; Prometheus las quiere acumuladas
+            acumulado = 0
+            for limite, cuenta in zip(self.limites, serie):
+                acumulado += cuenta
+                extra = f'le="{_numero(limite)}"'
+                yield f"{self.nombre}_bucket{_etiquetas(self.etiquetas, clave, extra)} {acumulado}"
+            extra = 'le="+Inf"'
+            yield f"{self.nombre}_bucket{_etiquetas(self.etiquetas, clave, extra)} {serie[-2]}"
+            yield f"{self.nombre}_sum{_etiquetas(self.etiquetas, clave)} {_numero(serie[-1])}"
+            yield f"{self.nombre}_count{_etiquetas(self.etiquetas, clave)} {serie[-2]}"
+
+
+class Medidor(_Metrica):
+    """Valor que se lee al exponer: `leer()` devuelve un número o, con
+    etiquetas, un dict {valores de etiquetas: número}."""
+
+    def __init__(self, nombre, ayuda, leer, etiquetas=(), tipo="gauge"):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.leer = leer
+        self.tipo = tipo
+
+    def _muestras(self):
+        valores = self.leer()
+        if not isinstance(valores, dict):
+            valores = {(): valores}
+        for clave, valor in sorted(valores.items()):
+            clave = clave if isinstance(clave, tuple) else (clave,)
+            yield f"{self.nombre}{_etiquetas(self.etiquetas, clave)} {_numero(valor)}"
+
+
+class Registro:
+    """Conjunto de métricas que se exponen juntas en formato de texto de Prometheus."""
+
+    def __init__(self):
+        self._metricas = {}
+        self._lock = threading.Lock()
+
+    def _agregar(self, metrica):
+        with self._lock:
+            if metrica.nombre in self._metricas:
+                raise ValueError(f"Métrica duplicada: {metrica.nombre}")
+            self._metricas[metrica.nombre] = metrica
+        return metrica
+
+    def contador(self, nombre, ayuda, etiquetas=()):
+        return self._agregar(Contador(nombre, ayuda, etiquetas))
+
+    def histograma(self, nombre, ayuda, etiquetas=(), limites=LIMITES):
+        return self._agregar(Histograma(nombre, ayuda, etiquetas, limites))
+
+    def medidor(self, nombre, ayuda, leer, etiquetas=(), tipo="gauge"):
+        return self._agregar(Medidor(nombre, ayuda, leer, etiquetas, tipo))
+
+    def exponer(self):
+        with self._lock:
+            metricas = list(self._metricas.values())
+        lineas = []
+        for metrica in metricas:
+            try:
+                lineas.extend(metrica.exponer())
+            except Exception:
+                # Un medidor que falla no tiene que tirar todo /metrics
+                continue
+        return "\n".join(lineas) + "\n"
+
+
+registro = Registro()
+
+# Desglose opcional por petición: cuánto tiempo se fue en cada categoría
+# (sqlite, fmp, render). Con gevent parcheado, threading.local es por greenlet
+_local = threading.local()
+
+
+def iniciar_desglose():
+    _local.desglose = {}
+    return _local.desglose
+
+
+def terminar_desglose():
+    desglose = getattr(_local, "desglose", None)
+    _local.desglose = None
+    return desglose
+
+
+def _sumar(categoria, segundos):
+    desglose = getattr(_local, "desglose", None)
+    if desglose is not None:
+        total, veces = desglose.get(categoria, (0.0, 0))
+        desglose[categoria] = (total + segundos, veces + 1)
+
+
+@contextmanager
+def cronometro(histograma=None, categoria=None, **etiquetas):
+    # Mide el bloque, lo observa en `histograma` y lo suma al desglose
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        transcurrido = time.perf_counter() - inicio
+        if histograma is not None:
+            histograma.observar(transcurrido, **etiquetas)
+        if categoria:
+            _sumar(categoria, transcurrido)
+
+
+def server_timing(desglose, total):
+    # Cabecera Server-Timing: "sqlite;dur=1.20;desc=\"3\", ..., total;dur=9.80"
+    partes = [
+        f'{categoria};dur={segundos * 1000:.2f};desc="{veces}"'
+        for categoria, (segundos, veces) in sorted(desglose.items())
+    ]
+    partes.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(partes)
+
+
+_pools = {}  # nombre -> pool de larga vida
+_por_llamada = {}  # nombre -> greenlets corriendo en pools de una sola llamada
+_lock_pools = threading.Lock()
+
+
+class PoolMedido(Pool):
+    # Pool de gevent cuyos greenlets suman al desglose de la petición que
+    # los lanzó. Con `nombre` es un pool de una sola llamada: sus greenlets
+    # se cuentan en greenlets_en_uso pero su tamaño no va a la capacidad
+    def __init__(self, size=None, nombre=None, **kwargs):
+        super().__init__(size, **kwargs)
+        self.nombre = nombre
+
+    def spawn(self, funcion, *args, **kwargs):
+        desglose = getattr(_local, "desglose", None)
+        if desglose is None:
+            greenlet = super().spawn(funcion, *args, **kwargs)
+        else:
+            def con_desglose(*a, **k):
+                _local.desglose = desglose
+                return funcion(*a, **k)
+            greenlet = super().spawn(con_desglose, *args, **kwargs)
+        if self.nombre is not None:
+            _contar(self.nombre, 1)
+            greenlet.link(lambda _: _contar(self.nombre, -1))
+        return greenlet
+
+
+def _contar(nombre, cantidad):
+    with _lock_pools:
+        _por_llamada[nombre] = _por_llamada.get(nombre, 0) + cantidad
+
+
+def pool(nombre, tamano=None):
+    # El pool de larga vida `nombre` (uno por nombre; sin tamaño no tiene
+    # límite), que se cuenta en greenlets_en_uso y greenlets_capacidad
+    with _lock_pools:
+        if nombre not in _pools:
+            _pools[nombre] = PoolMedido(tamano)
+        return _pools[nombre]
+
+
+def pool_por_llamada(nombre, tamano):
+    # Un pool nuevo para repartir una sola llamada entre `tamano` greenlets
+    return PoolMedido(tamano, nombre)
+
+
+def _en_uso():
+    with _lock_pools:
+        en_uso = dict(_por_llamada)
+        for nombre, p in _pools.items():
+            en_uso[nombre] = en_uso.get(nombre, 0) + len(p)
+        return en_uso
+
+
+def _capacidad():
+    # Los pools sin límite no tienen capacidad que informar
+    with _lock_pools:
+        return {nombre: p.size for nombre, p in _pools.items() if p.size}
+
+
+registro.medidor(
+    "greenlets_en_uso", "Greenlets corriendo en los pools de gevent", _en_uso, ("pool",)
+)
+registro.medidor(
+    "greenlets_capacidad", "Tamaño de los pools de gevent de larga vida con límite", _capacidad, ("pool",)
+)
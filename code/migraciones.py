@@ -0,0 +1,331 @@
+import argparse
+import statistics
+import sqlite3
+import sys
+import time
+
+import base_datos
+import libro
+import historico
+
+# La versión del esquema va en PRAGMA user_version (0 en una base nueva o de
+# antes de las migraciones). Cada migración lleva la base de la versión
+# anterior a la suya en tres pasos: preparar (cambios rápidos de esquema),
+# copiar (por lotes, se repite hasta devolver None) y terminar (el cambio
+# final, que anota la versión). migrar() confirma cada paso y cada lote por
+# separado, así que quien lee o escribe la base solo espera un lote;
+# aplicar() hace todo en la transacción de quien llama
+TAMANO_LOTE = 5000
+
+
+class LibroCompacto:
+    """historial_compras (montos REAL, fechas TEXT y columnas derivadas) pasa a compras.
+
+    Mientras se copia, unos disparadores repiten en compras lo que se
+    inserta, modifica o borra en historial_compras, así que la versión
+    anterior de la aplicación puede seguir escribiendo. Al terminar
+    historial_compras queda como vista sobre compras.
+    """
+
+    version = 1
+    descripcion = "libro de compras con enteros y índices de cobertura"
+
+    DISPARADORES = ("migracion_compras_insertar", "migracion_compras_modificar", "migracion_compras_borrar")
+
+    def _anteriores(self, conn):
+        # Columnas de historial_compras si todavía es una tabla; None si no
+        tipo = conn.execute(
+            "SELECT type FROM sqlite_master WHERE name = 'historial_compras'"
+        ).fetchone()
+        if not tipo or tipo[0] != "table":
+            return None
+        return {fila[1] for fila in conn.execute("PRAGMA table_info(historial_compras)")}
+
+    def preparar(self, conn):
+        for sentencia in libro.ESQUEMA:
+            conn.execute(sentencia)
+        anteriores = self._anteriores(conn)
+        if anteriores is None:
+            return
+        columnas = ", ".join(libro.COLUMNAS)
+        nuevos = ", ".join(libro.conversion(anteriores, "NEW."))
+        insertar, modificar, borrar = self.DISPARADORES
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {insertar} AFTER INSERT ON historial_compras
+            BEGIN
+                INSERT OR REPLACE INTO compras ({columnas}) VALUES ({nuevos});
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {modificar} AFTER UPDATE ON historial_compras
+            BEGIN
+                DELETE FROM compras WHERE id = OLD.id;
+                INSERT OR REPLACE INTO compras ({columnas}) VALUES ({nuevos});
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {borrar} AFTER DELETE ON historial_compras
+            BEGIN
+                DELETE FROM compras WHERE id = OLD.id;
+            END
+        """)
+
+    def copiar(self, conn, desde, tamano_lote):
+        # Las compras con id mayor a `desde`, hasta `tamano_lote` (-1: todas).
+        # Devuelve el último id copiado o None si no quedaba nada. OR IGNORE:
+        # lo que ya pasó un disparador está más al día que esta copia
+        anteriores = self._anteriores(conn)
+        if anteriores is None:
+            return None
+        ultimo = conn.execute(
+            "SELECT MAX(id) FROM (SELECT id FROM historial_compras WHERE id > ? ORDER BY id LIMIT ?)",
+            (desde, tamano_lote)
+        ).fetchone()[0]
+        if ultimo is None:
+            return None
+        conn.execute(
+            f"""
+            INSERT OR IGNORE INTO compras ({", ".join(libro.COLUMNAS)})
+            SELECT {", ".join(libro.conversion(anteriores))}
+            FROM historial_compras WHERE id > ? AND id <= ?
+            """,
+            (desde, ultimo)
+        )
+        return ultimo
+
+    def terminar(self, conn):
+        if self._anteriores(conn) is not None:
+            for nombre in self.DISPARADORES:
+                conn.execute(f"DROP TRIGGER IF EXISTS {nombre}")
+            # AUTOINCREMENT: los ids de compras borradas tampoco se reusan
+            secuencia = conn.execute(
+                "SELECT seq FROM sqlite_sequence WHERE name = 'historial_compras'"
+            ).fetchone()
+            if secuencia:
+                conn.execute(
+                    "UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'compras'", secuencia
+                )
+                conn.execute(
+                    "INSERT INTO sqlite_sequence (name, seq) SELECT 'compras', ? "
+                    "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'compras')",
+                    secuencia
+                )
+            conn.execute("DROP TABLE historial_compras")
+        for sentencia in libro.VISTA:
+            conn.execute(sentencia)
+
+
+class IndicesOrden:
+    """Índices para ordenar el historial por símbolo, cantidad, precio o total.
+
+    Solo crea índices (libro.INDICES_ORDEN): no hay nada que copiar.
+    """
+
+    version = 2
+    descripcion = "índices para cada orden del historial"
+
+    def preparar(self, conn):
+        for sentencia in libro.INDICES_ORDEN:
+            conn.execute(sentencia)
+
+    def copiar(self, conn, desde, tamano_lote):
+        return None
+
+    def terminar(self, conn):
+        pass
+
+
+MIGRACIONES = (LibroCompacto(), IndicesOrden())
+
+
+def version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def pendientes(conn):
+    actual = version(conn)
+    return [m for m in MIGRACIONES if m.version > actual]
+
+
+def _terminar(conn, migracion):
+    migracion.terminar(conn)
+    conn.execute(f"PRAGMA user_version = {int(migracion.version)}")
+
+
+def aplicar(conn):
+    # Todas las pendientes dentro de base_datos.escritura(). Una base al día
+    # solo cuesta leer user_version
+    for migracion in pendientes(conn):
+        migracion.preparar(conn)
+        migracion.copiar(conn, 0, -1)
+        _terminar(conn, migracion)
+
+
+def migrar(pool=None, tamano_lote=TAMANO_LOTE, pausa=0.0, informar=None):
+    """Aplica las migraciones pendientes con la base en uso.
+
+    Cada lote de `tamano_lote` filas es una transacción; entre lote y lote
+    se esperan `pausa` segundos para dejar pasar a los demás. informar
+    recibe (migración, filas copiadas) después de cada lote. Devuelve las
+    versiones aplicadas.
+    """
+    pool = pool or base_datos.pool
+    aplicadas = []
+    with pool.conexion() as conn:
+        migraciones = pendientes(conn)
+    for migracion in migraciones:
+        with pool.escritura() as conn:
+            if version(conn) >= migracion.version:
+                continue  # otro proceso la terminó mientras tanto
+            migracion.preparar(conn)
+        desde, copiadas = 0, 0
+        while True:
+            with pool.escritura() as conn:
+                ultimo = migracion.copiar(conn, desde, tamano_lote)
+                if ultimo is not None:
+                    copiadas += conn.execute("SELECT changes()").fetchone()[0]
+            if ultimo is None:
+                break
+            desde = ultimo
+            if informar:
+                informar(migracion, copiadas)
+            if pausa:
+                time.sleep(pausa)
+        with pool.escritura() as conn:
+            _terminar(conn, migracion)
+        aplicadas.append(migracion.version)
+    return aplicadas
+
+
+# Las consultas que más usan el historial, escritas para cada esquema, para
+# comparar antes y después: (nombre, antes, después). Los parámetros son la
+# cartera, un símbolo y una fecha (o su día)
+CONSULTAS = (
+    (
+        "totales por símbolo (reconstruir posiciones)",
+        "SELECT cartera_id, symbol, SUM(cantidad_acciones), SUM(valor_total) "
+        "FROM historial_compras GROUP BY cartera_id, symbol",
+        "SELECT cartera_id, symbol, SUM(cantidad), SUM(cantidad * precio_micros) "
+        "FROM compras GROUP BY cartera_id, symbol",
+    ),
+    (
+        "historial por fecha (primera página)",
+        "SELECT id, fecha_compra, symbol, cantidad_acciones, valor_compra, valor_total "
+        "FROM historial_compras WHERE cartera_id = :cartera AND fecha_compra >= :fecha "
+        "ORDER BY fecha_compra DESC, id DESC LIMIT 51",
+        "SELECT id, dia, symbol, cantidad, precio_micros, cantidad * precio_micros "
+        "FROM compras WHERE cartera_id = :cartera AND dia >= :dia "
+        "ORDER BY dia DESC, id DESC LIMIT 51",
+    ),
+    (
+        "historial de un símbolo",
+        "SELECT id, fecha_compra, cantidad_acciones, valor_compra, valor_total "
+        "FROM historial_compras WHERE cartera_id = :cartera AND symbol = :symbol "
+        "ORDER BY fecha_compra, id",
+        "SELECT id, dia, cantidad, precio_micros, cantidad * precio_micros "
+        "FROM compras WHERE cartera_id = :cartera AND symbol = :symbol ORDER BY dia, id",
+    ),
+    (
+        "compras desde una fecha (serie de rendimiento)",
+        "SELECT fecha_compra, symbol, cantidad_acciones, valor_total "
+        "FROM historial_compras WHERE cartera_id = :cartera AND fecha_compra >= :fecha",
+        "SELECT dia, symbol, cantidad, cantidad * precio_micros "
+        "FROM compras WHERE cartera_id = :cartera AND dia >= :dia",
+    ),
+)
+
+
+def espacio(conn, tabla):
+    # Bytes de la tabla y sus índices según dbstat; None si SQLite no lo trae
+    try:
+        return conn.execute(
+            "SELECT SUM(pgsize) FROM dbstat WHERE name IN "
+            "(SELECT name FROM sqlite_master WHERE tbl_name = ? AND type IN ('table', 'index'))",
+            (tabla,)
+        ).fetchone()[0] or 0
+    except sqlite3.OperationalError:
+        return None
+
+
+def medir(conn, despues, repeticiones=5):
+    # Mediana en segundos de cada consulta de CONSULTAS para el esquema dado.
+    # Un historial de antes de las carteras no tiene con qué compararse
+    tabla = "compras" if despues else "historial_compras"
+    if "cartera_id" not in {fila[1] for fila in conn.execute(f"PRAGMA table_info({tabla})")}:
+        return {}
+    muestra = conn.execute(
+        f"SELECT cartera_id, symbol, {'dia' if despues else 'fecha_compra'} FROM {tabla} "
+        "ORDER BY id DESC LIMIT 1"
+    ).fetchone()
+    if muestra is None:
+        return {}
+    cartera, symbol, fecha = muestra
+    if not despues:
+        fecha = libro.a_dia(fecha[:10]) if fecha else None
+    parametros = {
+        "cartera": cartera, "symbol": symbol,
+        "dia": fecha, "fecha": None if fecha is None else historico.a_fecha(fecha).isoformat(),
+    }
+    tiempos = {}
+    for nombre, antes, nueva in CONSULTAS:
+        veces = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            conn.execute(nueva if despues else antes, parametros).fetchall()
+            veces.append(time.perf_counter() - inicio)
+        tiempos[nombre] = statistics.median(veces)
+    return tiempos
+
+
+def _cambio(antes, despues):
+    if not antes:
+        return ""
+    return f" ({(despues - antes) / antes:+.0%})"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Aplica las migraciones pendientes de precios.db por lotes, con la base en uso"
+    )
+    parser.add_argument("--lote", type=int, default=TAMANO_LOTE,
+                        help="filas copiadas por transacción")
+    parser.add_argument("--pausa", type=float, default=0.0,
+                        help="segundos de espera entre lotes")
+    parser.add_argument("--sin-medir", action="store_true",
+                        help="no compara espacio ni tiempos de consulta")
+    args = parser.parse_args(argv)
+
+    with base_datos.conexion() as conn:
+        faltan = pendientes(conn)
+        print(f"Versión del esquema: {version(conn)}")
+        if not faltan:
+            print("No hay migraciones pendientes")
+            return 0
+        medir_libro = not args.sin_medir and any(isinstance(m, LibroCompacto) for m in faltan)
+        if medir_libro:
+            espacio_antes = espacio(conn, "historial_compras")
+            tiempos_antes = medir(conn, despues=False)
+
+    def informar(migracion, copiadas):
+        print(f"  {migracion.version}: {copiadas} fila(s) copiada(s)", flush=True)
+
+    for migracion in faltan:
+        print(f"Migración {migracion.version}: {migracion.descripcion}")
+    aplicadas = migrar(tamano_lote=args.lote, pausa=args.pausa, informar=informar)
+    print(f"Aplicada(s): {', '.join(map(str, aplicadas)) or 'ninguna'}")
+
+    if medir_libro:
+        with base_datos.conexion() as conn:
+            espacio_despues = espacio(conn, "compras")
+            tiempos_despues = medir(conn, despues=True)
+        if espacio_antes is not None:
+            print(f"Espacio del historial: {espacio_antes:,} -> {espacio_despues:,} bytes"
+                  f"{_cambio(espacio_antes, espacio_despues)}")
+        for nombre, antes in tiempos_antes.items():
+            despues = tiempos_despues[nombre]
+            print(f"{nombre}: {antes * 1000:.2f} -> {despues * 1000:.2f} ms{_cambio(antes, despues)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,284 @@
+import heapq
+import itertools
+import threading
+import time
+
+import metricas
+from cliente_fmp import LimiteSolicitudesError
+
+# Prioridades: el número menor sale primero
+INTERACTIVA = 0
+FONDO = 1
+BUSQUEDA = 2
+NOMBRES = {INTERACTIVA: "interactiva", FONDO: "fondo", BUSQUEDA: "busqueda"}
+
+# Sin Retry-After, cuánto se deja de llamar después de un 429
+PAUSA_POR_DEFECTO = 10.0
+
+ESPERA_PLANIFICADOR = metricas.registro.histograma(
+    "planificador_espera_segundos", "Espera por un turno para llamar a FMP", ("prioridad",)
+)
+RECHAZOS_PLANIFICADOR = metricas.registro.contador(
+    "planificador_rechazos_total",
+    "Llamadas que no consiguieron turno dentro de su espera máxima", ("prioridad",)
+)
+FUSIONADOS_PLANIFICADOR = metricas.registro.contador(
+    "planificador_fusionados_total", "Pedidos de cotización que se sumaron a un lote ya en cola"
+)
+PAUSAS_PLANIFICADOR = metricas.registro.contador(
+    "planificador_pausas_total", "Pausas por respuestas 429 de FMP"
+)
+
+
+class Cubeta:
+    """Cubeta de fichas: `tasa` fichas por segundo y hasta `capacidad` juntas.
+
+    No es segura entre hilos por sí sola; el Planificador la usa con su lock.
+    """
+
+    def __init__(self, tasa, capacidad, reloj=time.monotonic):
+        self.tasa = tasa
+        self.capacidad = capacidad
+        self.reloj = reloj
+        self.fichas = capacidad
+        self._ultima = reloj()
+
+    def _reponer(self):
+        ahora = self.reloj()
+        self.fichas = min(self.capacidad, self.fichas + (ahora - self._ultima) * self.tasa)
+        self._ultima = ahora
+
+    def espera(self):
+        # Segundos hasta que haya una ficha entera
+        self._reponer()
+        return 0.0 if self.fichas >= 1 else (1 - self.fichas) / self.tasa
+
+    def tomar(self):
+        self._reponer()
+        self.fichas -= 1
+
+    def vaciar(self):
+        self._reponer()
+        self.fichas = min(self.fichas, 0)
+
+
+class _Turno:
+    __slots__ = ("prioridad", "orden")
+
+    def __init__(self, prioridad, orden):
+        self.prioridad = prioridad
+        self.orden = orden
+
+    def __lt__(self, otro):
+        return (self.prioridad, self.orden) < (otro.prioridad, otro.orden)
+
+
+class _Lote:
+    # Pedido de /quote en cola al que se pueden sumar otros símbolos
+    def __init__(self, turno, symbols):
+        self.turno = turno
+        self.symbols = dict.fromkeys(symbols)  # en el orden en que se pidieron
+        self.pedidos = 1
+        self.evento = threading.Event()
+        self.resultado = None
+        self.error = None
+
+
+class Planificador:
+    """Turnos para todas las llamadas a FMP.
+
+    Cada llamada espera una ficha de `cubeta`; si hay varias esperando sale
+    primero la de menor prioridad y, entre iguales, la más antigua. Los
+    pedidos de cotización en cola se juntan en un mismo /quote (hasta
+    `max_simbolos`). Un 429 detiene todo hasta su Retry-After. Una llamada
+    que no consigue turno dentro de `esperas_maximas[prioridad]` segundos
+    (None: sin límite) falla con LimiteSolicitudesError.
+    """
+
+    def __init__(self, cliente, cubeta, max_simbolos=50, esperas_maximas=None,
+                 pausa_por_defecto=PAUSA_POR_DEFECTO):
+        self.cliente = cliente
+        self.cubeta = cubeta
+        self.max_simbolos = max_simbolos
+        self.esperas_maximas = esperas_maximas or {}
+        self.pausa_por_defecto = pausa_por_defecto
+        self._cola = []
+        self._lotes = []
+        self._orden = itertools.count()
+        self._cond = threading.Condition()
+        self._pausado_hasta = 0.0
+
+    @property
+    def reloj(self):
+        return self.cubeta.reloj
+
+    def _encolar(self, prioridad):
+        turno = _Turno(prioridad, next(self._orden))
+        heapq.heappush(self._cola, turno)
+        return turno
+
+    def _quitar(self, turno):
+        self._cola.remove(turno)
+        heapq.heapify(self._cola)
+        self._cond.notify_all()
+
+    def _espera_estimada(self, turno):
+        # Pausa pendiente o fichas que faltan para los que van adelante
+        adelante = sum(1 for otro in self._cola if otro < turno)
+        por_fichas = max(0.0, (adelante + 1 - self.cubeta.fichas) / self.cubeta.tasa)
+        return max(self._pausado_hasta - self.reloj(), por_fichas)
+
+    def _esperar_turno(self, turno):
+        # Con self._cond tomado y el turno en la cola; al volver ya gastó su ficha
+        inicio = self.reloj()
+        espera_maxima = self.esperas_maximas.get(turno.prioridad)
+        limite = None if espera_maxima is None else inicio + espera_maxima
+        while True:
+            espera = None
+            if self._cola[0] is turno:
+                espera = max(self._pausado_hasta - self.reloj(), self.cubeta.espera())
+                if espera <= 0:
+                    heapq.heappop(self._cola)
+                    self.cubeta.tomar()
+                    self._cond.notify_all()
+                    ESPERA_PLANIFICADOR.observar(
+                        self.reloj() - inicio, prioridad=NOMBRES.get(turno.prioridad, turno.prioridad)
+                    )
+                    return
+            if limite is not None:
+                restante = limite - self.reloj()
+                # Si ya se sabe que no alcanza, se avisa sin esperar de más
+                if restante <= 0 or (espera is not None and espera > restante):
+                    estimada = self._espera_estimada(turno)
+                    self._quitar(turno)
+                    RECHAZOS_PLANIFICADOR.sumar(prioridad=NOMBRES.get(turno.prioridad, turno.prioridad))
+                    raise LimiteSolicitudesError(round(estimada, 1) or None)
+                espera = restante if espera is None else min(espera, restante)
+            self._cond.wait(espera)
+
+    def _llamar(self, funcion, *args, **kwargs):
+        try:
+            return funcion(*args, **kwargs)
+        except LimiteSolicitudesError as e:
+            self.pausar(e.retry_after)
+            raise
+
+    def pausar(self, segundos=None):
+        # La cuota se agotó: nadie llama hasta que pase la pausa
+        with self._cond:
+            hasta = self.reloj() + (segundos or self.pausa_por_defecto)
+            self._pausado_hasta = max(self._pausado_hasta, hasta)
+            self.cubeta.vaciar()
+            self._cond.notify_all()
+        PAUSAS_PLANIFICADOR.sumar()
+
+    def ejecutar(self, prioridad, funcion, *args, **kwargs):
+        with self._cond:
+            self._esperar_turno(self._encolar(prioridad))
+        return self._llamar(funcion, *args, **kwargs)
+
+    def _lote_abierto(self, symbols):
+        # Primero uno que ya tenga todos los símbolos; si no, uno con lugar
+        for lote in self._lotes:
+            if lote.symbols.keys() >= symbols:
+                return lote
+        for lote in self._lotes:
+            if len(lote.symbols.keys() | symbols) <= self.max_simbolos:
+                return lote
+        return None
+
+    def cotizaciones(self, symbols, prioridad=INTERACTIVA):
+        """Como ClienteFMP.cotizaciones, pero en turno y juntando pedidos en cola.
+
+        Devuelve solo las cotizaciones de `symbols`; la respuesta de un lote
+        al que no se sumó nadie se devuelve tal cual.
+        """
+        propios = set(symbols)
+        with self._cond:
+            lote = self._lote_abierto(propios)
+            lider = lote is None
+            if lider:
+                lote = _Lote(self._encolar(prioridad), symbols)
+                self._lotes.append(lote)
+                try:
+                    self._esperar_turno(lote.turno)
+                except LimiteSolicitudesError as e:
+                    lote.error = e
+                    raise
+                finally:
+                    self._lotes.remove(lote)
+                    if lote.error is not None:
+                        lote.evento.set()
+            else:
+                lote.symbols.update(dict.fromkeys(symbols))
+                lote.pedidos += 1
+                FUSIONADOS_PLANIFICADOR.sumar()
+                if prioridad < lote.turno.prioridad:
+                    lote.turno.prioridad = prioridad
+                    heapq.heapify(self._cola)
+                    self._cond.notify_all()
+
+        if lider:
+            try:
+                lote.resultado = self._llamar(self.cliente.cotizaciones, list(lote.symbols))
+            except Exception as e:
+                lote.error = e
+                raise
+            finally:
+                lote.evento.set()
+        elif not lote.evento.wait(self.esperas_maximas.get(prioridad)):
+            RECHAZOS_PLANIFICADOR.sumar(prioridad=NOMBRES.get(prioridad, prioridad))
+            raise LimiteSolicitudesError()
+
+        if lote.error is not None:
+            raise lote.error
+        if lote.pedidos == 1 or not isinstance(lote.resultado, list):
+            return lote.resultado
+        return [
+            item for item in lote.resultado
+            if isinstance(item, dict) and item.get("symbol") in propios
+        ]
+
+    def con_prioridad(self, prioridad):
+        return _ClientePriorizado(self, prioridad)
+
+    def reiniciar(self):
+        with self._cond:
+            self._pausado_hasta = 0.0
+            self.cubeta.fichas = self.cubeta.capacidad
+            self._cond.notify_all()
+
+    def estadisticas(self):
+        with self._cond:
+            en_cola = {nombre: 0 for nombre in NOMBRES.values()}
+            for turno in self._cola:
+                en_cola[NOMBRES.get(turno.prioridad, turno.prioridad)] += 1
+            return {
+                "en_cola": en_cola,
+                "fichas": round(self.cubeta.fichas, 2),
+                "pausado_por": round(max(0.0, self._pausado_hasta - self.reloj()), 1),
+            }
+
+
+class _ClientePriorizado:
+    # Misma interfaz que ClienteFMP con todas las llamadas en turno, para
+    # pasarlo a quien espera un cliente (p. ej. historico.ProveedorFMP)
+    def __init__(self, planificador, prioridad):
+        self.planificador = planificador
+        self.prioridad = prioridad
+
+    def get(self, ruta, **params):
+        return self.planificador.ejecutar(self.prioridad, self.planificador.cliente.get, ruta, **params)
+
+    def cotizaciones(self, symbols):
+        return self.planificador.cotizaciones(symbols, self.prioridad)
+
+    def buscar(self, term, limite=10):
+        return self.planificador.ejecutar(
+            self.prioridad, self.planificador.cliente.buscar, term, limite=limite
+        )
+
+    def historico(self, symbol, desde, hasta):
+        return self.planificador.ejecutar(
+            self.prioridad, self.planificador.cliente.historico, symbol, desde, hasta
+        )
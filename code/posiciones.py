@@ -0,0 +1,190 @@
+import argparse
+import sys
+
+import base_datos
+import carteras
+import libro
+import lotes
+import migraciones
+
+# Totales por cartera y símbolo que se mantienen al día con cada compra y
+# venta para no recorrer todo el historial en cada consolidación. WITHOUT
+# ROWID guarda las filas ordenadas por (cartera_id, symbol): las de una
+# cartera quedan juntas. valor_usd_total es el costo de lo que sigue en
+# cartera y ganancia_realizada lo ganado en las ventas
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS posiciones (
+    cartera_id INTEGER NOT NULL,
+    symbol TEXT NOT NULL,
+    cantidad_total INTEGER NOT NULL,
+    valor_usd_total REAL NOT NULL,
+    ganancia_realizada REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (cartera_id, symbol)
+) WITHOUT ROWID
+"""
+
+# Las ventas restan su cantidad y el costo que se les asignó. Las compras
+# se suman en micros (enteros, sin error) y se pasan a dólares al final
+TOTALES_HISTORIAL = f"""
+SELECT cartera_id, symbol, SUM(cantidad), SUM(valor), SUM(ganancia)
+FROM (
+    SELECT cartera_id, symbol, SUM(cantidad) AS cantidad,
+           SUM(cantidad * precio_micros) * 1.0 / {libro.ESCALA} AS valor, 0 AS ganancia
+    FROM compras
+    GROUP BY cartera_id, symbol
+    UNION ALL
+    SELECT cartera_id, symbol, -cantidad, -costo, ganancia
+    FROM historial_ventas
+)
+GROUP BY cartera_id, symbol
+"""
+
+# Margen para comparar sumas de columnas REAL
+TOLERANCIA = 1e-6
+
+
+def inicializar(conn):
+    # Crea la tabla y la llena desde el historial la primera vez. Una tabla
+    # de antes de las carteras (sin cartera_id) se vuelve a armar: son
+    # totales derivados del historial
+    migraciones.aplicar(conn)
+    carteras.inicializar(conn)
+    lotes.inicializar(conn)
+    columnas = {fila[1] for fila in conn.execute("PRAGMA table_info(posiciones)")}
+    if columnas and "cartera_id" not in columnas:
+        conn.execute("DROP TABLE posiciones")
+        columnas = set()
+    if columnas and "ganancia_realizada" not in columnas:
+        # Antes de las ventas no había nada realizado
+        conn.execute("ALTER TABLE posiciones ADD COLUMN ganancia_realizada REAL NOT NULL DEFAULT 0")
+    conn.execute(ESQUEMA)
+    if not columnas:
+        reconstruir(conn)
+
+
+def registrar_compra(conn, fecha_compra, symbol, cantidad, valor_compra, cartera_id=carteras.PRINCIPAL):
+    registrar_compras(conn, [(fecha_compra, symbol, cantidad, valor_compra)], cartera_id)
+
+
+def registrar_compras(conn, compras, cartera_id=carteras.PRINCIPAL):
+    # Debe llamarse dentro de base_datos.escritura(): las compras y sus
+    # posiciones se guardan en la misma transacción.
+    # compras: [(fecha_compra, symbol, cantidad, valor_compra)]
+    filas = [(cartera_id, libro.a_dia(f), s, c, libro.a_micros(v)) for f, s, c, v in compras]
+    ultima = lotes.ultima_compra(conn)
+    conn.executemany(
+        "INSERT INTO compras (cartera_id, dia, symbol, cantidad, precio_micros) VALUES (?, ?, ?, ?, ?)",
+        filas
+    )
+    lotes.abrir(conn, ultima)
+
+    totales = {}
+    for _, _, symbol, cantidad, precio_micros in filas:
+        c, v = totales.get(symbol, (0, 0))
+        totales[symbol] = (c + cantidad, v + cantidad * precio_micros)
+    conn.executemany(
+        """
+        INSERT INTO posiciones (cartera_id, symbol, cantidad_total, valor_usd_total)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(cartera_id, symbol) DO UPDATE SET
+            cantidad_total = cantidad_total + excluded.cantidad_total,
+            valor_usd_total = valor_usd_total + excluded.valor_usd_total
+        """,
+        [(cartera_id, symbol, c, v / libro.ESCALA) for symbol, (c, v) in totales.items()]
+    )
+
+
+def registrar_venta(conn, fecha_venta, symbol, cantidad, precio_venta, metodo="fifo",
+                    cartera_id=carteras.PRINCIPAL):
+    """Guarda una venta descontándola de los lotes abiertos y de la posición.
+
+    Debe llamarse dentro de base_datos.escritura(). El costo sale de los
+    lotes consumidos (fifo, lifo) o del precio promedio de la posición
+    (promedio). Devuelve la venta con su costo y su ganancia realizada.
+    """
+    costo = lotes.consumir(conn, cartera_id, symbol, cantidad, fecha_venta, metodo)
+    if costo is None:
+        cantidad_total, valor_usd_total = conn.execute(
+            "SELECT cantidad_total, valor_usd_total FROM posiciones WHERE cartera_id = ? AND symbol = ?",
+            (cartera_id, symbol)
+        ).fetchone()
+        costo = valor_usd_total / cantidad_total * cantidad
+        lotes.repreciar(conn, cartera_id, symbol, valor_usd_total / cantidad_total)
+    ganancia = cantidad * precio_venta - costo
+
+    cursor = conn.execute(
+        """
+        INSERT INTO historial_ventas
+            (cartera_id, fecha_venta, symbol, cantidad, precio_venta, metodo, costo, ganancia)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (cartera_id, fecha_venta, symbol, cantidad, precio_venta, metodo, costo, ganancia)
+    )
+    conn.execute(
+        """
+        UPDATE posiciones SET
+            cantidad_total = cantidad_total - ?,
+            valor_usd_total = valor_usd_total - ?,
+            ganancia_realizada = ganancia_realizada + ?
+        WHERE cartera_id = ? AND symbol = ?
+        """,
+        (cantidad, costo, ganancia, cartera_id, symbol)
+    )
+    return {
+        "id": cursor.lastrowid, "symbol": symbol, "cantidad": cantidad, "metodo": metodo,
+        "costo": round(costo, 2), "ganancia": round(ganancia, 2),
+    }
+
+
+def diferencias(conn):
+    # Compara la tabla con los totales recalculados desde el historial.
+    # Devuelve [((cartera_id, symbol), guardado, esperado)] con
+    # (cantidad, valor) o None
+    esperado = {(k, s): (c, v) for k, s, c, v, _ in conn.execute(TOTALES_HISTORIAL)}
+    guardado = {
+        (k, s): (c, v) for k, s, c, v in
+        conn.execute("SELECT cartera_id, symbol, cantidad_total, valor_usd_total FROM posiciones")
+    }
+
+    resultado = []
+    for clave in sorted(set(esperado) | set(guardado)):
+        a, b = guardado.get(clave), esperado.get(clave)
+        if a is None or b is None or a[0] != b[0] or abs(a[1] - b[1]) > TOLERANCIA:
+            resultado.append((clave, a, b))
+    return resultado
+
+
+def reconstruir(conn):
+    # Recalcula todas las posiciones y devuelve las diferencias que había
+    encontradas = diferencias(conn)
+    conn.execute("DELETE FROM posiciones")
+    conn.execute(
+        "INSERT INTO posiciones (cartera_id, symbol, cantidad_total, valor_usd_total, ganancia_realizada) "
+        + TOTALES_HISTORIAL
+    )
+    return encontradas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Reconstruye la tabla posiciones a partir de las compras y las ventas"
+    )
+    parser.add_argument("--verificar", action="store_true",
+                        help="solo informa las diferencias, sin corregirlas")
+    args = parser.parse_args(argv)
+
+    with base_datos.escritura() as conn:
+        inicializar(conn)
+        if args.verificar:
+            encontradas = diferencias(conn)
+        else:
+            encontradas = reconstruir(conn)
+
+    for (cartera_id, symbol), guardado, esperado in encontradas:
+        print(f"cartera {cartera_id} {symbol}: posiciones={guardado} historial={esperado}")
+    print(f"{len(encontradas)} símbolo(s) con diferencias")
+    return 1 if args.verificar and encontradas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
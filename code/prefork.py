@@ -0,0 +1,230 @@
+import fcntl
+import os
+import signal
+import sys
+import time
+import traceback
+
+import gevent
+from gevent import socket
+
+# Segundos que tiene un trabajador para terminar sus peticiones al detenerse
+GRACIA = 10.0
+# Un trabajador que muere antes de esto no se reemplaza enseguida
+VIDA_MINIMA = 1.0
+# Descriptor del socket que hereda un trabajador lanzado con `comando`
+VARIABLE_LISTENER = "PREFORK_LISTENER_FD"
+# El entorno con que arrancó el proceso, antes de que la aplicación cargue
+# su .env: los trabajadores nuevos vuelven a leerlo desde el disco
+ENTORNO_INICIAL = dict(os.environ)
+
+
+def escuchar(direccion, backlog=2048):
+    # El socket se abre en el maestro y lo heredan todos los trabajadores:
+    # el kernel reparte las conexiones entre los que están aceptando
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(direccion)
+    sock.listen(backlog)
+    return sock
+
+
+def listener_heredado():
+    # En un trabajador lanzado por el Maestro con `comando`: el socket del
+    # maestro; None en cualquier otro proceso
+    fd = os.environ.get(VARIABLE_LISTENER)
+    return socket.socket(fileno=int(fd)) if fd else None
+
+
+def servir(crear_servidor, listener, gracia=GRACIA):
+    # El cuerpo de un trabajador: atiende hasta recibir SIGTERM y entonces
+    # termina lo que tenía en curso dentro de `gracia` segundos
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    servidor = crear_servidor(listener)
+    gevent.signal_handler(signal.SIGTERM, lambda: gevent.spawn(servidor.stop, gracia))
+    servidor.serve_forever()
+
+
+class Candidato:
+    """Elige un solo proceso para las tareas de fondo con un flock sobre `ruta`.
+
+    Sirve entre los trabajadores de un Maestro y entre instancias separadas
+    que usan la misma base. El bloqueo se libera solo cuando muere el
+    proceso que lo tiene y entonces lo toma otro candidato.
+    """
+
+    def __init__(self, ruta, intervalo=5.0):
+        self.ruta = ruta
+        self.intervalo = intervalo
+        self._archivo = None
+
+    @property
+    def lider(self):
+        return self._archivo is not None
+
+    def intentar(self):
+        if self._archivo is not None:
+            return True
+        archivo = open(self.ruta, "a")
+        try:
+            fcntl.flock(archivo.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            archivo.close()
+            return False
+        self._archivo = archivo
+        return True
+
+    def competir(self, al_ganar):
+        # Para correr en un greenlet: espera el bloqueo y llama a al_ganar()
+        while not self.intentar():
+            gevent.sleep(self.intervalo)
+        al_ganar()
+
+    def renunciar(self):
+        if self._archivo is not None:
+            self._archivo.close()
+            self._archivo = None
+
+
+class Maestro:
+    """Mantiene `trabajadores` procesos atendiendo un mismo puerto.
+
+    `crear_servidor(listener)` se llama en cada hijo y devuelve un servidor
+    de gevent (serve_forever/stop). Con `comando` (argv de un programa que
+    llama a servir() con listener_heredado()) cada hijo se ejecuta de cero
+    y lee el código y el .env del disco; sin él, el hijo es una copia del
+    maestro. SIGHUP renueva los hijos de a uno: el nuevo empieza a aceptar
+    antes de que el viejo deje de hacerlo y el viejo termina lo que tenía en
+    curso. SIGTERM o SIGINT detienen todo con la misma gracia. Un hijo que
+    muere solo se reemplaza.
+    """
+
+    def __init__(self, crear_servidor, trabajadores, direccion, gracia=GRACIA, salida=print,
+                 comando=None):
+        self.crear_servidor = crear_servidor
+        self.trabajadores = trabajadores
+        self.direccion = direccion
+        self.gracia = gracia
+        self.salida = salida
+        self.comando = comando
+        self.listener = None
+        self.hijos = {}  # pid -> momento en que se lanzó
+        self._retirados = set()
+        self._terminados = []  # (pid, vida) recogidos y todavía sin atender
+        self._activo = False
+        self._senales = []
+
+    def _servir(self):
+        # En el hijo: sin las señales del maestro
+        for senal in self._senales:
+            senal.cancel()
+        if self.comando:
+            fd = self.listener.fileno()
+            os.set_inheritable(fd, True)
+            os.execve(self.comando[0], self.comando,
+                      dict(ENTORNO_INICIAL, **{VARIABLE_LISTENER: str(fd)}))
+        servir(self.crear_servidor, self.listener, self.gracia)
+
+    def _lanzar(self):
+        pid = os.fork()
+        if pid == 0:
+            codigo = 0
+            try:
+                self._servir()
+            except BaseException:
+                traceback.print_exc()
+                codigo = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(codigo)
+        self.hijos[pid] = time.monotonic()
+        return pid
+
+    def _recoger(self):
+        # Saca de self.hijos los que terminaron y los deja en
+        # self._terminados; los atiende _reponer(), llame quien llame a esto
+        for pid, lanzado in list(self.hijos.items()):
+            try:
+                terminado, _ = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                terminado = pid
+            if terminado:
+                del self.hijos[pid]
+                self._terminados.append((pid, time.monotonic() - lanzado))
+
+    def _reponer(self):
+        # Los retirados se olvidan; los demás murieron solos y se reemplazan
+        terminados, self._terminados = self._terminados, []
+        for pid, vida in terminados:
+            if pid in self._retirados:
+                self._retirados.discard(pid)
+                continue
+            if not self._activo:
+                continue
+            self.salida(f"El trabajador {pid} terminó; se reemplaza")
+            if vida < VIDA_MINIMA:
+                gevent.sleep(VIDA_MINIMA)
+            if self._activo:
+                self._lanzar()
+
+    def _esperar(self, pid, limite):
+        while pid in self.hijos and time.monotonic() < limite:
+            gevent.sleep(0.05)
+            self._recoger()
+        return pid not in self.hijos
+
+    def _retirar(self, pid):
+        self._retirados.add(pid)
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            return
+        if not self._esperar(pid, time.monotonic() + self.gracia + 5):
+            os.kill(pid, signal.SIGKILL)
+            self._esperar(pid, time.monotonic() + 5)
+
+    def recargar(self):
+        for pid in list(self.hijos):
+            if not self._activo:
+                return
+            self._lanzar()
+            self._retirar(pid)
+        self.salida(f"Trabajadores renovados: {sorted(self.hijos)}")
+
+    def detener(self):
+        self._activo = False
+
+    def ejecutar(self):
+        self.listener = escuchar(self.direccion)
+        self._activo = True
+        self._senales = [
+            gevent.signal_handler(signal.SIGHUP, lambda: gevent.spawn(self.recargar)),
+            gevent.signal_handler(signal.SIGTERM, self.detener),
+            gevent.signal_handler(signal.SIGINT, self.detener),
+        ]
+        for _ in range(self.trabajadores):
+            self._lanzar()
+        self.salida(f"Maestro {os.getpid()} con trabajadores {sorted(self.hijos)}")
+
+        try:
+            while self._activo:
+                gevent.sleep(0.5)
+                self._recoger()
+                self._reponer()
+        finally:
+            for senal in self._senales:
+                senal.cancel()
+            for pid in list(self.hijos):
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+            limite = time.monotonic() + self.gracia + 5
+            for pid in list(self.hijos):
+                if not self._esperar(pid, limite):
+                    os.kill(pid, signal.SIGKILL)
+                    self._esperar(pid, time.monotonic() + 5)
+            self._reponer()
+            self.listener.close()
+        return 0
@@ -0,0 +1,254 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import gevent
+from gevent.queue import Empty, Queue
+
+import metricas
+from cliente_fmp import CircuitoAbiertoError, LimiteSolicitudesError
+from planificador import INTERACTIVA
+
+# Últimas latencias que se guardan por proveedor y cuántas hacen falta
+# antes de confiar en su p95
+VENTANA = 200
+MIN_MUESTRAS = 20
+# Sin muestras suficientes, cuánto se espera al primero antes de cubrirlo
+ESPERA_INICIAL = 1.0
+# Por debajo de esto no se cubre aunque el p95 sea menor
+ESPERA_MINIMA = 0.05
+
+SEGUNDOS_PROVEEDOR = metricas.registro.histograma(
+    "proveedor_cotizaciones_segundos", "Latencia de las cotizaciones por proveedor", ("proveedor",)
+)
+COTIZACIONES_PROVEEDOR = metricas.registro.contador(
+    "proveedor_cotizaciones_total",
+    "Pedidos de cotización por proveedor y resultado (valida, invalida, error)",
+    ("proveedor", "resultado")
+)
+COBERTURAS_PROVEEDOR = metricas.registro.contador(
+    "proveedor_coberturas_total",
+    "Pedidos duplicados a un proveedor porque el anterior superó su p95", ("proveedor",)
+)
+
+
+class ProveedorFMP:
+    """Cotizaciones de /quote de Financial Modeling Prep, en turno del planificador."""
+
+    nombre = "fmp"
+
+    def __init__(self, planificador):
+        self.planificador = planificador
+
+    def cotizaciones(self, symbols, prioridad=INTERACTIVA):
+        return self.planificador.cotizaciones(symbols, prioridad)
+
+
+class ProveedorArchivo:
+    """Precios de un archivo JSON para trabajar y probar sin conexión.
+
+    Acepta {symbol: precio} o una respuesta de /quote guardada (lista de
+    {"symbol", "price"}). El archivo se vuelve a leer cuando cambia, así que
+    puede ser el que va escribiendo un Grabador.
+    """
+
+    nombre = "archivo"
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._precios = {}
+        self._modificado = None
+        self._lock = threading.Lock()
+
+    def _cargar(self):
+        try:
+            estado = os.stat(self.ruta)
+        except FileNotFoundError:
+            return {}
+        modificado = (estado.st_mtime_ns, estado.st_size)
+        with self._lock:
+            if modificado != self._modificado:
+                with open(self.ruta, encoding="utf-8") as archivo:
+                    datos = json.load(archivo)
+                if isinstance(datos, list):
+                    datos = {
+                        item.get("symbol"): item.get("price") for item in datos if isinstance(item, dict)
+                    }
+                self._precios = {s: p for s, p in datos.items() if s and p is not None}
+                self._modificado = modificado
+            return self._precios
+
+    def cotizaciones(self, symbols, prioridad=INTERACTIVA):
+        precios = self._cargar()
+        return [{"symbol": s, "price": precios[s]} for s in symbols if s in precios]
+
+
+class Grabador:
+    """Envuelve un proveedor y agrega a `ruta` cada precio que responde,
+    para repetir la sesión después con ProveedorArchivo."""
+
+    def __init__(self, proveedor, ruta):
+        self.proveedor = proveedor
+        self.ruta = ruta
+        self._lock = threading.Lock()
+
+    @property
+    def nombre(self):
+        return self.proveedor.nombre
+
+    def cotizaciones(self, symbols, prioridad=INTERACTIVA):
+        datos = self.proveedor.cotizaciones(symbols, prioridad)
+        nuevos = {
+            item["symbol"]: item["price"]
+            for item in datos
+            if isinstance(item, dict) and item.get("symbol") and item.get("price") is not None
+        } if isinstance(datos, list) else {}
+        if nuevos:
+            with self._lock:
+                try:
+                    with open(self.ruta, encoding="utf-8") as archivo:
+                        precios = json.load(archivo)
+                except FileNotFoundError:
+                    precios = {}
+                precios.update(nuevos)
+                # Se reemplaza de una vez para que nadie lea un archivo a medias
+                temporal = f"{self.ruta}.tmp"
+                with open(temporal, "w", encoding="utf-8") as archivo:
+                    json.dump(precios, archivo, indent=2, sort_keys=True)
+                os.replace(temporal, self.ruta)
+        return datos
+
+
+class Latencias:
+    """Últimas `ventana` latencias de un proveedor y su percentil 95."""
+
+    def __init__(self, ventana=VENTANA, min_muestras=MIN_MUESTRAS):
+        self.min_muestras = min_muestras
+        self._muestras = deque(maxlen=ventana)
+        self._lock = threading.Lock()
+
+    def observar(self, segundos):
+        with self._lock:
+            self._muestras.append(segundos)
+
+    def p95(self):
+        # None mientras no haya muestras suficientes
+        with self._lock:
+            if len(self._muestras) < self.min_muestras:
+                return None
+            ordenadas = sorted(self._muestras)
+        return ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * 0.95))]
+
+    def estadisticas(self):
+        p95 = self.p95()
+        with self._lock:
+            muestras = len(self._muestras)
+        return {"muestras": muestras, "p95": None if p95 is None else round(p95, 4)}
+
+
+def valida(datos, symbols):
+    # Una respuesta sirve si trae el precio de alguno de los símbolos pedidos
+    return isinstance(datos, list) and any(
+        isinstance(item, dict) and item.get("symbol") in symbols and item.get("price") is not None
+        for item in datos
+    )
+
+
+class Cotizador:
+    """Pide cotizaciones a varios proveedores en orden de preferencia.
+
+    Con prioridad en `cubiertas`, si el proveedor en curso tarda más que su
+    p95 se lanza el siguiente sin cancelar el primero y gana la primera
+    respuesta válida. Con otras prioridades, o cuando un proveedor falla,
+    solo se pasa al siguiente. Si ninguno responde algo válido se devuelve
+    la respuesta o el error del primero. Un solo proveedor se llama
+    directamente.
+    """
+
+    def __init__(self, proveedores, cubiertas=(INTERACTIVA,), espera_inicial=ESPERA_INICIAL,
+                 espera_minima=ESPERA_MINIMA, ventana=VENTANA, min_muestras=MIN_MUESTRAS):
+        if not proveedores:
+            raise ValueError("Se necesita al menos un proveedor de precios")
+        self.proveedores = list(proveedores)
+        self.cubiertas = set(cubiertas)
+        self.espera_inicial = espera_inicial
+        self.espera_minima = espera_minima
+        self.latencias = {p.nombre: Latencias(ventana, min_muestras) for p in self.proveedores}
+
+    def _espera(self, proveedor):
+        p95 = self.latencias[proveedor.nombre].p95()
+        return self.espera_inicial if p95 is None else max(self.espera_minima, p95)
+
+    def _medir(self, proveedor, symbols, prioridad):
+        inicio = time.perf_counter()
+        try:
+            datos = proveedor.cotizaciones(symbols, prioridad)
+        except (LimiteSolicitudesError, CircuitoAbiertoError):
+            # No salió a la red: su demora no dice nada del proveedor
+            COTIZACIONES_PROVEEDOR.sumar(proveedor=proveedor.nombre, resultado="error")
+            raise
+        except Exception:
+            self._observar(proveedor, time.perf_counter() - inicio, "error")
+            raise
+        self._observar(proveedor, time.perf_counter() - inicio,
+                       "valida" if valida(datos, symbols) else "invalida")
+        return datos
+
+    def _observar(self, proveedor, segundos, resultado):
+        self.latencias[proveedor.nombre].observar(segundos)
+        SEGUNDOS_PROVEEDOR.observar(segundos, proveedor=proveedor.nombre)
+        COTIZACIONES_PROVEEDOR.sumar(proveedor=proveedor.nombre, resultado=resultado)
+
+    def _correr(self, indice, symbols, prioridad, respuestas):
+        try:
+            respuestas.put((indice, self._medir(self.proveedores[indice], symbols, prioridad), None))
+        except Exception as e:
+            respuestas.put((indice, None, e))
+
+    def cotizaciones(self, symbols, prioridad=INTERACTIVA):
+        if len(self.proveedores) == 1:
+            return self._medir(self.proveedores[0], symbols, prioridad)
+
+        symbols = list(symbols)
+        respuestas = Queue()
+        datos_por_indice, errores = {}, {}
+        lanzados = pendientes = 0
+
+        def lanzar():
+            nonlocal lanzados, pendientes
+            gevent.spawn(self._correr, lanzados, symbols, prioridad, respuestas)
+            lanzados += 1
+            pendientes += 1
+
+        lanzar()
+        while pendientes:
+            quedan = lanzados < len(self.proveedores)
+            cubrir = quedan and prioridad in self.cubiertas
+            try:
+                indice, datos, error = respuestas.get(
+                    timeout=self._espera(self.proveedores[lanzados - 1]) if cubrir else None
+                )
+            except Empty:
+                COBERTURAS_PROVEEDOR.sumar(proveedor=self.proveedores[lanzados].nombre)
+                lanzar()
+                continue
+            pendientes -= 1
+            if error is None and valida(datos, symbols):
+                return datos
+            if error is None:
+                datos_por_indice[indice] = datos
+            else:
+                errores[indice] = error
+            if not pendientes and quedan:
+                lanzar()
+
+        # Ninguno sirvió: vale lo que dijo el de mayor preferencia
+        primero = min([*datos_por_indice, *errores])
+        if primero in errores:
+            raise errores[primero]
+        return datos_por_indice[primero]
+
+    def estadisticas(self):
+        return {nombre: latencias.estadisticas() for nombre, latencias in self.latencias.items()}
@@ -0,0 +1,96 @@
+import threading
+from datetime import datetime
+
+import gevent
+from gevent.pool import Pool
+
+
+class Refrescador:
+    """Refresca en segundo plano los precios de las acciones en cartera.
+
+    Cada ciclo pide a `simbolos_vencidos()` los símbolos que están por
+    vencer y los refresca por lotes con `refrescar(lote)`, de a
+    `concurrencia` lotes a la vez y con una pausa entre lotes para repartir
+    las llamadas a la API. `solicitar()` permite que una petición que sirvió
+    un precio viejo pida su refresco sin esperarlo.
+    """
+
+    def __init__(self, simbolos_vencidos, refrescar, intervalo=60, concurrencia=2,
+                 tamano_lote=50, pausa=1.0):
+        self.simbolos_vencidos = simbolos_vencidos
+        self.refrescar = refrescar
+        self.intervalo = intervalo
+        self.concurrencia = concurrencia
+        self.tamano_lote = tamano_lote
+        self.pausa = pausa
+        self._en_curso = set()
+        self._lock = threading.Lock()
+        self.ciclos = 0
+        self.refrescados = 0
+        self.errores = 0
+        self.ultimo_ciclo = None
+
+    def en_curso(self, symbol):
+        with self._lock:
+            return symbol in self._en_curso
+
+    def _reservar(self, symbols):
+        # Marca como en curso los que no lo estaban y devuelve solo esos
+        with self._lock:
+            nuevos = [s for s in symbols if s not in self._en_curso]
+            self._en_curso.update(nuevos)
+            return nuevos
+
+    def _refrescar_lote(self, lote):
+        try:
+            self.refrescados += len(self.refrescar(lote) or ())
+        except Exception:
+            self.errores += 1
+        finally:
+            with self._lock:
+                self._en_curso.difference_update(lote)
+
+    def solicitar(self, symbols):
+        lote = self._reservar(symbols)
+        if lote:
+            gevent.spawn(self._refrescar_lote, lote)
+        return lote
+
+    def ciclo(self):
+        symbols = self._reservar(self.simbolos_vencidos())
+        pool = Pool(self.concurrencia)
+        lanzados = 0
+        try:
+            for i in range(0, len(symbols), self.tamano_lote):
+                if i:
+                    gevent.sleep(self.pausa)
+                pool.spawn(self._refrescar_lote, symbols[i:i + self.tamano_lote])
+                lanzados = i + self.tamano_lote
+            pool.join()
+        finally:
+            # Si el ciclo se cortó, los lotes no lanzados dejan de estar en curso
+            with self._lock:
+                self._en_curso.difference_update(symbols[lanzados:])
+        self.ciclos += 1
+        self.ultimo_ciclo = datetime.now()
+
+    def ejecutar(self):
+        while True:
+            try:
+                self.ciclo()
+            except Exception:
+                self.errores += 1
+            gevent.sleep(self.intervalo)
+
+    def estadisticas(self):
+        with self._lock:
+            en_curso = len(self._en_curso)
+        return {
+            "intervalo": self.intervalo,
+            "concurrencia": self.concurrencia,
+            "ciclos": self.ciclos,
+            "simbolos_refrescados": self.refrescados,
+            "errores": self.errores,
+            "en_curso": en_curso,
+            "ultimo_ciclo": self.ultimo_ciclo.isoformat() if self.ultimo_ciclo else None,
+        }
@@ -0,0 +1,407 @@
+import threading
+from collections import OrderedDict
+from datetime import date
+
+import numpy as np
+
+import base_datos
+import carteras
+import historico
+import libro
+
+# Valor diario de cada cartera (días corridos, con el último cierre conocido
+# en fines de semana y feriados). indice acumula el rendimiento ponderado por
+# tiempo, así que un día se calcula solo con la fila anterior
+ESQUEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS serie_cartera (
+        cartera_id INTEGER NOT NULL,
+        dia INTEGER NOT NULL,
+        valor REAL NOT NULL,
+        aporte REAL NOT NULL,
+        invertido REAL NOT NULL,
+        indice REAL NOT NULL,
+        PRIMARY KEY (cartera_id, dia)
+    ) WITHOUT ROWID
+    """,
+    # Hasta qué compra, qué venta y qué cambio de cierres está al día la
+    # serie de cada cartera
+    """
+    CREATE TABLE IF NOT EXISTS serie_cartera_estado (
+        cartera_id INTEGER PRIMARY KEY,
+        ultima_compra INTEGER NOT NULL,
+        ultima_venta INTEGER NOT NULL,
+        ultimo_cambio INTEGER NOT NULL
+    )
+    """,
+)
+
+# Días hacia atrás en los que se busca el último cierre anterior a la serie
+DIAS_ARRASTRE = 31
+# Símbolos que se valúan juntos al recalcular: las matrices de cantidades,
+# costos y precios ocupan días × este número, no días × símbolos
+COLUMNAS_POR_BLOQUE = 64
+
+
+def inicializar(conn):
+    historico.inicializar(conn)
+    columnas = {fila[1] for fila in conn.execute("PRAGMA table_info(serie_cartera)")}
+    estado = {fila[1] for fila in conn.execute("PRAGMA table_info(serie_cartera_estado)")}
+    if (columnas and "cartera_id" not in columnas) or (estado and "ultima_venta" not in estado):
+        # Serie de antes de las carteras o de las ventas: se deriva del
+        # historial, se recalcula
+        conn.execute("DROP TABLE IF EXISTS serie_cartera")
+        conn.execute("DROP TABLE IF EXISTS serie_cartera_estado")
+    for sentencia in ESQUEMA:
+        conn.execute(sentencia)
+
+
+def version(conn, cartera_id=carteras.PRINCIPAL):
+    # (última compra y última venta de la cartera, último cambio de cierres):
+    # tres búsquedas en índices
+    compra = conn.execute(
+        "SELECT MAX(id) FROM compras WHERE cartera_id = ?", (cartera_id,)
+    ).fetchone()[0]
+    venta = conn.execute(
+        "SELECT MAX(id) FROM historial_ventas WHERE cartera_id = ?", (cartera_id,)
+    ).fetchone()[0]
+    cambio = conn.execute("SELECT MAX(id) FROM precios_diarios_cambios").fetchone()[0]
+    return compra or 0, venta or 0, cambio or 0
+
+
+def _pendiente_desde(conn, cartera_id, ultima_compra, ultima_venta, ultimo_cambio):
+    # Primer día afectado por compras, ventas o cierres nuevos desde la última vez
+    dias = []
+    compra = conn.execute(
+        "SELECT MIN(dia) FROM compras WHERE cartera_id = ? AND id > ?",
+        (cartera_id, ultima_compra)
+    ).fetchone()[0]
+    if compra is not None:
+        dias.append(compra)
+    venta = conn.execute(
+        "SELECT MIN(fecha_venta) FROM historial_ventas WHERE cartera_id = ? AND id > ?",
+        (cartera_id, ultima_venta)
+    ).fetchone()[0]
+    if venta:
+        dias.append(historico.a_dia(date.fromisoformat(venta)))
+    cambio = conn.execute(
+        "SELECT MIN(dia) FROM precios_diarios_cambios WHERE id > ?", (ultimo_cambio,)
+    ).fetchone()[0]
+    if cambio is not None:
+        dias.append(cambio)
+    return min(dias) if dias else None
+
+
+def actualizar(conn, cartera_id=carteras.PRINCIPAL):
+    """Pone al día la serie de la cartera recalculando solo desde el primer día afectado.
+
+    Debe llamarse dentro de base_datos.escritura(). Devuelve el primer día
+    recalculado (date) o None si no había nada nuevo.
+    """
+    return guardar(conn, cartera_id, pendiente(conn, cartera_id))
+
+
+def pendiente(conn, cartera_id=carteras.PRINCIPAL):
+    """Calcula lo que le falta a la serie sin escribir nada.
+
+    Alcanza con una conexión de lectura. Devuelve un dict con la versión
+    que se leyó, el día desde el que se reemplaza la serie (None si no
+    cambia) y las filas nuevas, para guardar() dentro de una escritura.
+    """
+    estado = conn.execute(
+        "SELECT ultima_compra, ultima_venta, ultimo_cambio FROM serie_cartera_estado "
+        "WHERE cartera_id = ?",
+        (cartera_id,)
+    ).fetchone()
+    actual = version(conn, cartera_id)
+    if estado is None:
+        desde = 0
+    else:
+        desde = _pendiente_desde(conn, cartera_id, *estado)
+        ultimo = conn.execute(
+            "SELECT MAX(dia) FROM serie_cartera WHERE cartera_id = ?", (cartera_id,)
+        ).fetchone()[0]
+        # Cierres de días posteriores al último calculado alargan la serie
+        if desde is not None and ultimo is not None:
+            desde = min(desde, ultimo + 1)
+
+    cambio = {"version": actual, "desde": None, "filas": [], "recalculado": None,
+              "al_dia": estado is not None and tuple(estado) == actual}
+    if desde is not None:
+        cambio.update(_recalcular(conn, cartera_id, desde))
+    return cambio
+
+
+def guardar(conn, cartera_id, cambio):
+    # Reemplaza el tramo recalculado por pendiente(); devuelve su primer día
+    if cambio["desde"] is not None:
+        conn.execute(
+            "DELETE FROM serie_cartera WHERE cartera_id = ? AND dia >= ?", (cartera_id, cambio["desde"])
+        )
+        conn.executemany(
+            """
+            INSERT INTO serie_cartera (cartera_id, dia, valor, aporte, invertido, indice)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            cambio["filas"]
+        )
+    conn.execute(
+        "REPLACE INTO serie_cartera_estado (cartera_id, ultima_compra, ultima_venta, ultimo_cambio) "
+        "VALUES (?, ?, ?, ?)",
+        (cartera_id, *cambio["version"])
+    )
+    # Los cambios que ya aplicaron todas las carteras con serie no se vuelven a mirar
+    conn.execute(
+        "DELETE FROM precios_diarios_cambios "
+        "WHERE id < (SELECT MIN(ultimo_cambio) FROM serie_cartera_estado)"
+    )
+    return cambio["recalculado"]
+
+
+def _valores(conn, symbols, totales, movimientos, inicio, fin):
+    # Valor de `symbols` en cada día de inicio a fin. movimientos:
+    # {symbol: [(día, cantidad, costo)]} del tramo; totales: {symbol:
+    # (cantidad, costo)} de hoy
+    dias = fin - inicio + 1
+    cantidades = np.zeros((dias, len(symbols)))
+    costos = np.zeros((dias, len(symbols)))
+    for j, symbol in enumerate(symbols):
+        cantidades[0, j], costos[0, j] = totales.get(symbol, (0, 0.0))
+        # Cada movimiento del tramo se resta del comienzo y se suma el día en que ocurrió
+        for dia, cantidad, valor in movimientos.get(symbol, ()):
+            cantidades[0, j] -= cantidad
+            costos[0, j] -= valor
+            cantidades[dia - inicio, j] += cantidad
+            costos[dia - inicio, j] += valor
+    cantidades = np.cumsum(cantidades, axis=0)
+    costos = np.cumsum(costos, axis=0)
+
+    # Cierres de cada día, arrastrando el último conocido
+    arrastre = inicio - DIAS_ARRASTRE
+    columna = {symbol: j for j, symbol in enumerate(symbols)}
+    precios = np.full((fin - arrastre + 1, len(symbols)), np.nan)
+    series = historico.leer(conn, symbols, historico.a_fecha(arrastre), historico.a_fecha(fin))
+    for symbol, (fechas, cierres) in series.items():
+        filas = (fechas - np.datetime64(historico.EPOCA)).astype(np.int64) - arrastre
+        precios[filas, columna[symbol]] = cierres
+    conocidos = np.where(np.isnan(precios), 0, np.arange(len(precios))[:, None])
+    precios = np.take_along_axis(precios, np.maximum.accumulate(conocidos, axis=0), axis=0)
+    precios = precios[inicio - arrastre:]
+
+    # Sin ningún cierre todavía, la posición vale lo que costó
+    return np.where(np.isnan(precios), costos, cantidades * precios).sum(axis=1)
+
+
+def _recalcular(conn, cartera_id, desde):
+    # Solo lee: devuelve desde, filas y recalculado para pendiente()
+    primera = conn.execute(
+        "SELECT MIN(dia) FROM compras WHERE cartera_id = ?", (cartera_id,)
+    ).fetchone()[0]
+    if primera is None:
+        # Sin compras no hay serie: se borra entera
+        return {"desde": 0}
+    inicio = max(desde, primera)
+
+    # Las tenencias al empezar el tramo salen de posiciones (los totales de
+    # hoy) menos los movimientos del tramo: no se recorre el historial
+    # anterior. Una venta resta acciones y el costo asignado, y su importe
+    # es un retiro: (día, symbol, cantidad, costo, aporte)
+    fecha_inicio = historico.a_fecha(inicio).isoformat()
+    movimientos = conn.execute(
+        f"""
+        SELECT dia, symbol, cantidad, cantidad * precio_micros * 1.0 / {libro.ESCALA},
+               cantidad * precio_micros * 1.0 / {libro.ESCALA}
+        FROM compras WHERE cartera_id = ? AND dia >= ?
+        UNION ALL
+        SELECT {libro.DIA_SQL.format("fecha_venta")}, symbol, -cantidad, -costo, -cantidad * precio_venta
+        FROM historial_ventas WHERE cartera_id = ? AND fecha_venta >= ?
+        """,
+        (cartera_id, inicio, cartera_id, fecha_inicio)
+    ).fetchall()
+    totales = {s: (c, v) for s, c, v in conn.execute(
+        "SELECT symbol, cantidad_total, valor_usd_total FROM posiciones WHERE cartera_id = ?",
+        (cartera_id,)
+    )}
+    por_symbol = {}
+    for dia, symbol, cantidad, valor, _ in movimientos:
+        por_symbol.setdefault(symbol, []).append((dia, cantidad, valor))
+    symbols = sorted(set(totales) | set(por_symbol))
+
+    ultimos = [historico.ultima_fecha(conn, symbol) for symbol in symbols]
+    ultimo_movimiento = conn.execute(
+        f"""
+        SELECT MAX(dia) FROM (
+            SELECT MAX(dia) AS dia FROM compras WHERE cartera_id = ?
+            UNION ALL
+            SELECT {libro.DIA_SQL.format("MAX(fecha_venta)")} FROM historial_ventas WHERE cartera_id = ?
+        )
+        """,
+        (cartera_id, cartera_id)
+    ).fetchone()[0]
+    fin = max([historico.a_dia(f) for f in ultimos if f] + [ultimo_movimiento])
+    if fin < inicio:
+        return {}
+
+    anterior = conn.execute(
+        "SELECT valor, invertido, indice FROM serie_cartera WHERE cartera_id = ? AND dia = ?",
+        (cartera_id, inicio - 1)
+    ).fetchone() or (0.0, 0.0, 1.0)
+    valor_anterior, invertido_anterior, indice_anterior = anterior
+
+    dias = fin - inicio + 1
+    aportes = np.zeros(dias)
+    for dia, _, _, _, aporte in movimientos:
+        aportes[dia - inicio] += aporte
+    valores = np.zeros(dias)
+    for i in range(0, len(symbols), COLUMNAS_POR_BLOQUE):
+        valores += _valores(conn, symbols[i:i + COLUMNAS_POR_BLOQUE], totales, por_symbol, inicio, fin)
+
+    invertido = invertido_anterior + np.cumsum(aportes)
+    previos = np.concatenate(([valor_anterior], valores[:-1]))
+    # Compras y ventas entran al final del día: el rendimiento del día no las cuenta
+    with np.errstate(divide="ignore", invalid="ignore"):
+        factores = np.where(previos > 0, (valores - aportes) / previos, 1.0)
+    indices = indice_anterior * np.cumprod(factores)
+
+    filas = list(zip([cartera_id] * dias, range(inicio, fin + 1), valores.tolist(),
+                     aportes.tolist(), invertido.tolist(), indices.tolist()))
+    return {"desde": inicio, "filas": filas, "recalculado": historico.a_fecha(inicio)}
+
+
+def leer_serie(conn, cartera_id=carteras.PRINCIPAL):
+    filas = conn.execute(
+        "SELECT dia, valor, aporte, invertido, indice FROM serie_cartera "
+        "WHERE cartera_id = ? ORDER BY dia",
+        (cartera_id,)
+    ).fetchall()
+    if not filas:
+        return None
+    dias, valores, aportes, invertido, indices = (np.array(c) for c in zip(*filas))
+    return {
+        "fechas": dias.astype("datetime64[D]"),
+        "valores": valores,
+        "aportes": aportes,
+        "invertido": invertido,
+        "indices": indices,
+    }
+
+
+def tasa_interna(dias, flujos, periodo=365, minimo=-0.9999, maximo=100.0, iteraciones=200):
+    # Tasa por `periodo` días que lleva a cero el valor futuro de los flujos
+    # (por bisección); None si no hay cambio de signo en el intervalo
+    anios = (dias.max() - dias) / periodo
+
+    def valor_futuro(tasa):
+        return float(np.sum(flujos * (1 + tasa) ** anios))
+
+    bajo, alto = valor_futuro(minimo), valor_futuro(maximo)
+    if np.sign(bajo) == np.sign(alto):
+        return None
+    for _ in range(iteraciones):
+        medio = (minimo + maximo) / 2
+        valor = valor_futuro(medio)
+        if np.sign(valor) == np.sign(bajo):
+            minimo, bajo = medio, valor
+        else:
+            maximo = medio
+    return (minimo + maximo) / 2
+
+
+def resumen(conn, cartera_id=carteras.PRINCIPAL):
+    """Serie de valor e invertido con los rendimientos de toda la cartera.
+
+    twr es el rendimiento ponderado por tiempo acumulado y mwr el ponderado
+    por dinero (la TIR de los aportes contra el valor final): anual si la
+    serie cubre al menos un año y del período completo si no.
+    """
+    serie = leer_serie(conn, cartera_id)
+    if serie is None:
+        return {"fechas": [], "valores": [], "invertido": [], "twr": None, "mwr": None}
+
+    dias = serie["fechas"].astype(np.int64)
+    con_aporte = serie["aportes"] != 0
+    # Aportes como salidas y el valor final como entrada del último día
+    flujos = np.append(-serie["aportes"][con_aporte], serie["valores"][-1])
+    dias_flujos = np.append(dias[con_aporte], dias[-1])
+    duracion = int(dias[-1] - dias[0])
+    periodo = 365 if duracion >= 365 else max(duracion, 1)
+    mwr = tasa_interna(dias_flujos, flujos, periodo) if con_aporte.any() else None
+
+    return {
+        "fechas": serie["fechas"].astype(str).tolist(),
+        "valores": np.round(serie["valores"], 2).tolist(),
+        "invertido": np.round(serie["invertido"], 2).tolist(),
+        "twr": round(float(serie["indices"][-1] - 1), 6),
+        "mwr": round(mwr, 6) if mwr is not None else None,
+    }
+
+
+class Rendimientos:
+    """Memoriza el resumen de cada cartera por su versión.
+
+    Mientras no haya compras, ventas ni cierres nuevos, pedirlo cuesta tres
+    búsquedas en índices; si los hay, se calcula el tramo afectado con una
+    conexión de lectura y solo se toma el bloqueo de escritura para guardar
+    ese tramo. Cada cartera tiene su propio candado: un pedido espera solo
+    al cálculo de su cartera, no al de las demás. Se guardan las
+    `capacidad` carteras pedidas más recientemente.
+    """
+
+    def __init__(self, capacidad=256):
+        self.capacidad = capacidad
+        self._memo = OrderedDict()  # cartera_id -> (versión, resumen)
+        self._candados = {}  # cartera_id -> Lock del cálculo en curso
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.calculos = 0
+
+    def _memorizado(self, cartera_id, actual):
+        with self._lock:
+            guardado = self._memo.get(cartera_id)
+            if guardado is None or guardado[0] != actual:
+                return None
+            self._memo.move_to_end(cartera_id)
+            self.aciertos += 1
+            return guardado[1]
+
+    def _candado(self, cartera_id):
+        with self._lock:
+            return self._candados.setdefault(cartera_id, threading.Lock())
+
+    def obtener(self, cartera_id=carteras.PRINCIPAL):
+        with base_datos.conexion() as conn:
+            actual = version(conn, cartera_id)
+        resultado = self._memorizado(cartera_id, actual)
+        if resultado is not None:
+            return resultado
+
+        # Un solo cálculo a la vez por cartera; los que esperaban usan su resultado
+        with self._candado(cartera_id):
+            resultado = self._memorizado(cartera_id, actual)
+            if resultado is not None:
+                return resultado
+            with base_datos.conexion() as conn:
+                # Una transacción de lectura: todas las consultas ven la misma foto
+                conn.execute("BEGIN")
+                try:
+                    cambio = pendiente(conn, cartera_id)
+                finally:
+                    conn.execute("COMMIT")
+            if cambio["desde"] is not None or not cambio["al_dia"]:
+                with base_datos.escritura() as conn:
+                    guardar(conn, cartera_id, cambio)
+            with base_datos.conexion() as conn:
+                resultado = resumen(conn, cartera_id)
+
+            with self._lock:
+                self._memo[cartera_id] = (cambio["version"], resultado)
+                self._memo.move_to_end(cartera_id)
+                while len(self._memo) > self.capacidad:
+                    self._memo.popitem(last=False)
+                self.calculos += 1
+            return resultado
+
+    def limpiar(self):
+        with self._lock:
+            self._memo.clear()
+            self.aciertos = self.calculos = 0
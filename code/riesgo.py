@@ -0,0 +1,247 @@
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+
+import numpy as np
+
+import base_datos
+import carteras
+import historico
+import rendimiento
+
+# Ruedas por año para anualizar la volatilidad diaria
+RUEDAS_POR_ANIO = 252
+# Por defecto: último año de cierres, volatilidad de 21 ruedas (un mes) y
+# beta contra el S&P 500
+DIAS_POR_DEFECTO = 365
+VENTANA_POR_DEFECTO = 21
+BENCHMARK_POR_DEFECTO = "SPY"
+# Rendimientos en común que hacen falta para una covarianza o una beta
+MIN_OBSERVACIONES = 3
+DECIMALES = 6
+
+
+def matriz_precios(series, symbols):
+    """Cierres de `symbols` alineados por rueda, arrastrando el último conocido.
+
+    Las ruedas son los días con algún cierre entre todas las series, así
+    que los fines de semana no agregan rendimientos en cero. Devuelve
+    (fechas, precios) con una columna por símbolo; antes del primer cierre
+    de un símbolo su columna queda en NaN.
+    """
+    if not series:
+        return np.array([], dtype="datetime64[D]"), np.empty((0, len(symbols)))
+    fechas = np.unique(np.concatenate([f for f, _ in series.values()]))
+    precios = np.full((len(fechas), len(symbols)), np.nan)
+    for j, symbol in enumerate(symbols):
+        if symbol in series:
+            f, cierres = series[symbol]
+            precios[np.searchsorted(fechas, f), j] = cierres
+    conocidos = np.where(np.isnan(precios), 0, np.arange(len(precios))[:, None])
+    precios = np.take_along_axis(precios, np.maximum.accumulate(conocidos, axis=0), axis=0)
+    return fechas, precios
+
+
+def rendimientos_diarios(precios):
+    # Rendimiento simple de cada rueda; NaN donde falta alguno de los dos cierres
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return precios[1:] / precios[:-1] - 1
+
+
+def covarianzas(rendimientos):
+    """Covarianza y correlación de a pares, con las ruedas que tienen ambos.
+
+    Todo sale de productos de matrices sobre los rendimientos con los NaN
+    en cero y la máscara de los válidos, sin recorrer los pares en Python.
+    """
+    validos = ~np.isnan(rendimientos)
+    m = validos.astype(np.float64)
+    x = np.where(validos, rendimientos, 0.0)
+    n = m.T @ m
+    # suma[i, j]: suma de i en las ruedas en que también hay j
+    suma = x.T @ m
+    cuadrados = (x * x).T @ m
+    productos = x.T @ x
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cov = (productos - suma * suma.T / n) / (n - 1)
+        var = np.maximum((cuadrados - suma * suma / n) / (n - 1), 0)
+        corr = cov / np.sqrt(var * var.T)
+    insuficientes = n < MIN_OBSERVACIONES
+    cov[insuficientes] = np.nan
+    corr[insuficientes] = np.nan
+    return cov, np.clip(corr, -1, 1)
+
+
+def volatilidad_movil(rendimientos, ventana):
+    # Desvío anualizado de las últimas `ventana` ruedas, por columna, con
+    # sumas acumuladas; NaN hasta completar la primera ventana sin huecos
+    rendimientos = np.asarray(rendimientos, dtype=np.float64)
+    if rendimientos.ndim == 1:
+        return volatilidad_movil(rendimientos[:, None], ventana)[:, 0]
+    if len(rendimientos) < ventana:
+        return np.full(rendimientos.shape, np.nan)
+    validos = ~np.isnan(rendimientos)
+    x = np.where(validos, rendimientos, 0.0)
+    ceros = np.zeros((1, x.shape[1]))
+    suma = np.concatenate((ceros, np.cumsum(x, axis=0)))
+    cuadrados = np.concatenate((ceros, np.cumsum(x * x, axis=0)))
+    cuenta = np.concatenate((ceros, np.cumsum(validos, axis=0)))
+    s = suma[ventana:] - suma[:-ventana]
+    s2 = cuadrados[ventana:] - cuadrados[:-ventana]
+    k = cuenta[ventana:] - cuenta[:-ventana]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        var = np.maximum((s2 - s * s / k) / (k - 1), 0)
+    vol = np.sqrt(var * RUEDAS_POR_ANIO)
+    vol[k < ventana] = np.nan
+    return np.concatenate((np.full((ventana - 1, x.shape[1]), np.nan), vol))
+
+
+def maxima_caida(valores):
+    # Mayor caída desde un máximo anterior por columna (<= 0) y la fila en
+    # que se tocó el fondo; NaN y -1 para las columnas sin datos
+    valores = np.asarray(valores, dtype=np.float64)
+    if valores.ndim == 1:
+        caida, fondo = maxima_caida(valores[:, None])
+        return caida[0], fondo[0]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        caidas = valores / np.fmax.accumulate(valores, axis=0) - 1
+    caidas = np.where(np.isnan(caidas), 0.0, caidas)
+    fondo = caidas.argmin(axis=0) if len(caidas) else np.zeros(valores.shape[1], dtype=int)
+    sin_datos = np.isnan(valores).all(axis=0)
+    caida = caidas.min(axis=0) if len(caidas) else np.zeros(valores.shape[1])
+    return np.where(sin_datos, np.nan, caida), np.where(sin_datos, -1, fondo)
+
+
+def beta(rendimientos, referencia):
+    # Beta de cada columna contra `referencia`: covarianza sobre varianza de
+    # la referencia, ambas en las ruedas en que están las dos
+    rendimientos = np.asarray(rendimientos, dtype=np.float64)
+    validos = ~np.isnan(rendimientos) & ~np.isnan(referencia)[:, None]
+    n = validos.sum(axis=0)
+    x = np.where(validos, rendimientos, 0.0)
+    r = np.where(validos, referencia[:, None], 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cov = ((x * r).sum(axis=0) - x.sum(axis=0) * r.sum(axis=0) / n) / (n - 1)
+        var = ((r * r).sum(axis=0) - r.sum(axis=0) ** 2 / n) / (n - 1)
+        betas = cov / var
+    return np.where(n < MIN_OBSERVACIONES, np.nan, betas)
+
+
+def _lista(valores):
+    # Redondeado y con None en lugar de NaN, para JSON
+    redondeados = np.round(valores, DECIMALES)
+    if redondeados.ndim > 1:
+        return [_lista(fila) for fila in redondeados]
+    return [None if v != v else v for v in redondeados.tolist()]
+
+
+def _numero(valor):
+    return None if valor is None or valor != valor else round(float(valor), DECIMALES)
+
+
+def calcular(conn, cartera_id=carteras.PRINCIPAL, benchmark=BENCHMARK_POR_DEFECTO,
+             dias=DIAS_POR_DEFECTO, ventana=VENTANA_POR_DEFECTO, hasta=None):
+    """Volatilidad, correlaciones, beta y máxima caída de la cartera.
+
+    Se usan los cierres de los últimos `dias` días hasta `hasta` (por
+    defecto, hoy) de las acciones en cartera y del `benchmark`. La cartera
+    pesa cada acción por su valor al último cierre.
+    """
+    posiciones = conn.execute(
+        "SELECT symbol, cantidad_total FROM posiciones WHERE cartera_id = ? AND cantidad_total > 0 "
+        "ORDER BY symbol",
+        (cartera_id,)
+    ).fetchall()
+    hasta = hasta or date.today()
+    desde = hasta - timedelta(days=dias)
+    series = historico.leer(conn, [s for s, _ in posiciones] + [benchmark], desde, hasta)
+    con_datos = [(s, c) for s, c in posiciones if s in series]
+    symbols = [s for s, _ in con_datos]
+    cantidades = np.array([c for _, c in con_datos], dtype=np.float64)
+
+    # El benchmark va en la última columna, en las mismas ruedas que las acciones
+    fechas, precios = matriz_precios(series, symbols + [benchmark])
+    todos = rendimientos_diarios(precios)
+    precios, rendimientos, referencia = precios[:, :-1], todos[:, :-1], todos[:, -1]
+    cov, corr = covarianzas(rendimientos)
+
+    # Rendimiento de la cartera en cada rueda con los pesos de hoy, entre
+    # las acciones que ya cotizaban
+    pesos = cantidades * precios[-1] if len(precios) else cantidades
+    validos = ~np.isnan(rendimientos)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cartera = np.where(validos, rendimientos, 0.0) @ pesos / (validos @ pesos)
+    indice = np.cumprod(np.concatenate(([1.0], 1 + np.nan_to_num(cartera))))[:len(fechas)]
+
+    movil = volatilidad_movil(np.column_stack((rendimientos, cartera)), ventana)
+    caidas, fondos = maxima_caida(np.column_stack((precios, indice)))
+    betas = beta(np.column_stack((rendimientos, cartera)), referencia)
+
+    fondo = int(fondos[-1])
+    return {
+        "simbolos": symbols,
+        "sin_datos": [s for s, _ in posiciones if s not in series],
+        "desde": desde.isoformat(),
+        "hasta": hasta.isoformat(),
+        "benchmark": benchmark if benchmark in series else None,
+        "volatilidad": {
+            "ventana": ventana,
+            "fechas": fechas[1:].astype(str).tolist(),
+            "cartera": _lista(movil[:, -1]),
+            "por_simbolo": dict(zip(symbols, _lista(movil[-1, :-1]) if len(movil) else [])),
+        },
+        "covarianza": _lista(cov),
+        "correlacion": _lista(corr),
+        "beta": {
+            "cartera": _numero(betas[-1]),
+            "por_simbolo": dict(zip(symbols, _lista(betas[:-1]))),
+        },
+        "maxima_caida": {
+            "cartera": _numero(caidas[-1]),
+            "fondo": str(fechas[fondo]) if fondo >= 0 else None,
+            "por_simbolo": dict(zip(symbols, _lista(caidas[:-1]))),
+        },
+    }
+
+
+class Riesgos:
+    """Memoriza el análisis de riesgo por cartera, parámetros y versión.
+
+    La versión es la de rendimiento.version: última compra y venta de la
+    cartera y último cambio de cierres. Mientras no cambie, pedirlo cuesta
+    tres búsquedas en índices. Se guardan las `capacidad` consultas pedidas
+    más recientemente.
+    """
+
+    def __init__(self, capacidad=64):
+        self.capacidad = capacidad
+        self._memo = OrderedDict()  # (cartera_id, parámetros) -> (versión, resultado)
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.calculos = 0
+
+    def obtener(self, cartera_id=carteras.PRINCIPAL, benchmark=BENCHMARK_POR_DEFECTO,
+                dias=DIAS_POR_DEFECTO, ventana=VENTANA_POR_DEFECTO):
+        clave = (cartera_id, benchmark, dias, ventana, date.today())
+        with base_datos.conexion() as conn:
+            actual = rendimiento.version(conn, cartera_id)
+            with self._lock:
+                guardado = self._memo.get(clave)
+                if guardado is not None and guardado[0] == actual:
+                    self._memo.move_to_end(clave)
+                    self.aciertos += 1
+                    return guardado[1]
+            resultado = calcular(conn, cartera_id, benchmark, dias, ventana, clave[-1])
+
+        with self._lock:
+            self._memo[clave] = (actual, resultado)
+            self._memo.move_to_end(clave)
+            while len(self._memo) > self.capacidad:
+                self._memo.popitem(last=False)
+            self.calculos += 1
+        return resultado
+
+    def limpiar(self):
+        with self._lock:
+            self._memo.clear()
+            self.aciertos = self.calculos = 0
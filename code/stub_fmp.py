@@ -0,0 +1,134 @@
+import argparse
+import itertools
+import json
+import random
+import string
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def simbolos_sinteticos(cantidad):
+    # AAA, AAB, ...: solo letras, como exige validar_symbol
+    letras = itertools.product(string.ascii_uppercase, repeat=3)
+    return ["".join(s) for s in itertools.islice(letras, cantidad)]
+
+
+def precio_de(symbol):
+    # Estable por símbolo, entre 10 y 510 dólares
+    return round(10 + zlib.crc32(symbol.encode()) % 50000 / 100, 2)
+
+
+class _Manejador(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        servidor = self.server
+        url = urlparse(self.path)
+        partes = url.path.rstrip("/").split("/")
+        servidor.contar(partes[-2] if partes[-1].isupper() else partes[-1])
+
+        if servidor.latencia:
+            time.sleep(servidor.latencia)
+        estado, cuerpo, cabeceras = servidor.responder(partes, parse_qs(url.query))
+
+        datos = json.dumps(cuerpo).encode()
+        self.send_response(estado)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(datos)))
+        for nombre, valor in cabeceras.items():
+            self.send_header(nombre, valor)
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def log_message(self, *args):
+        pass
+
+
+class ServidorFMP(ThreadingHTTPServer):
+    """Imitación local de /quote, /search y /stock/list de Financial Modeling Prep.
+
+    `latencia` se agrega a cada respuesta; `tasa_error` y `tasa_limite` son
+    las probabilidades de responder 503 o 429 (con Retry-After).
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", puerto=0, latencia=0.0, tasa_error=0.0,
+                 tasa_limite=0.0, simbolos=2000, semilla=0):
+        super().__init__((host, puerto), _Manejador)
+        self.latencia = latencia
+        self.tasa_error = tasa_error
+        self.tasa_limite = tasa_limite
+        self.catalogo = [
+            {"symbol": s, "name": f"{s} Corp", "price": precio_de(s)}
+            for s in simbolos_sinteticos(simbolos)
+        ]
+        self._azar = random.Random(semilla)
+        self._lock = threading.Lock()
+        self.pedidos = {}
+        self._hilo = None
+
+    @property
+    def url_base(self):
+        host, puerto = self.server_address[:2]
+        return f"http://{host}:{puerto}/api/v3"
+
+    def contar(self, ruta):
+        with self._lock:
+            self.pedidos[ruta] = self.pedidos.get(ruta, 0) + 1
+
+    def responder(self, partes, params):
+        with self._lock:
+            sorteo = self._azar.random()
+        if sorteo < self.tasa_limite:
+            return 429, {"Error Message": "Limit Reach"}, {"Retry-After": "1"}
+        if sorteo < self.tasa_limite + self.tasa_error:
+            return 503, {}, {}
+
+        if len(partes) >= 2 and partes[-2] == "quote":
+            symbols = [s for s in partes[-1].split(",") if s]
+            return 200, [{"symbol": s, "price": precio_de(s)} for s in symbols], {}
+        if partes[-1] == "search":
+            term = params.get("query", [""])[0].upper()
+            limite = int(params.get("limit", ["10"])[0])
+            encontrados = [
+                {"symbol": c["symbol"], "name": c["name"]}
+                for c in self.catalogo if c["symbol"].startswith(term)
+            ]
+            return 200, encontrados[:limite], {}
+        if partes[-2:] == ["stock", "list"]:
+            return 200, self.catalogo, {}
+        return 404, {"Error Message": "Not found"}, {}
+
+    def iniciar(self):
+        self._hilo = threading.Thread(target=self.serve_forever, args=(0.05,), daemon=True)
+        self._hilo.start()
+        return self
+
+    def detener(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor local que imita a la API de FMP")
+    parser.add_argument("--puerto", type=int, default=8001)
+    parser.add_argument("--latencia", type=float, default=0.0, help="segundos por respuesta")
+    parser.add_argument("--errores", type=float, default=0.0, help="proporción de 503")
+    parser.add_argument("--limite", type=float, default=0.0, help="proporción de 429")
+    args = parser.parse_args(argv)
+
+    servidor = ServidorFMP(puerto=args.puerto, latencia=args.latencia,
+                           tasa_error=args.errores, tasa_limite=args.limite)
+    print(f"FMP simulado en {servidor.url_base} (FMP_URL_BASE)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        servidor.server_close()
+
+
+if __name__ == "__main__":
+    main()
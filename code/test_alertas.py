@@ -0,0 +1,108 @@
+from datetime import datetime
+
+import pytest
+
+import alertas
+import base_datos
+import posiciones
+from alertas import Alertas, IndiceAlertas
+
+
+class _Notificador:
+    def __init__(self, falla=False):
+        self.eventos = []
+        self.falla = falla
+
+    def notificar(self, evento):
+        if self.falla:
+            raise ConnectionError("sin conexión")
+        self.eventos.append(evento)
+
+
+def _alerta(id_, symbol, tipo, umbral, valor=None):
+    return {"id": id_, "symbol": symbol, "tipo": tipo, "umbral": umbral,
+            "valor": umbral if valor is None else valor, "disparada": None}
+
+
+def test_indice_saca_solo_las_cruzadas():
+    """Test para verificar que un precio saca solo los umbrales que alcanza"""
+    indice = IndiceAlertas()
+    for id_, umbral in enumerate((110.0, 120.0, 130.0, 120.0), start=1):
+        indice.agregar(_alerta(id_, "AAPL", "sobre", umbral))
+    indice.agregar(_alerta(5, "AAPL", "bajo", 90.0))
+    indice.agregar(_alerta(6, "AAPL", "variacion", 80.0, valor=-20))
+    indice.agregar(_alerta(7, "MSFT", "sobre", 1.0))
+
+    assert indice.cruzadas("AAPL", 100.0) == []
+    assert [a["id"] for a in indice.cruzadas("AAPL", 120.0)] == [1, 2, 4]
+    assert indice.cruzadas("AAPL", 125.0) == []
+    assert [a["id"] for a in indice.cruzadas("AAPL", 85.0)] == [5]
+    assert [a["id"] for a in indice.cruzadas("AAPL", 50.0)] == [6]
+
+    assert indice.quitar(3)["umbral"] == 130.0
+    assert indice.quitar(3) is None
+    assert indice.cruzadas("AAPL", 500.0) == []
+    assert len(indice) == 1
+
+
+def test_crear_valida_y_usa_el_costo(db):
+    """Test para verificar los tipos y el umbral de la variación sobre el costo"""
+    with base_datos.escritura() as conn:
+        posiciones.inicializar(conn)
+        posiciones.registrar_compras(conn, [("2024-01-02", "AAPL", 10, 100.0),
+                                            ("2024-01-03", "AAPL", 10, 120.0)])
+        assert alertas.crear(conn, 1, "AAPL", "variacion", 10)["umbral"] == 121.0
+        assert alertas.crear(conn, 1, "AAPL", "Bajo", "95.5")["tipo"] == "bajo"
+        with pytest.raises(ValueError, match="posición abierta"):
+            alertas.crear(conn, 1, "MSFT", "variacion", -5)
+        for tipo, valor in (("sobre", 0), ("variacion", -100), ("otro", 1), ("sobre", "x"),
+                            (1, 1), (["sobre"], 1), ("sobre", [1])):
+            with pytest.raises(ValueError):
+                alertas.crear(conn, 1, "AAPL", tipo, valor)
+
+    with base_datos.conexion() as conn:
+        assert [a["id"] for a in alertas.listar(conn, 1)] == [1, 2]
+        assert alertas.listar(conn, 2) == []
+
+
+def test_dispara_una_vez_y_entrega_por_cola(db):
+    """Test para verificar el UPDATE condicional, la cola y la sincronización"""
+    with base_datos.escritura() as conn:
+        alertas.inicializar(conn)
+        sobre = alertas.crear(conn, 1, "AAPL", "sobre", 150)
+        alertas.crear(conn, 2, "AAPL", "bajo", 100)
+
+    notificador = _Notificador()
+    motor, otro_proceso = Alertas(notificador), Alertas(_Notificador())
+    assert motor.evaluar({"AAPL": 140.0}) == []
+    # Creada en otro proceso: llega al sincronizar
+    with base_datos.escritura() as conn:
+        alertas.crear(conn, 1, "MSFT", "sobre", 10)
+    assert motor.sincronizar() == 1
+
+    fecha = datetime(2025, 1, 2, 10, 0)
+    assert otro_proceso.evaluar({"AAPL": 151.0}, fecha)[0]["id"] == sobre["id"]
+    # El mismo precio visto por este proceso ya no la dispara
+    assert motor.evaluar({"AAPL": 151.0, "MSFT": 11.0}, fecha)[0]["symbol"] == "MSFT"
+    assert notificador.eventos == []
+
+    assert motor.entregar_pendientes() == 1
+    assert notificador.eventos[0]["precio_disparo"] == 11.0
+    with base_datos.conexion() as conn:
+        assert alertas.obtener(conn, sobre["id"])["disparada"] == "2025-01-02T10:00:00"
+    assert motor.estadisticas() == {
+        "pendientes": 1, "en_cola": 0, "disparadas": 1, "entregadas": 1, "errores": 0
+    }
+
+
+def test_error_del_notificador_no_corta_la_entrega(db):
+    """Test para verificar que una entrega fallida se cuenta y sigue con las demás"""
+    with base_datos.escritura() as conn:
+        alertas.inicializar(conn)
+        alertas.crear(conn, 1, "AAPL", "sobre", 1)
+        alertas.crear(conn, 1, "AAPL", "sobre", 2)
+    motor = Alertas(_Notificador(falla=True))
+
+    assert len(motor.evaluar({"AAPL": 3.0})) == 2
+    assert motor.entregar_pendientes() == 2
+    assert motor.estadisticas()["errores"] == 2
@@ -4,11 +4,45 @@ from flask import Flask
 from decimal import Decimal
 from unittest.mock import patch
 from dotenv import load_dotenv
+import api
+import base_datos
 from api import app,obtener_precio_actual, obtener_consolidacion
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from gevent.pywsgi import WSGIServer
 import sqlite3
 import os, requests
+import io
+import json
+import posiciones
+import historial
+import metricas
+import exportacion
+import historico
+import rendimiento
+import alertas
+from planificador import Cubeta
+
+@pytest.fixture(autouse=True)
+def limpiar_cache_precios(monkeypatch, db):
+    # La caché en memoria, el pool de conexiones y el circuito de la API son
+    # globales: cada prueba empieza sin precios guardados, sin conexiones
+    # (reales o simuladas) abiertas, con el circuito cerrado y usando una
+    # base temporal en lugar de precios.db
+    api.cache_precios.limpiar()
+    base_datos.pool.cerrar()
+    api.cliente.circuito.reiniciar()
+    api.indice_simbolos.limpiar()
+    api.cache_consolidacion.limpiar()
+    api.rendimientos.limpiar()
+    api.motor_alertas.limpiar()
+    api.riesgos.limpiar()
+    # Fichas de sobra y sin pausas de pruebas anteriores
+    monkeypatch.setattr(api.planificador, "cubeta", Cubeta(tasa=1000, capacidad=1000))
+    monkeypatch.setattr(api.cliente, "espera_base", 0)
+    yield
+    api.cache_precios.limpiar()
+    api.cache_consolidacion.limpiar()
+    base_datos.pool.cerrar()
 
 @pytest.fixture
 def client(monkeypatch):
@@ -30,14 +64,14 @@ def test_format_number():
         assert app.jinja_env.filters['format_number']('invalid') == '0.00'
 
 @patch('api.sqlite3.connect')
-@patch('api.requests.get')
+@patch('api.cliente.session.get')
 
 def test_obtener_precio_actual(mock_get, mock_connect):
     # Configuración del mock para la base de datos
     mock_cursor = mock_connect.return_value.cursor.return_value
     mock_cursor.fetchone.return_value = None  # Simula que no hay datos en caché
 
-    # Configuración del mock para requests.get
+    # Configuración del mock para la sesión HTTP
     mock_response = MagicMock()
     mock_response.status_code = 200
     mock_response.json.return_value = [{"price": 150.75}]
@@ -66,7 +100,7 @@ def test_precio_actual(client):
     assert response.json == {"error": "Símbolo no proporcionado"}
 
 # Pruebas para la ruta /buscar_simbolo
-@patch('api.requests.get')
+@patch('api.cliente.session.get')
 def test_buscar_simbolo(mock_get, client):
     mock_get.return_value.status_code = 200
     mock_get.return_value.json.return_value = [
@@ -100,15 +134,15 @@ def test_home(client):
     assert response.status_code == 302
 
 @patch('api.sqlite3.connect')
-@patch('api.obtener_precio_actual')
-def test_obtener_consolidacion(mock_obtener_precio, mock_connect):
+@patch('api.obtener_precios')
+def test_obtener_consolidacion(mock_obtener_precios, mock_connect):
     # Configura los mocks
     mock_cursor = mock_connect.return_value.cursor.return_value
     mock_cursor.fetchall.return_value = [
         ("AAPL", 10, Decimal("1507.50"), Decimal("150.75")),
         ("GOOG", 5, Decimal("14002.50"), Decimal("2800.50"))
     ]
-    mock_obtener_precio.side_effect = [Decimal("150.75"), Decimal("2800.50")]
+    mock_obtener_precios.return_value = {"AAPL": Decimal("150.75"), "GOOG": Decimal("2800.50")}
 
     # Llamada a la función
     consolidacion = obtener_consolidacion()
@@ -136,6 +170,59 @@ def test_obtener_consolidacion(mock_obtener_precio, mock_connect):
     ]
 
     assert consolidacion == esperado
+    # Los precios se piden una sola vez para todos los símbolos
+    mock_obtener_precios.assert_called_once_with(["AAPL", "GOOG"])
+
+@pytest.fixture
+def db_precios():
+    """Fixture con la tabla precios en la base temporal de la prueba"""
+    conn = sqlite3.connect(base_datos.pool.ruta)
+    conn.execute("CREATE TABLE precios (symbol TEXT PRIMARY KEY, precio REAL, fecha TEXT)")
+    conn.commit()
+    yield conn
+    conn.close()
+
+def test_obtener_precios_lote(db_precios):
+    """Test para verificar que los símbolos vencidos se piden en una sola llamada"""
+    reciente = datetime.now().isoformat()
+    vieja = (datetime.now() - timedelta(hours=2)).isoformat()
+    db_precios.executemany(
+        "INSERT INTO precios VALUES (?, ?, ?)",
+        [("AAPL", 150.0, reciente), ("MSFT", 300.0, vieja)]
+    )
+    db_precios.commit()
+
+    with patch('api.cliente.session.get') as mock_get:
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.json.return_value = [
+            {"symbol": "MSFT", "price": 310.0},
+            {"symbol": "GOOG", "price": 2800.5}
+        ]
+        precios = api.obtener_precios(["AAPL", "MSFT", "GOOG", "AAPL", "BRK.B"])
+
+    assert precios == {"AAPL": 150.0, "MSFT": 310.0, "GOOG": 2800.5}
+    mock_get.assert_called_once()
+    assert mock_get.call_args[0][0].endswith("/quote/MSFT,GOOG")
+    guardados = dict(db_precios.execute("SELECT symbol, precio FROM precios").fetchall())
+    assert guardados == {"AAPL": 150.0, "MSFT": 310.0, "GOOG": 2800.5}
+
+def test_obtener_precios_sin_lotes(db_precios):
+    """Test para verificar que si el lote falla se consulta símbolo por símbolo"""
+    def respuesta(url, **kwargs):
+        mock = Mock()
+        symbol = url.rsplit("/", 1)[1]
+        if "," in symbol:
+            mock.status_code = 403
+        else:
+            mock.status_code = 200
+            mock.json.return_value = [{"symbol": symbol, "price": 10.0}]
+        return mock
+
+    with patch('api.cliente.session.get', side_effect=respuesta) as mock_get:
+        precios = api.obtener_precios(["AAPL", "MSFT"])
+
+    assert precios == {"AAPL": 10.0, "MSFT": 10.0}
+    assert mock_get.call_count == 3
 
 #  OJO Test para API key
 def obtener_api_key():
@@ -310,7 +397,7 @@ def test_cache_expirado(mock_db, mock_response, symbol):
     mock_response.json.return_value = [{"price": nuevo_precio}]
     
     with patch('sqlite3.connect', return_value=mock_db), \
-         patch('requests.get', return_value=mock_response):
+         patch('api.cliente.session.get', return_value=mock_response):
         
         precio = obtener_precio_actual(symbol)
         
@@ -344,7 +431,7 @@ def test_datos_api_vacios(mock_response, mock_db):
     mock_response.json.return_value = []
 
     with patch('sqlite3.connect', return_value=mock_db), \
-         patch('requests.get', return_value=mock_response), \
+         patch('api.cliente.session.get', return_value=mock_response), \
          pytest.raises(ValueError, match="No se encontraron datos para este símbolo"):
         obtener_precio_actual("AAPL")
 
@@ -374,7 +461,7 @@ def test_cache_expirado(mock_db, mock_response, symbol):
     mock_response.json.return_value = [{"price": nuevo_precio}]
     
     with patch('sqlite3.connect', return_value=mock_db), \
-         patch('requests.get', return_value=mock_response):
+         patch('api.cliente.session.get', return_value=mock_response):
         
         precio = obtener_precio_actual(symbol)
         
@@ -405,7 +492,7 @@ def test_api_key_no_configurada():
 
 def test_error_timeout():
     """Test para verificar el manejo del error de timeout"""
-    with patch('requests.get') as mock_get:
+    with patch('api.cliente.session.get') as mock_get:
         # Simulamos un timeout
         mock_get.side_effect = requests.exceptions.Timeout()
         
@@ -418,7 +505,7 @@ def test_error_timeout():
 
 def test_error_conexion():
     """Test para verificar el manejo de errores de conexión"""
-    with patch('requests.get') as mock_get:
+    with patch('api.cliente.session.get') as mock_get:
         # Simulamos un error de conexión
         mock_get.side_effect = requests.exceptions.ConnectionError("Error de red")
         
@@ -429,7 +516,7 @@ def test_error_conexion():
 
 def test_error_valor():
     """Test para verificar el manejo de ValueError"""
-    with patch('requests.get') as mock_get:
+    with patch('api.cliente.session.get') as mock_get:
         # Simulamos una respuesta con error
         mock_response = Mock()
         mock_response.status_code = 400
@@ -442,7 +529,7 @@ def test_error_valor():
 
 def test_error_generico():
     """Test para verificar el manejo de excepciones genéricas"""
-    with patch('requests.get') as mock_get:
+    with patch('api.cliente.session.get') as mock_get:
         # Simulamos un error inesperado
         mock_get.side_effect = Exception("Error inesperado")
         
@@ -453,7 +540,7 @@ def test_error_generico():
 
 def test_buscar_simbolo_timeout():
    """Test para verificar manejo de timeout en búsqueda de símbolo"""
-   with patch('requests.get') as mock_get:
+   with patch('api.cliente.session.get') as mock_get:
        # Simular timeout
        mock_get.side_effect = requests.exceptions.Timeout()
        
@@ -466,7 +553,7 @@ def test_buscar_simbolo_timeout():
 
 def test_buscar_simbolo_error_conexion():
    """Test para verificar manejo de error de conexión"""
-   with patch('requests.get') as mock_get:
+   with patch('api.cliente.session.get') as mock_get:
        # Simular error de conexión
        mock_get.side_effect = requests.exceptions.ConnectionError("Error de red") 
        
@@ -477,7 +564,7 @@ def test_buscar_simbolo_error_conexion():
 
 def test_buscar_simbolo_error_api():
    """Test para verificar manejo de error de la API"""
-   with patch('requests.get') as mock_get:
+   with patch('api.cliente.session.get') as mock_get:
        # Simular error de API
        mock_response = Mock()
        mock_response.status_code = 400
@@ -490,7 +577,7 @@ def test_buscar_simbolo_error_api():
 
 def test_buscar_simbolo_error_generico():
    """Test para verificar manejo de error genérico"""
-   with patch('requests.get') as mock_get:
+   with patch('api.cliente.session.get') as mock_get:
        # Simular error genérico
        mock_get.side_effect = Exception("Error inesperado")
        
@@ -533,7 +620,699 @@ def test_home_post_no_symbol(client):
         assert 'El símbolo de la empresa es obligatorio' in sess['_flashes'][0][1]
 
 def test_home_post_success(client):
-    response = client.post('/', data={"fecha_compra": "2023-01-01", "empresa": "AAPL"})
+    with base_datos.escritura() as conn:
+        posiciones.inicializar(conn)
+    response = client.post('/', data={"fecha_compra": "2023-01-01", "empresa": "aapl",
+                                      "cantidad_acciones": "3", "valor_compra": "150.5"})
     assert response.status_code == 302
     with client.session_transaction() as sess:
         assert 'Registro guardado exitosamente' in sess['_flashes'][0][1]
+    with base_datos.conexion() as conn:
+        assert conn.execute(
+            "SELECT cartera_id, symbol, cantidad_total FROM posiciones"
+        ).fetchall() == [(1, "AAPL", 3)]
+
+def test_home_post_sin_cantidad_no_guarda(client):
+    with base_datos.escritura() as conn:
+        posiciones.inicializar(conn)
+    response = client.post('/', data={"fecha_compra": "2023-01-01", "empresa": "AAPL"})
+    assert response.status_code == 302
+    with client.session_transaction() as sess:
+        assert sess['_flashes'][0][0] == "danger"
+    with base_datos.conexion() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM compras").fetchone() == (0,)
+
+def test_precio_actual_usa_cache_en_memoria():
+    """Test para verificar que un precio reciente no vuelve a leer SQLite"""
+    with patch('api._cargar_precio', return_value=(150.75, datetime.now())) as mock_cargar:
+        assert obtener_precio_actual("AAPL") == 150.75
+        assert obtener_precio_actual("AAPL") == 150.75
+
+    mock_cargar.assert_called_once_with("AAPL")
+    assert api.cache_precios.estadisticas()["aciertos"] == 1
+
+def test_precio_actual_limite_solicitudes(client, db_precios):
+    """Test para verificar que un 429 de la API llega como 429"""
+    with patch('api.cliente.session.get') as mock_get:
+        mock_get.return_value.status_code = 429
+        response = client.get('/precio_actual?symbol=AAPL')
+
+    assert response.status_code == 429
+    assert response.json == {"error": "Se ha excedido el límite de solicitudes a la API"}
+
+def test_precio_viejo_con_circuito_abierto(db_precios):
+    """Test para verificar que con el circuito abierto se sirve el precio guardado"""
+    fecha_vieja = (datetime.now() - timedelta(hours=2)).isoformat()
+    db_precios.execute("INSERT INTO precios VALUES ('AAPL', 140.0, ?)", (fecha_vieja,))
+    db_precios.commit()
+
+    for _ in range(api.cliente.circuito.umbral):
+        api.cliente.circuito.fallo()
+
+    with patch('api.cliente.session.get') as mock_get:
+        assert obtener_precio_actual("AAPL") == 140.0
+        assert api.obtener_precios(["AAPL"]) == {"AAPL": 140.0}
+        with pytest.raises(ValueError, match="no está disponible"):
+            obtener_precio_actual("MSFT")
+
+    mock_get.assert_not_called()
+
+def test_proveedor_de_respaldo_sin_fmp(db_precios, monkeypatch, tmp_path):
+    """Test para verificar que sin FMP el precio sale del siguiente proveedor"""
+    ruta = tmp_path / "precios.json"
+    ruta.write_text(json.dumps({"AAPL": 151.0}))
+    cotizador = api.Cotizador([api.ProveedorFMP(api.planificador), api.ProveedorArchivo(str(ruta))])
+    monkeypatch.setattr(api, "cotizador", cotizador)
+    for _ in range(api.cliente.circuito.umbral):
+        api.cliente.circuito.fallo()
+
+    with patch('api.cliente.session.get') as mock_get:
+        assert obtener_precio_actual("AAPL") == 151.0
+        with pytest.raises(ValueError, match="no está disponible"):
+            obtener_precio_actual("MSFT")
+
+    mock_get.assert_not_called()
+    assert cotizador.estadisticas()["archivo"]["muestras"] == 2
+
+def test_buscar_simbolo_desde_indice_local(client):
+    """Test para verificar que un término del catálogo no llama a la API"""
+    api.indice_simbolos.cargar([
+        {"symbol": "AAPL", "name": "Apple Inc."},
+        {"symbol": "MSFT", "name": "Microsoft Corporation"}
+    ])
+
+    with patch('api.cliente.session.get') as mock_get:
+        response = client.get('/buscar_simbolo?term=mic')
+
+    assert response.status_code == 200
+    assert response.json == {"simbolos": [{"symbol": "MSFT", "nombre": "Microsoft Corporation (MSFT)"}]}
+    mock_get.assert_not_called()
+
+@patch('api.cliente.session.get')
+def test_buscar_simbolo_recuerda_respuesta_remota(mock_get, client):
+    """Test para verificar que un término ya consultado no repite la llamada"""
+    mock_get.return_value.status_code = 200
+    mock_get.return_value.json.return_value = []
+
+    client.get('/buscar_simbolo?term=ZZ')
+    response = client.get('/buscar_simbolo?term=ZZ')
+
+    assert response.json == {"simbolos": []}
+    mock_get.assert_called_once()
+
+def test_importar_compras(client):
+    """Test para verificar la importación de compras por subida de archivo"""
+    with base_datos.escritura() as conn:
+        posiciones.inicializar(conn)
+    csv = b"fecha_compra,empresa,cantidad_acciones,valor_compra\n2024-01-02,AAPL,10,150\n2024-01-03,AAPL,x,1\n"
+
+    response = client.post('/importar', data={"archivo": (io.BytesIO(csv), "compras.csv")},
+                           content_type="multipart/form-data")
+
+    assert response.status_code == 200
+    assert response.json == {
+        "importadas": 1,
+        "rechazadas": 1,
+        "errores": [{"fila": 3, "error": "La cantidad de acciones debe ser un número"}]
+    }
+
+def test_importar_sin_archivo(client):
+    """Test para verificar el error cuando no se envía archivo"""
+    response = client.post('/importar', data={})
+    assert response.status_code == 400
+    assert response.json == {"error": "Archivo no proporcionado"}
+
+def _cargar_compras(n):
+    with base_datos.escritura() as conn:
+        posiciones.inicializar(conn)
+        historial.inicializar(conn)
+        posiciones.registrar_compras(conn, [
+            (f"2024-01-{i % 28 + 1:02d}", "AAPL" if i % 2 else "MSFT", i + 1, 10.0)
+            for i in range(n)
+        ])
+
+def test_api_historial_paginado(client):
+    """Test para verificar que el cursor recorre todas las compras sin repetir"""
+    _cargar_compras(25)
+
+    vistos = []
+    url = '/api/historial?ordenar_por=fecha_compra&direccion=desc&limite=10'
+    while url:
+        data = client.get(url).json
+        vistos.extend(data["compras"])
+        url = data["siguiente"] and f"/api/historial?ordenar_por=fecha_compra&direccion=desc&limite=10&cursor={data['siguiente']}"
+
+    assert len(vistos) == 25
+    assert len({c["id"] for c in vistos}) == 25
+    claves = [(c["fecha_compra"], c["id"]) for c in vistos]
+    assert claves == sorted(claves, reverse=True)
+
+def test_api_historial_filtros(client):
+    """Test para verificar el filtro por fechas y símbolo"""
+    _cargar_compras(28)
+
+    data = client.get('/api/historial?fecha_inicio=2024-01-05&fecha_fin=2024-01-10&symbol=aapl&ordenar_por=cantidad_acciones').json
+
+    assert data["siguiente"] is None
+    assert [c["cantidad_acciones"] for c in data["compras"]] == [6, 8, 10]
+    assert all(c["symbol"] == "AAPL" for c in data["compras"])
+
+@pytest.mark.parametrize("consulta, error", [
+    ("ordenar_por=id;DROP TABLE historial_compras", "No se puede ordenar por id;DROP TABLE historial_compras"),
+    ("direccion=arriba", "Dirección de ordenamiento inválida"),
+    ("fecha_inicio=2024-13-01", "Fecha inválida"),
+    ("fecha_inicio=2024-02-01&fecha_fin=2024-01-01", "La fecha de inicio no puede ser posterior a la fecha final"),
+    ("cursor=basura", "Cursor inválido"),
+])
+def test_api_historial_parametros_invalidos(client, consulta, error):
+    """Test para verificar que solo se aceptan parámetros de la lista permitida"""
+    response = client.get(f'/api/historial?{consulta}')
+    assert response.status_code == 400
+    assert response.json == {"error": error}
+
+def test_api_historial_usa_indice(client):
+    """Test para verificar que cada orden del historial se lee de un índice de la cartera"""
+    _cargar_compras(5)
+
+    def planes(**parametros):
+        consultas = []
+        with base_datos.conexion() as conn:
+            conn.set_trace_callback(consultas.append)
+            historial.consultar_historial(conn, **parametros)
+            conn.set_trace_callback(None)
+            return [
+                str(conn.execute(f"EXPLAIN QUERY PLAN {consulta}").fetchall())
+                for consulta in consultas if "FROM compras" in consulta
+            ]
+
+    por_fecha = planes(fecha_inicio="2024-01-01")
+    por_symbol = planes(symbol="AAPL", direccion="desc")
+    # Las fechas pueden faltar: un tramo con fecha y otro sin, los dos por
+    # índice; con filtro de fechas el segundo no hace falta
+    assert (len(por_fecha), len(por_symbol)) == (1, 2)
+    assert all("COVERING INDEX idx_compras_cartera_dia" in plan for plan in por_fecha)
+    assert all("COVERING INDEX idx_compras_cartera_symbol_dia" in plan for plan in por_symbol)
+    otros = {
+        "symbol": "idx_compras_cartera_symbol_id",
+        "cantidad_acciones": "idx_compras_cartera_cantidad",
+        "valor_compra": "idx_compras_cartera_precio",
+        "valor_total": "idx_compras_cartera_total",
+    }
+    for ordenar_por, indice in otros.items():
+        plan, = planes(ordenar_por=ordenar_por, direccion="desc")
+        assert indice in plan
+        assert "TEMP B-TREE" not in plan
+    assert all("TEMP B-TREE" not in plan for plan in por_fecha + por_symbol)
+
+def test_api_historial_pagina_las_compras_sin_fecha(client):
+    """Test para verificar que las compras sin fecha van al final (o al principio) de las páginas"""
+    _cargar_compras(5)
+    with base_datos.escritura() as conn:
+        conn.execute("UPDATE compras SET dia = NULL WHERE id IN (2, 4)")
+
+    for direccion, esperado in (("asc", [1, 3, 5, 2, 4]), ("desc", [4, 2, 5, 3, 1])):
+        ids, cursor = [], None
+        while True:
+            with base_datos.conexion() as conn:
+                pagina = historial.consultar_historial(conn, direccion=direccion, limite=2, cursor=cursor)
+            ids += [c["id"] for c in pagina["compras"]]
+            cursor = pagina["siguiente"]
+            if cursor is None:
+                break
+        assert ids == esperado
+
+def test_home_muestra_historial(client):
+    """Test para verificar que la página principal usa la misma consulta"""
+    _cargar_compras(3)
+    with patch('api.obtener_consolidacion', return_value=[]):
+        response = client.get('/?ordenar_por=cantidad_acciones&direccion=desc&limite=2')
+
+    html = response.get_data(as_text=True)
+    assert response.status_code == 200
+    assert html.index("<td>3.00</td>") < html.index("<td>2.00</td>")
+    assert "<td>1.00</td>" not in html
+    assert "Página siguiente" in html
+
+def test_exportar_historial_csv(client):
+    """Test para verificar la exportación del historial en CSV"""
+    _cargar_compras(3)
+
+    response = client.get('/exportar/historial?formato=csv')
+
+    assert response.status_code == 200
+    assert response.mimetype == "text/csv"
+    assert response.is_streamed
+    lineas = response.get_data(as_text=True).splitlines()
+    assert lineas[0] == "id,fecha_compra,symbol,cantidad_acciones,valor_compra,valor_total"
+    assert lineas[1:] == [
+        "1,2024-01-01,MSFT,1,10.0,10.0",
+        "2,2024-01-02,AAPL,2,10.0,20.0",
+        "3,2024-01-03,MSFT,3,10.0,30.0",
+    ]
+
+def test_exportar_consolidacion_ndjson(client):
+    """Test para verificar que la consolidación se exporta con precios por lote"""
+    _cargar_compras(4)
+
+    with patch('api.obtener_precios', return_value={"AAPL": 12.5, "MSFT": 8.0}) as mock_precios:
+        response = client.get('/exportar/consolidacion?formato=ndjson')
+        filas = [json.loads(linea) for linea in response.get_data(as_text=True).splitlines()]
+
+    assert response.mimetype == "application/x-ndjson"
+    assert filas == [
+        {"accion": "AAPL", "cantidad_total": 6, "valor_usd_total": "60.00", "precio_costo": "10.00",
+         "precio_actual": "12.50", "ganancia_perdida": "15.00", "porcentaje": "25.00"},
+        {"accion": "MSFT", "cantidad_total": 4, "valor_usd_total": "40.00", "precio_costo": "10.00",
+         "precio_actual": "8.00", "ganancia_perdida": "-8.00", "porcentaje": "-20.00"},
+    ]
+    mock_precios.assert_called_once_with(["AAPL", "MSFT"])
+
+def test_iterar_consolidacion_libera_la_conexion_al_pedir_precios(client, monkeypatch):
+    """Test para verificar que los precios se piden sin una conexión tomada del pool"""
+    _cargar_compras(4)
+    tomadas = []
+    tomar, devolver = base_datos.pool._tomar, base_datos.pool._devolver
+    monkeypatch.setattr(base_datos.pool, "_tomar", lambda: tomadas.append(1) or tomar())
+    monkeypatch.setattr(base_datos.pool, "_devolver", lambda conn: tomadas.pop() and devolver(conn))
+    pedidos = []
+
+    def precios(symbols):
+        pedidos.append((symbols, len(tomadas)))
+        return {}
+    monkeypatch.setattr(api, "obtener_precios", precios)
+
+    filas = list(api.iterar_consolidacion(tamano_lote=1))
+    assert [f["accion"] for f in filas] == ["AAPL", "MSFT"]
+    assert pedidos == [(["AAPL"], 0), (["MSFT"], 0)]
+
+def test_filas_historial_no_retiene_la_conexion(client, monkeypatch):
+    """Test para verificar que el historial se exporta por bloques sin una conexión tomada"""
+    _cargar_compras(5)
+    tomadas = []
+    tomar, devolver = base_datos.pool._tomar, base_datos.pool._devolver
+    monkeypatch.setattr(base_datos.pool, "_tomar", lambda: tomadas.append(1) or tomar())
+    monkeypatch.setattr(base_datos.pool, "_devolver", lambda conn: tomadas.pop() and devolver(conn))
+
+    ids = []
+    for fila in exportacion.filas_historial(tamano_bloque=2):
+        assert tomadas == []
+        ids.append(fila["id"])
+    assert ids == [1, 2, 3, 4, 5]
+
+def test_exportar_formato_invalido(client):
+    """Test para verificar el rechazo de formatos desconocidos"""
+    response = client.get('/exportar/historial?formato=xml')
+    assert response.status_code == 400
+    assert response.json == {"error": "Formato no soportado: xml"}
+
+def test_precio_vencido_reciente_se_sirve_mientras_se_refresca(db_precios):
+    """Test para verificar que un precio recién vencido se sirve sin esperar a la API"""
+    fecha = (datetime.now() - api.CACHE_DURATION - timedelta(minutes=5)).isoformat()
+    db_precios.executemany("INSERT INTO precios VALUES (?, 140.0, ?)", [("AAPL", fecha), ("MSFT", fecha)])
+    db_precios.commit()
+
+    with patch('api.cliente.session.get') as mock_get, \
+         patch.object(api.refrescador, 'solicitar') as mock_solicitar:
+        assert obtener_precio_actual("AAPL") == 140.0
+        assert api.obtener_precios(["MSFT"]) == {"MSFT": 140.0}
+
+    mock_get.assert_not_called()
+    assert mock_solicitar.call_args_list == [((["AAPL"],),), ((["MSFT"],),)]
+
+def test_simbolos_por_vencer(db_precios):
+    """Test para verificar qué símbolos en cartera necesitan refresco"""
+    _cargar_compras(2)
+    with base_datos.escritura() as conn:
+        posiciones.registrar_compra(conn, "2024-01-01", "GOOG", 1, 10.0)
+        conn.executemany("INSERT INTO precios VALUES (?, 1.0, ?)", [
+            ("AAPL", datetime.now().isoformat()),
+            ("MSFT", (datetime.now() - timedelta(minutes=55)).isoformat()),
+        ])
+
+    assert api.simbolos_por_vencer() == ["GOOG", "MSFT"]
+
+def test_estado_refresco(client):
+    """Test para verificar que la actividad del refresco es observable"""
+    response = client.get('/estado/refresco')
+    assert response.status_code == 200
+    assert set(response.json) >= {"ciclos", "simbolos_refrescados", "errores", "en_curso"}
+
+def test_stream_precios(client):
+    """Test para verificar el stream SSE: precios iniciales y luego cambios"""
+    with patch('api.obtener_precios', return_value={"AAPL": 150.0}):
+        response = client.get('/stream/precios?symbols=aapl,MSFT,aapl')
+        eventos = iter(response.response)
+
+        assert response.mimetype == "text/event-stream"
+        assert next(eventos) == b'event: precio\ndata: {"symbol": "AAPL", "precio": 150.0}\n\n'
+
+        assert api.difusor.simbolos() >= {"AAPL", "MSFT"}
+        api.difusor.publicar("MSFT", 310.0, datetime(2025, 1, 2, 10, 0))
+        assert json.loads(next(eventos).decode().split("data: ")[1]) == {
+            "symbol": "MSFT", "precio": 310.0, "fecha": "2025-01-02T10:00:00"
+        }
+
+        response.close()
+    assert "MSFT" not in api.difusor.simbolos()
+
+def test_stream_precios_sin_simbolos(client):
+    """Test para verificar el error cuando no se indican símbolos"""
+    response = client.get('/stream/precios?symbols=123')
+    assert response.status_code == 400
+
+def test_simbolos_suscritos_se_refrescan(db_precios):
+    """Test para verificar que el refresco incluye los símbolos seguidos por el stream"""
+    _cargar_compras(0)
+    db_precios.execute("INSERT INTO precios VALUES ('GOOG', 1.0, ?)", (datetime.now().isoformat(),))
+    db_precios.commit()
+    suscripcion = api.difusor.suscribir(["NVDA", "GOOG"])
+    try:
+        por_vencer = api.simbolos_por_vencer()
+        assert por_vencer[-1] == "NVDA"
+        assert "GOOG" not in por_vencer
+    finally:
+        api.difusor.cancelar(suscripcion)
+
+CONSOLIDACION = [{
+    'accion': 'AAPL',
+    'cantidad_total': 10,
+    'valor_usd_total': Decimal('1000.00'),
+    'precio_costo': Decimal('100.00'),
+    'precio_actual': Decimal('150.00'),
+    'ganancia_perdida': Decimal('500.00'),
+    'porcentaje': Decimal('50.00')
+}]
+
+def test_api_consolidacion_etag(client, db_precios):
+    """Test para verificar el ETag y la respuesta 304 de /api/consolidacion"""
+    _cargar_compras(0)
+    with patch('api.obtener_consolidacion', return_value=CONSOLIDACION) as mock_consolidacion:
+        response = client.get('/api/consolidacion')
+        etag = response.headers["ETag"]
+
+        assert response.status_code == 200
+        assert response.json[0]["accion"] == "AAPL"
+        assert not etag.startswith("W/")
+
+        response = client.get('/api/consolidacion', headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.data == b""
+        assert mock_consolidacion.call_count == 1
+
+def test_api_consolidacion_se_invalida_al_escribir(client, db_precios):
+    """Test para verificar que solo cambiar posiciones o precios recalcula la consolidación"""
+    _cargar_compras(1)
+    with patch('api.obtener_consolidacion', return_value=CONSOLIDACION) as mock_consolidacion:
+        etag = client.get('/api/consolidacion').headers["ETag"]
+        # Escrituras que no tocan posiciones ni precios no la vencen
+        with base_datos.escritura() as conn:
+            alertas.crear(conn, 1, "MSFT", "sobre", 10)
+        assert client.get('/api/consolidacion').headers["ETag"] == etag
+
+        api._guardar_precios({"MSFT": 310.0})
+        client.get('/api/consolidacion')
+        assert mock_consolidacion.call_count == 2
+
+        mock_consolidacion.return_value = [{**CONSOLIDACION[0], 'cantidad_total': 20}]
+        _cargar_compras(1)
+
+        response = client.get('/api/consolidacion', headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.json[0]["cantidad_total"] == 20
+        assert response.headers["ETag"] != etag
+        assert mock_consolidacion.call_count == 3
+
+def test_api_consolidacion_nota_escrituras_de_otro_proceso(client, db_precios):
+    """Test para verificar que una escritura ajena al pool también invalida la consolidación"""
+    _cargar_compras(1)
+    with patch('api.obtener_consolidacion', return_value=CONSOLIDACION) as mock_consolidacion:
+        client.get('/api/consolidacion')
+        client.get('/api/consolidacion')
+        assert mock_consolidacion.call_count == 1
+
+        # Como otro trabajador: su propia conexión, sin pasar por base_datos
+        with sqlite3.connect(base_datos.pool.ruta) as otro:
+            otro.execute("UPDATE posiciones SET cantidad_total = 20")
+        client.get('/api/consolidacion')
+        assert mock_consolidacion.call_count == 2
+
+def test_publicar_guardados_lleva_precios_al_stream(db_precios):
+    """Test para verificar que los precios guardados por otro proceso llegan a los suscriptores"""
+    # Símbolos que ninguna otra prueba publica: el difusor es global
+    reciente = datetime.now()
+    db_precios.executemany("INSERT INTO precios VALUES (?, ?, ?)", [
+        ("ZZA", 150.0, reciente.isoformat()),
+        ("ZZB", 300.0, (reciente - timedelta(minutes=55)).isoformat()),
+    ])
+    db_precios.commit()
+    suscripcion = api.difusor.suscribir(["ZZA", "ZZB", "ZZC"])
+    try:
+        por_vencer = api.publicar_guardados(["ZZA", "ZZB", "ZZC"])
+        cambios = suscripcion.esperar(0)
+    finally:
+        api.difusor.cancelar(suscripcion)
+
+    assert por_vencer == {"ZZB", "ZZC"}
+    assert {c["symbol"]: c["precio"] for c in cambios} == {"ZZA": 150.0, "ZZB": 300.0}
+    assert api.cache_precios.obtener("ZZA") == 150.0
+
+def test_api_consolidacion_sin_precios_vence_antes(client, db_precios, monkeypatch):
+    """Test para verificar que una consolidación con precios faltantes se guarda por poco tiempo"""
+    _cargar_compras(0)
+    sin_precio = [{**CONSOLIDACION[0], 'precio_actual': Decimal('0.00')}]
+    with patch('api.obtener_consolidacion', return_value=sin_precio) as mock_consolidacion:
+        client.get('/api/consolidacion')
+        client.get('/api/consolidacion')
+        assert mock_consolidacion.call_count == 1
+
+        monkeypatch.setattr(api.cache_consolidacion, "vigencia_incompleta", 0)
+        api.cache_consolidacion.limpiar()
+        client.get('/api/consolidacion')
+        client.get('/api/consolidacion')
+        assert mock_consolidacion.call_count == 3
+
+def test_home_reutiliza_consolidacion(client, db_precios):
+    """Test para verificar que la página reutiliza la consolidación y su HTML"""
+    _cargar_compras(0)
+    with patch('api.obtener_consolidacion', return_value=CONSOLIDACION) as mock_consolidacion, \
+         patch('api.render_template', wraps=api.render_template) as mock_render:
+        primera = client.get('/')
+        segunda = client.get('/')
+
+    assert primera.status_code == segunda.status_code == 200
+    assert b'id="datos-consolidacion"' in segunda.data
+    assert b'<td>AAPL</td>' in segunda.data
+    assert mock_consolidacion.call_count == 1
+    parciales = [c for c in mock_render.call_args_list if c.args[0] == "_consolidacion.html"]
+    assert len(parciales) == 1
+
+def test_api_historico(client):
+    """Test para verificar la serie de cierres por rango de fechas"""
+    with base_datos.escritura() as conn:
+        historico.inicializar(conn)
+        historico.guardar(conn, "AAPL", [(date(2024, 1, 2), 185.64), (date(2024, 1, 3), 184.25)])
+
+    response = client.get('/api/historico?symbols=aapl,msft&desde=2024-01-03')
+    assert response.status_code == 200
+    assert response.json == {"AAPL": {"fechas": ["2024-01-03"], "cierres": [184.25]}}
+
+    assert client.get('/api/historico?symbols=AAPL&desde=ayer').status_code == 400
+    assert client.get('/api/historico').status_code == 400
+
+def test_api_rendimiento(client):
+    """Test para verificar la serie y los rendimientos de la cartera"""
+    _cargar_compras(0)
+    with base_datos.escritura() as conn:
+        rendimiento.inicializar(conn)
+        posiciones.registrar_compras(conn, [("2024-01-02", "AAPL", 10, 100.0)])
+        historico.guardar(conn, "AAPL", [(date(2024, 1, 2), 100.0), (date(2024, 1, 3), 105.0)])
+
+    data = client.get('/api/rendimiento').json
+    assert data["fechas"] == ["2024-01-02", "2024-01-03"]
+    assert data["valores"] == [1000.0, 1050.0]
+    assert data["twr"] == pytest.approx(0.05)
+
+def test_api_riesgo(client):
+    """Test para verificar el análisis de riesgo y la validación de parámetros"""
+    _cargar_compras(0)
+    hoy = date.today()
+    proveedor = historico.ProveedorSimulado()
+    with base_datos.escritura() as conn:
+        rendimiento.inicializar(conn)
+        posiciones.registrar_compras(conn, [("2024-01-02", "AAPL", 10, 100.0)])
+        for symbol in ("AAPL", "QQQ"):
+            historico.guardar(conn, symbol, proveedor.cierres(symbol, date(hoy.year - 1, 1, 1), hoy))
+
+    data = client.get('/api/riesgo?benchmark=qqq&ventana=10').json
+    assert data["simbolos"] == ["AAPL"] and data["benchmark"] == "QQQ"
+    assert data["correlacion"] == [[1.0]]
+    assert data["beta"]["por_simbolo"]["AAPL"] == data["beta"]["cartera"]
+    assert client.get('/api/riesgo').json["benchmark"] is None
+    assert client.get('/api/riesgo?ventana=1').status_code == 400
+    assert client.get('/api/riesgo?dias=x').status_code == 400
+    assert client.get('/api/riesgo?benchmark=^GSPC').status_code == 400
+
+def test_rutas_por_cartera(client, db_precios):
+    """Test para verificar que cada cartera ve solo lo suyo y comparte los precios"""
+    _cargar_compras(2)
+    response = client.post('/api/carteras', json={"nombre": "Otra"})
+    assert response.status_code == 201
+    otra = response.json["id"]
+    assert client.post('/api/carteras', json={"nombre": "Otra"}).status_code == 400
+    assert client.post('/api/carteras', json={"nombre": []}).status_code == 400
+    assert [c["nombre"] for c in client.get('/api/carteras').json["carteras"]] == ["Principal", "Otra"]
+
+    csv = b"fecha_compra,empresa,cantidad_acciones,valor_compra\n2024-01-02,AAPL,7,10\n"
+    response = client.post(f'/carteras/{otra}/importar',
+                           data={"archivo": (io.BytesIO(csv), "compras.csv")},
+                           content_type="multipart/form-data")
+    assert response.json["importadas"] == 1
+
+    db_precios.execute("INSERT INTO precios VALUES ('AAPL', 20.0, ?)", (datetime.now().isoformat(),))
+    db_precios.commit()
+    with patch('api.cliente.session.get') as mock_get:
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.json.return_value = [{"symbol": "MSFT", "price": 30.0}]
+        principal = client.get('/api/consolidacion').json
+        propia = client.get(f'/carteras/{otra}/api/consolidacion').json
+
+    assert [(f["accion"], f["cantidad_total"]) for f in principal] == [("AAPL", 2), ("MSFT", 1)]
+    assert [(f["accion"], f["cantidad_total"]) for f in propia] == [("AAPL", 7)]
+    # AAPL salió de la tabla precios compartida: solo MSFT fue a la API
+    mock_get.assert_called_once()
+
+    assert len(client.get(f'/carteras/{otra}/api/historial').json["compras"]) == 1
+    assert len(client.get('/api/historial').json["compras"]) == 2
+    exportado = client.get(f'/carteras/{otra}/exportar/historial').get_data(as_text=True)
+    assert exportado.count("AAPL") == 1
+    assert client.get(f'/carteras/{otra}/').status_code == 200
+
+    assert client.get('/carteras/99/api/consolidacion').status_code == 404
+    assert client.get('/carteras/99/').status_code == 404
+
+def test_servidor_con_pool_medido(client):
+    """Test para verificar que /metrics informa el uso y la capacidad del pool del servidor"""
+    with patch('api.gevent.spawn'):
+        servidor = api.crear_servidor(("127.0.0.1", 0))
+    assert servidor.pool is metricas.pool("http")
+    assert servidor.pool.size == api.MAX_CONEXIONES
+
+    texto = client.get('/metrics').get_data(as_text=True)
+    assert f'greenlets_capacidad{{pool="http"}} {api.MAX_CONEXIONES}' in texto
+    assert 'greenlets_en_uso{pool="http"}' in texto
+
+def test_metrics_cuenta_peticiones_y_llamadas_a_fmp(client, db_precios):
+    """Test para verificar las métricas de rutas, de la API y de la frescura de precios"""
+    import cliente_fmp
+    peticiones = api.PETICIONES.total(ruta="/precio_actual", metodo="GET", estado=200)
+    limitadas = cliente_fmp.LIMITADAS_FMP.valor(recurso="quote")
+    ausentes = api.FRESCURA_PRECIOS.valor(resultado="ausente")
+
+    with patch('api.cliente.session.get') as mock_get:
+        mock_get.return_value.status_code = 429
+        mock_get.return_value.headers = {}
+        assert client.get('/precio_actual?symbol=AAPL').status_code == 429
+        # El 429 pausa al planificador: se levanta la pausa para seguir
+        api.planificador.reiniciar()
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.json.return_value = [{"symbol": "AAPL", "price": 150.0}]
+        assert client.get('/precio_actual?symbol=AAPL').status_code == 200
+
+    assert api.PETICIONES.total(ruta="/precio_actual", metodo="GET", estado=200) == peticiones + 1
+    assert cliente_fmp.LIMITADAS_FMP.valor(recurso="quote") == limitadas + 1
+    assert api.FRESCURA_PRECIOS.valor(resultado="ausente") == ausentes + 2
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    texto = response.get_data(as_text=True)
+    assert "# TYPE http_peticiones_segundos histogram" in texto
+    assert 'http_peticiones_segundos_count{ruta="/precio_actual",metodo="GET",estado="429"}' in texto
+    assert 'fmp_llamadas_total{recurso="quote",estado="429"}' in texto
+    assert "cache_precios_aciertos_total" in texto
+    assert 'sqlite_segundos_count{tipo="escritura"}' in texto
+
+def test_desglose_de_tiempos_opcional(client):
+    """Test para verificar que Server-Timing solo se agrega si se pide"""
+    with patch('api.obtener_consolidacion', return_value=CONSOLIDACION):
+        normal = client.get('/')
+        desglosada = client.get('/', headers={api.CABECERA_DESGLOSE: "1"})
+
+    assert "Server-Timing" not in normal.headers
+    tiempos = desglosada.headers["Server-Timing"]
+    assert 'render;dur=' in tiempos
+    assert 'sqlite;dur=' in tiempos
+    assert "total;dur=" in tiempos
+
+def test_precio_actual_sin_cuota_sirve_el_ultimo_precio(client, db_precios):
+    """Test para verificar que tras un 429 no se vuelve a llamar a la API hasta el Retry-After"""
+    vieja = (datetime.now() - timedelta(hours=3)).isoformat()
+    db_precios.execute("INSERT INTO precios VALUES ('MSFT', 300.0, ?)", (vieja,))
+    db_precios.commit()
+
+    with patch('api.cliente.session.get') as mock_get:
+        mock_get.return_value.status_code = 429
+        mock_get.return_value.headers = {"Retry-After": "30"}
+        primera = client.get('/precio_actual?symbol=AAPL')
+        segunda = client.get('/precio_actual?symbol=GOOG')
+        vieja = client.get('/precio_actual?symbol=MSFT')
+
+    assert mock_get.call_count == 1
+    assert primera.status_code == segunda.status_code == 429
+    assert 25 <= int(segunda.headers["Retry-After"]) <= 30
+    assert vieja.json == {"precio_actual": 300.0}
+
+def test_ventas_y_ganancias(client, db_precios):
+    """Test para verificar la venta por API y la ganancia realizada y no realizada"""
+    with base_datos.escritura() as conn:
+        posiciones.inicializar(conn)
+        posiciones.registrar_compras(conn, [("2024-01-02", "AAPL", 10, 100.0),
+                                            ("2024-01-03", "MSFT", 2, 50.0)])
+    db_precios.executemany("INSERT INTO precios VALUES (?, ?, ?)",
+                           [("AAPL", 150.0, datetime.now().isoformat()),
+                            ("MSFT", 60.0, datetime.now().isoformat())])
+    db_precios.commit()
+
+    response = client.post('/api/ventas', json={
+        "fecha_venta": "2024-02-01", "symbol": "AAPL", "cantidad_acciones": 4, "precio_venta": 120
+    })
+    assert response.status_code == 201
+    assert response.json["metodo"] == "fifo"
+    assert response.json["ganancia"] == 80.0
+    assert client.post('/api/ventas', json={
+        "fecha_venta": "2024-02-01", "symbol": "MSFT", "cantidad_acciones": 2, "precio_venta": 70
+    }).status_code == 201
+    assert client.post('/api/ventas', json={
+        "fecha_venta": "2024-02-01", "symbol": "AAPL", "cantidad_acciones": 7, "precio_venta": 120
+    }).status_code == 400
+
+    data = client.get('/api/ganancias').json
+    assert [(g["accion"], g["cantidad_total"]) for g in data["ganancias"]] == [("AAPL", 6), ("MSFT", 0)]
+    assert [g["ganancia_realizada"] for g in data["ganancias"]] == ["80.00", "40.00"]
+    assert [g["ganancia_no_realizada"] for g in data["ganancias"]] == ["300.00", "0.00"]
+    assert (data["realizada"], data["no_realizada"]) == ("120.00", "300.00")
+
+def test_alertas_se_disparan_al_guardar_precios(client, db_precios, monkeypatch):
+    """Test para verificar las rutas de alertas y que el refresco de precios las dispara"""
+    entregadas = []
+    monkeypatch.setattr(api.motor_alertas, "notificador", Mock(notificar=entregadas.append))
+    with base_datos.escritura() as conn:
+        posiciones.inicializar(conn)
+        posiciones.registrar_compras(conn, [("2024-01-02", "AAPL", 10, 100.0)])
+
+    assert client.post('/api/alertas', json={"symbol": "aapl", "tipo": "variacion", "valor": 20}).json["umbral"] == 120.0
+    assert client.post('/api/alertas', json={"symbol": "AAPL", "tipo": "bajo", "valor": 90}).status_code == 201
+    borrar = client.post('/api/alertas', json={"symbol": "AAPL", "tipo": "sobre", "valor": 110}).json["id"]
+    assert client.post('/api/alertas', json={"symbol": "AAPL", "tipo": "sobre"}).status_code == 400
+    for datos in ({"symbol": "AAPL", "tipo": 1, "valor": 10}, {"symbol": "AAPL", "tipo": "sobre", "valor": {}}):
+        assert client.post('/api/alertas', json=datos).status_code == 400
+    assert client.delete(f'/api/alertas/{borrar}').status_code == 204
+    assert client.delete(f'/api/alertas/{borrar}').status_code == 404
+
+    api._guardar_precios({"AAPL": 125.0})
+    assert api.motor_alertas.entregar_pendientes() == 1
+    assert [(e["tipo"], e["precio_disparo"]) for e in entregadas] == [("variacion", 125.0)]
+
+    estados = [(a["tipo"], a["disparada"] is not None) for a in client.get('/api/alertas').json["alertas"]]
+    assert estados == [("variacion", True), ("bajo", False)]
+    assert client.get('/estado/refresco').json["alertas"]["pendientes"] == 1
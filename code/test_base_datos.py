@@ -0,0 +1,91 @@
+import sqlite3
+import threading
+
+import pytest
+
+from base_datos import PoolConexiones
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = PoolConexiones(str(tmp_path / "precios.db"), max_inactivas=2)
+    with pool.escritura() as conn:
+        conn.execute("CREATE TABLE precios (symbol TEXT PRIMARY KEY, precio REAL, fecha TEXT)")
+    yield pool
+    pool.cerrar()
+
+
+def test_modo_wal(pool):
+    """Test para verificar que las conexiones usan WAL"""
+    with pool.conexion() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def test_reutiliza_conexiones(pool):
+    """Test para verificar que una conexión devuelta se vuelve a usar"""
+    with pool.conexion() as primera:
+        pass
+    with pool.conexion() as segunda:
+        assert segunda is primera
+
+
+def test_limite_de_inactivas(pool):
+    """Test para verificar que no se guardan más conexiones que el máximo"""
+    with pool.conexion(), pool.conexion(), pool.conexion():
+        pass
+    assert len(pool._inactivas) == 2
+
+
+def test_escritura_confirma_y_revierte(pool):
+    """Test para verificar que escritura() es una transacción"""
+    with pool.escritura() as conn:
+        conn.execute("INSERT INTO precios VALUES ('AAPL', 150.0, '2025-01-01')")
+
+    with pytest.raises(ValueError):
+        with pool.escritura() as conn:
+            conn.execute("INSERT INTO precios VALUES ('MSFT', 300.0, '2025-01-01')")
+            raise ValueError("fallo a mitad de camino")
+
+    with pool.conexion() as conn:
+        assert conn.execute("SELECT symbol FROM precios").fetchall() == [("AAPL",)]
+
+
+def test_version_cambia_solo_al_confirmar(pool):
+    """Test para verificar que la versión cuenta las escrituras confirmadas"""
+    version = pool.version
+    with pool.escritura() as conn:
+        conn.execute("INSERT INTO precios VALUES ('AAPL', 150.0, '2025-01-01')")
+    assert pool.version == version + 1
+
+    with pytest.raises(ValueError):
+        with pool.escritura():
+            raise ValueError("sin cambios")
+    assert pool.version == version + 1
+
+
+def test_conexion_con_error_se_descarta(pool):
+    """Test para verificar que una conexión que falló no vuelve al pool"""
+    with pytest.raises(sqlite3.Error):
+        with pool.conexion() as conn:
+            conn.execute("SELECT * FROM tabla_inexistente")
+    assert conn not in pool._inactivas
+
+
+def test_escrituras_concurrentes(pool):
+    """Test para verificar que escrituras desde varios hilos no chocan"""
+    def escribir(n):
+        for i in range(20):
+            with pool.escritura() as conn:
+                conn.execute(
+                    "REPLACE INTO precios VALUES (?, ?, '2025-01-01')",
+                    (f"S{n}X{i}", float(i))
+                )
+
+    hilos = [threading.Thread(target=escribir, args=(n,)) for n in range(5)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    with pool.conexion() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM precios").fetchone()[0] == 100
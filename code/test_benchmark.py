@@ -0,0 +1,80 @@
+import sqlite3
+
+import pytest
+
+import benchmark
+from cliente_fmp import Circuito, ClienteFMP, LimiteSolicitudesError
+from stub_fmp import ServidorFMP, precio_de
+
+
+@pytest.fixture
+def fmp():
+    """FMP simulado sin latencia"""
+    servidor = ServidorFMP(simbolos=50).iniciar()
+    yield servidor
+    servidor.detener()
+
+
+def _cliente(servidor):
+    return ClienteFMP("clave", url_base=servidor.url_base, espera_base=0,
+                      circuito=Circuito(umbral=100, espera=60))
+
+
+def test_stub_cotiza_y_busca(fmp):
+    """Test para verificar que el stub responde como la API real"""
+    cliente = _cliente(fmp)
+
+    cotizaciones = cliente.cotizaciones(["AAA", "AAB"])
+    assert cotizaciones == [
+        {"symbol": "AAA", "price": precio_de("AAA")},
+        {"symbol": "AAB", "price": precio_de("AAB")},
+    ]
+    assert [s["symbol"] for s in cliente.buscar("AB", limite=3)] == ["ABA", "ABB", "ABC"]
+    assert fmp.pedidos == {"quote": 1, "search": 1}
+
+
+def test_stub_limita_con_429(fmp):
+    """Test para verificar que con tasa_limite=1 el cliente ve el 429"""
+    fmp.tasa_limite = 1.0
+
+    with pytest.raises(LimiteSolicitudesError):
+        _cliente(fmp).cotizaciones(["AAA"])
+
+
+def test_sembrar_crea_compras_y_posiciones(tmp_path):
+    """Test para verificar que la base sembrada tiene historial y posiciones coherentes"""
+    ruta = str(tmp_path / "bench.db")
+    symbols = benchmark.sembrar(ruta, 40, semilla=1)
+
+    with sqlite3.connect(ruta) as conn:
+        compras = conn.execute("SELECT COUNT(*), SUM(cantidad_acciones) FROM historial_compras").fetchone()
+        totales = conn.execute("SELECT SUM(cantidad_total) FROM posiciones").fetchone()
+        en_cartera = {s for s, in conn.execute("SELECT symbol FROM posiciones")}
+    assert compras[0] == 40
+    assert totales[0] == compras[1]
+    assert en_cartera <= set(symbols)
+
+
+def test_comparar_marca_regresiones():
+    """Test para verificar qué diferencias con la línea base se reportan"""
+    metricas = {"p50_ms": 10, "p95_ms": 20, "p99_ms": 30, "req_s": 100, "errores": 0}
+    base = {"1000_filas": {"/": metricas, "/buscar_simbolo": metricas}}
+    actual = {
+        "1000_filas": {
+            "/": dict(metricas, p95_ms=24, req_s=80),
+            "/buscar_simbolo": dict(metricas, p99_ms=40, errores=2),
+            "/nueva": metricas,
+        },
+        "10_filas": {"/": metricas},
+    }
+
+    assert benchmark.comparar(base, actual) == [
+        "1000_filas /buscar_simbolo: p99_ms 30 -> 40",
+        "1000_filas /buscar_simbolo: errores 0 -> 2",
+    ]
+    assert benchmark.comparar(base, actual, tolerancia=0.1) == [
+        "1000_filas /: p95_ms 20 -> 24",
+        "1000_filas /: req_s 100 -> 80",
+        "1000_filas /buscar_simbolo: p99_ms 30 -> 40",
+        "1000_filas /buscar_simbolo: errores 0 -> 2",
+    ]
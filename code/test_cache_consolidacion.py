@@ -0,0 +1,84 @@
+from unittest.mock import Mock
+
+from cache_consolidacion import CacheConsolidacion
+
+
+def _cache(datos, version, **kwargs):
+    calcular = Mock(return_value=datos)
+    cache = CacheConsolidacion(calcular, lambda d: repr(d).encode(), lambda *_: version[0], **kwargs)
+    return cache, calcular
+
+
+def test_reutiliza_mientras_no_cambia_la_version():
+    """Test para verificar que la misma versión no vuelve a calcular"""
+    version = [1]
+    cache, calcular = _cache([{"accion": "AAPL"}], version)
+
+    primera = cache.obtener()
+    assert cache.obtener() is primera
+    assert calcular.call_count == 1
+
+    version[0] = 2
+    assert cache.obtener() is not primera
+    assert calcular.call_count == 2
+    assert cache.estadisticas() == {"aciertos": 1, "calculos": 2}
+
+
+def test_etag_depende_del_contenido():
+    """Test para verificar que el ETag solo cambia si cambia el cuerpo"""
+    version = [1]
+    cache, calcular = _cache([{"accion": "AAPL"}], version)
+    etag = cache.obtener().etag
+
+    version[0] = 2
+    assert cache.obtener().etag == etag
+
+    version[0] = 3
+    calcular.return_value = [{"accion": "MSFT"}]
+    assert cache.obtener().etag != etag
+
+
+def test_vigencia():
+    """Test para verificar que una instantánea vencida se recalcula"""
+    cache, calcular = _cache([], [1], vigencia=0)
+    cache.obtener()
+    cache.obtener()
+    assert calcular.call_count == 2
+
+
+def test_fragmento_se_renderiza_una_vez():
+    """Test para verificar que el HTML se guarda junto con la instantánea"""
+    cache, _ = _cache([{"accion": "AAPL"}], [1])
+    renderizar = Mock(return_value="<table></table>")
+
+    assert cache.obtener().fragmento("tabla", renderizar) == "<table></table>"
+    assert cache.obtener().fragmento("tabla", renderizar) == "<table></table>"
+    renderizar.assert_called_once_with([{"accion": "AAPL"}])
+
+
+def test_incompleta_vence_antes(monkeypatch):
+    """Test para verificar que una consolidación incompleta se guarda con vigencia corta"""
+    ahora = [100.0]
+    monkeypatch.setattr("cache_consolidacion.time.monotonic", lambda: ahora[0])
+    cache, calcular = _cache([{"precio": 0}], [1], vigencia=60, vigencia_incompleta=5,
+                             completa=lambda d: all(f["precio"] for f in d))
+    cache.obtener()
+    ahora[0] += 4
+    cache.obtener()
+    assert calcular.call_count == 1
+    ahora[0] += 2
+    cache.obtener()
+    assert calcular.call_count == 2
+
+
+def test_version_por_clave():
+    """Test para verificar que la versión de una clave no vence a las demás"""
+    versiones = {1: 1, 2: 1}
+    calcular = Mock(side_effect=lambda cartera_id: [cartera_id])
+    cache = CacheConsolidacion(calcular, lambda d: repr(d).encode(), lambda cartera_id: versiones[cartera_id])
+    cache.obtener(1)
+    cache.obtener(2)
+    versiones[2] = 2
+    assert cache.obtener(1).datos == [1]
+    cache.obtener(2)
+    assert calcular.call_count == 3
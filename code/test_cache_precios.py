@@ -0,0 +1,83 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from cache_precios import CachePrecios
+
+
+def test_acierto_y_fallo():
+    """Test para verificar los contadores de aciertos y fallos"""
+    cache = CachePrecios(timedelta(hours=1))
+    assert cache.obtener("AAPL") is None
+    cache.guardar("AAPL", 150.75)
+    assert cache.obtener("AAPL") == 150.75
+
+    stats = cache.estadisticas()
+    assert stats["aciertos"] == 1
+    assert stats["fallos"] == 1
+
+
+def test_vencimiento():
+    """Test para verificar que un precio viejo cuenta como fallo"""
+    cache = CachePrecios(timedelta(hours=1))
+    cache._datos["AAPL"] = (140.0, datetime.now() - timedelta(hours=2))
+
+    assert cache.obtener("AAPL") is None
+    assert cache.estadisticas()["tamano"] == 0
+
+    # Un precio que ya llega vencido desde la base no se guarda
+    cache.guardar("MSFT", 300.0, datetime.now() - timedelta(hours=2))
+    assert cache.obtener("MSFT") is None
+
+
+def test_desalojo_lru():
+    """Test para verificar que se desaloja el símbolo menos usado"""
+    cache = CachePrecios(timedelta(hours=1), capacidad=2)
+    cache.guardar("AAPL", 1.0)
+    cache.guardar("MSFT", 2.0)
+    cache.obtener("AAPL")
+    cache.guardar("GOOG", 3.0)
+
+    assert cache.obtener("MSFT") is None
+    assert cache.obtener("AAPL") == 1.0
+    assert cache.obtener("GOOG") == 3.0
+    assert cache.estadisticas()["desalojos"] == 1
+
+
+def test_una_sola_carga_concurrente():
+    """Test para verificar que pedidos simultáneos comparten una sola carga"""
+    cache = CachePrecios(timedelta(hours=1))
+    llamadas = []
+
+    def cargar(symbol):
+        llamadas.append(symbol)
+        time.sleep(0.05)
+        return 150.75, datetime.now()
+
+    resultados = []
+    hilos = [
+        threading.Thread(target=lambda: resultados.append(cache.obtener_o_cargar("AAPL", cargar)))
+        for _ in range(10)
+    ]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    assert llamadas == ["AAPL"]
+    assert resultados == [150.75] * 10
+
+
+def test_error_de_carga_se_comparte():
+    """Test para verificar que un error de carga no queda guardado"""
+    cache = CachePrecios(timedelta(hours=1))
+
+    def cargar(symbol):
+        raise ValueError("Se ha excedido el límite de solicitudes a la API")
+
+    with pytest.raises(ValueError, match="límite de solicitudes"):
+        cache.obtener_o_cargar("AAPL", cargar)
+
+    assert cache.obtener_o_cargar("AAPL", lambda s: (1.0, datetime.now())) == 1.0
@@ -0,0 +1,90 @@
+from datetime import date
+
+import pytest
+
+import base_datos
+import carteras
+import historial
+import historico
+import posiciones
+import rendimiento
+
+
+def _inicializar():
+    with base_datos.escritura() as conn:
+        posiciones.inicializar(conn)
+        historial.inicializar(conn)
+        rendimiento.inicializar(conn)
+
+
+def test_migra_compras_a_la_principal(db):
+    """Test para verificar que las compras anteriores a las carteras pasan a la principal"""
+    with base_datos.escritura() as conn:
+        conn.execute(
+            "INSERT INTO historial_compras (fecha_compra, symbol, cantidad_acciones, valor_total) "
+            "VALUES ('2024-01-02', 'AAPL', 10, 1500.0)"
+        )
+        conn.execute("CREATE TABLE posiciones (symbol TEXT PRIMARY KEY, cantidad_total, valor_usd_total)")
+    _inicializar()
+
+    with base_datos.conexion() as conn:
+        assert conn.execute("SELECT cartera_id FROM historial_compras").fetchall() == [(1,)]
+        assert conn.execute(
+            "SELECT cartera_id, symbol, cantidad_total, valor_usd_total FROM posiciones"
+        ).fetchall() == [(1, "AAPL", 10, 1500.0)]
+        assert carteras.listar(conn) == [{"id": 1, "nombre": "Principal"}]
+    # Inicializar de nuevo no cambia nada
+    _inicializar()
+
+
+def test_crear_valida_nombre(db):
+    """Test para verificar los nombres de cartera vacíos, largos o repetidos"""
+    _inicializar()
+    with base_datos.escritura() as conn:
+        assert carteras.crear(conn, "  Jubilación ") == {"id": 2, "nombre": "Jubilación"}
+        for nombre, error in [("", "obligatorio"), ("x" * 101, "superar"), ("Jubilación", "Ya existe"),
+                              (["x"], "texto"), (1, "texto")]:
+            with pytest.raises(ValueError, match=error):
+                carteras.crear(conn, nombre)
+
+    with base_datos.conexion() as conn:
+        assert carteras.obtener(conn, 2) == {"id": 2, "nombre": "Jubilación"}
+        assert carteras.obtener(conn, 3) is None
+
+
+def test_carteras_separadas(db):
+    """Test para verificar que posiciones, historial y rendimientos no se mezclan"""
+    _inicializar()
+    with base_datos.escritura() as conn:
+        otra = carteras.crear(conn, "Otra")["id"]
+        posiciones.registrar_compras(conn, [("2024-01-02", "AAPL", 10, 100.0)])
+        posiciones.registrar_compras(conn, [("2024-01-02", "AAPL", 1, 100.0),
+                                            ("2024-01-03", "MSFT", 2, 50.0)], otra)
+        historico.guardar(conn, "AAPL", [(date(2024, 1, 2), 100.0), (date(2024, 1, 3), 110.0)])
+        historico.guardar(conn, "MSFT", [(date(2024, 1, 3), 50.0)])
+
+    with base_datos.conexion() as conn:
+        assert conn.execute(
+            "SELECT cartera_id, symbol, cantidad_total FROM posiciones ORDER BY cartera_id, symbol"
+        ).fetchall() == [(1, "AAPL", 10), (otra, "AAPL", 1), (otra, "MSFT", 2)]
+        assert posiciones.diferencias(conn) == []
+        compras = historial.consultar_historial(conn, cartera_id=otra)["compras"]
+        assert [c["symbol"] for c in compras] == ["AAPL", "MSFT"]
+        # Los cierres se piden una vez aunque el símbolo esté en dos carteras
+        assert historico.simbolos_en_cartera(conn) == ["AAPL", "MSFT"]
+
+    rendimientos = rendimiento.Rendimientos()
+    assert rendimientos.obtener()["valores"] == [1000.0, 1100.0]
+    assert rendimientos.obtener(otra)["valores"] == [100.0, 210.0]
+    assert rendimientos.obtener() is rendimientos.obtener()
+    assert rendimientos.calculos == 2
+
+
+def test_rendimientos_descarta_carteras_viejas(db):
+    """Test para verificar que la memoria guarda como mucho `capacidad` carteras"""
+    _inicializar()
+    rendimientos = rendimiento.Rendimientos(capacidad=1)
+    rendimientos.obtener(1)
+    rendimientos.obtener(2)
+    rendimientos.obtener(1)
+    assert rendimientos.calculos == 3
@@ -0,0 +1,129 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from cliente_fmp import (
+    Circuito, CircuitoAbiertoError, ClienteFMP, ErrorAPI, LimiteSolicitudesError
+)
+
+
+class _Stub(BaseHTTPRequestHandler):
+    # HTTP/1.1 para que el cliente pueda mantener la conexión abierta
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        servidor = self.server
+        servidor.pedidos.append((self.path, self.client_address))
+        estado, cuerpo, cabeceras = servidor.respuestas.pop(0) if servidor.respuestas else (200, [], {})
+        datos = json.dumps(cuerpo).encode()
+        self.send_response(estado)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(datos)))
+        for nombre, valor in cabeceras.items():
+            self.send_header(nombre, valor)
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    """Servidor HTTP local que imita a la API de Financial Modeling Prep"""
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), _Stub)
+    servidor.pedidos = []
+    servidor.respuestas = []
+    hilo = threading.Thread(target=servidor.serve_forever, args=(0.05,), daemon=True)
+    hilo.start()
+    yield servidor
+    servidor.shutdown()
+    servidor.server_close()
+
+
+@pytest.fixture
+def cliente(stub):
+    host, puerto = stub.server_address
+    cliente = ClienteFMP("clave", url_base=f"http://{host}:{puerto}/api/v3",
+                         espera_base=0, circuito=Circuito(umbral=2, espera=60))
+    yield cliente
+    cliente.session.close()
+
+
+def test_cotizaciones_reutiliza_conexion(stub, cliente):
+    """Test para verificar que varias llamadas usan la misma conexión TCP"""
+    stub.respuestas = [(200, [{"symbol": "AAPL", "price": 150.75}], {})] * 3
+
+    for _ in range(3):
+        assert cliente.cotizaciones(["AAPL"]) == [{"symbol": "AAPL", "price": 150.75}]
+
+    assert stub.pedidos[0][0] == "/api/v3/quote/AAPL?apikey=clave"
+    assert len({direccion for _, direccion in stub.pedidos}) == 1
+
+
+def test_reintenta_errores_transitorios(stub, cliente):
+    """Test para verificar que un 503 se reintenta hasta obtener respuesta"""
+    stub.respuestas = [(503, {}, {}), (200, [{"symbol": "AAPL", "name": "Apple Inc."}], {})]
+
+    assert cliente.buscar("AP") == [{"symbol": "AAPL", "name": "Apple Inc."}]
+    assert len(stub.pedidos) == 2
+
+
+def test_no_reintenta_errores_del_cliente(stub, cliente):
+    """Test para verificar que un 400 falla sin reintentos"""
+    stub.respuestas = [(400, {}, {})]
+
+    with pytest.raises(ErrorAPI) as exc_info:
+        cliente.buscar("AP")
+
+    assert exc_info.value.status_code == 400
+    assert len(stub.pedidos) == 1
+
+
+def test_limite_solicitudes_tipado(stub, cliente):
+    """Test para verificar que un 429 se convierte en LimiteSolicitudesError"""
+    stub.respuestas = [(429, {}, {"Retry-After": "30"})]
+
+    with pytest.raises(LimiteSolicitudesError) as exc_info:
+        cliente.cotizaciones(["AAPL"])
+
+    assert exc_info.value.retry_after == 30.0
+    assert not cliente.circuito.abierto
+
+
+def test_circuito_se_abre_y_falla_rapido(stub, cliente):
+    """Test para verificar que tras varios fallos no se vuelve a llamar a la API"""
+    stub.respuestas = [(503, {}, {})] * 6
+
+    for _ in range(2):
+        with pytest.raises(ErrorAPI):
+            cliente.cotizaciones(["AAPL"])
+
+    pedidos = len(stub.pedidos)
+    with pytest.raises(CircuitoAbiertoError):
+        cliente.cotizaciones(["AAPL"])
+    assert len(stub.pedidos) == pedidos
+
+
+def test_circuito_semiabierto_deja_una_prueba(stub, cliente):
+    """Test para verificar que pasada la espera una llamada exitosa cierra el circuito"""
+    cliente.circuito.espera = 0
+    for _ in range(2):
+        cliente.circuito.fallo()
+    stub.respuestas = [(200, [], {})]
+
+    assert cliente.cotizaciones(["AAPL"]) == []
+    assert not cliente.circuito.abierto
+
+
+def test_error_de_conexion_tras_reintentos():
+    """Test para verificar que se agotan los reintentos si no hay servidor"""
+    cliente = ClienteFMP("clave", url_base="http://127.0.0.1:9/api/v3", espera_base=0,
+                         reintentos=1, circuito=Circuito(umbral=1))
+
+    with pytest.raises(requests.exceptions.ConnectionError):
+        cliente.cotizaciones(["AAPL"])
+    assert cliente.circuito.abierto
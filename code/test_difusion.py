@@ -0,0 +1,54 @@
+from datetime import datetime
+
+from difusion import Difusor
+
+
+def test_publicar_solo_a_suscritos():
+    """Test para verificar que cada cliente recibe solo sus símbolos"""
+    difusor = Difusor()
+    a = difusor.suscribir(["AAPL", "MSFT"])
+    b = difusor.suscribir(["MSFT"])
+    fecha = datetime(2025, 1, 2, 10, 0)
+
+    assert difusor.publicar("AAPL", 150.0, fecha) == 1
+    assert difusor.publicar("MSFT", 300.0, fecha) == 2
+    assert difusor.publicar("GOOG", 100.0, fecha) == 0
+
+    assert [c["symbol"] for c in a.esperar(0)] == ["AAPL", "MSFT"]
+    assert b.esperar(0) == [{"symbol": "MSFT", "precio": 300.0, "fecha": "2025-01-02T10:00:00"}]
+
+
+def test_cliente_lento_recibe_el_ultimo():
+    """Test para verificar que los cambios pendientes se agrupan por símbolo"""
+    difusor = Difusor()
+    suscripcion = difusor.suscribir(["AAPL"])
+    for precio in (150.0, 151.0, 152.0):
+        difusor.publicar("AAPL", precio, datetime.now())
+
+    cambios = suscripcion.esperar(0)
+    assert [c["precio"] for c in cambios] == [152.0]
+    assert suscripcion.esperar(0) == []
+
+
+def test_precio_sin_cambios_no_se_difunde():
+    """Test para verificar que un refresco con el mismo precio no genera evento"""
+    difusor = Difusor()
+    suscripcion = difusor.suscribir(["AAPL"])
+    difusor.publicar("AAPL", 150.0, datetime.now())
+    suscripcion.esperar(0)
+
+    assert difusor.publicar("AAPL", 150.0, datetime.now()) == 0
+    assert suscripcion.esperar(0) == []
+
+
+def test_cancelar():
+    """Test para verificar que al cancelar se limpia el índice por símbolo"""
+    difusor = Difusor()
+    a = difusor.suscribir(["AAPL"])
+    b = difusor.suscribir(["AAPL", "MSFT"])
+    difusor.cancelar(a)
+
+    assert difusor.simbolos() == {"AAPL", "MSFT"}
+    difusor.cancelar(b)
+    assert difusor.simbolos() == set()
+    assert difusor.estadisticas() == {"simbolos": 0, "suscripciones": 0}
@@ -0,0 +1,30 @@
+import json
+
+import pytest
+
+from exportacion import serializar
+
+
+def test_serializar_en_bloques():
+    """Test para verificar que la salida se entrega en trozos de tamaño fijo"""
+    filas = ({"a": i, "b": f"x{i}"} for i in range(5))
+
+    trozos = list(serializar(filas, ("a", "b"), "csv", tamano_bloque=2))
+
+    assert len(trozos) == 3
+    assert "".join(trozos).splitlines() == ["a,b", "0,x0", "1,x1", "2,x2", "3,x3", "4,x4"]
+
+
+def test_serializar_ndjson_vacio_y_decimal():
+    """Test para verificar NDJSON sin filas y con valores no JSON"""
+    from decimal import Decimal
+
+    assert list(serializar(iter([]), ("a",), "ndjson")) == []
+    trozos = list(serializar([{"a": Decimal("1.50")}], ("a",), "ndjson"))
+    assert json.loads(trozos[0]) == {"a": "1.50"}
+
+
+def test_serializar_formato_invalido():
+    """Test para verificar que un formato desconocido falla"""
+    with pytest.raises(ValueError, match="Formato no soportado"):
+        list(serializar([], ("a",), "xml"))
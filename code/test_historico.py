@@ -0,0 +1,101 @@
+from datetime import date, timedelta
+from unittest.mock import Mock
+
+import numpy as np
+import pytest
+
+import base_datos
+import historico
+
+
+@pytest.fixture
+def tablas(db):
+    with base_datos.escritura() as conn:
+        historico.inicializar(conn)
+    return db
+
+
+class ProveedorContado(historico.ProveedorSimulado):
+    # Registra los rangos pedidos
+    def __init__(self):
+        super().__init__()
+        self.rangos = []
+
+    def cierres(self, symbol, desde, hasta):
+        self.rangos.append((symbol, desde, hasta))
+        return super().cierres(symbol, desde, hasta)
+
+
+def test_completa_y_actualiza_incrementalmente(tablas):
+    """Test para verificar que la segunda actualización solo pide los días nuevos"""
+    proveedor = ProveedorContado()
+    resultado = historico.actualizar(proveedor, ["AAPL"], hasta=date(2024, 1, 31), anios=1)
+
+    assert resultado["errores"] == {}
+    assert resultado["guardados"] > 200
+    assert proveedor.rangos == [("AAPL", date(2023, 1, 31), date(2024, 1, 31))]
+
+    resultado = historico.actualizar(proveedor, ["AAPL"], hasta=date(2024, 2, 9), anios=1)
+    assert resultado["guardados"] == 7  # días hábiles del 1 al 9 de febrero
+    assert proveedor.rangos[-1] == ("AAPL", date(2024, 2, 1), date(2024, 2, 9))
+
+    # Al día: no se vuelve a consultar
+    historico.actualizar(proveedor, ["AAPL"], hasta=date(2024, 2, 9))
+    assert len(proveedor.rangos) == 2
+
+
+def test_leer_rango_de_varios_simbolos(tablas):
+    """Test para verificar la lectura por rango y la conversión de precios"""
+    with base_datos.escritura() as conn:
+        historico.guardar(conn, "AAPL", [(date(2024, 1, 2), 185.64), (date(2024, 1, 3), 184.25),
+                                         (date(2024, 1, 4), 181.91)])
+        historico.guardar(conn, "MSFT", [(date(2024, 1, 3), 370.6)])
+        # Registrado pero sin cierres
+        conn.execute("INSERT INTO simbolos_historico (symbol) VALUES ('TSLA')")
+
+    with base_datos.conexion() as conn:
+        series = historico.leer(conn, ["AAPL", "MSFT", "NVDA"], date(2024, 1, 3), date(2024, 1, 4))
+        assert historico.ultima_fecha(conn, "AAPL") == date(2024, 1, 4)
+        assert historico.ultima_fecha(conn, "NVDA") is None
+        assert historico.ultima_fecha(conn, "TSLA") is None
+
+    fechas, cierres = series["AAPL"]
+    assert fechas.tolist() == [date(2024, 1, 3), date(2024, 1, 4)]
+    assert cierres.tolist() == [184.25, 181.91]
+    assert series["MSFT"][1].tolist() == [370.6]
+    assert "NVDA" not in series
+
+
+def test_simulado_es_estable():
+    """Test para verificar que el proveedor simulado no depende del rango pedido"""
+    proveedor = historico.ProveedorSimulado()
+    largo = dict(proveedor.cierres("AAPL", date(2020, 1, 1), date(2020, 3, 31)))
+    corto = dict(proveedor.cierres("AAPL", date(2020, 3, 2), date(2020, 3, 6)))
+
+    assert len(corto) == 5
+    assert all(largo[fecha] == precio for fecha, precio in corto.items())
+    assert corto != dict(proveedor.cierres("MSFT", date(2020, 3, 2), date(2020, 3, 6)))
+
+
+def test_proveedor_fmp():
+    """Test para verificar la lectura de la respuesta de la API"""
+    cliente = Mock()
+    cliente.historico.return_value = {"symbol": "AAPL", "historical": [
+        {"date": "2024-01-03", "close": 184.25},
+        {"date": "2024-01-02", "close": 185.64},
+    ]}
+
+    cierres = historico.ProveedorFMP(cliente).cierres("AAPL", date(2024, 1, 1), date(2024, 1, 3))
+
+    assert cierres == [(date(2024, 1, 2), 185.64), (date(2024, 1, 3), 184.25)]
+    cliente.historico.assert_called_once_with("AAPL", date(2024, 1, 1), date(2024, 1, 3))
+
+
+def test_errores_por_simbolo(tablas):
+    """Test para verificar que un símbolo con error no frena a los demás"""
+    proveedor = Mock()
+    proveedor.cierres.side_effect = [ValueError("sin datos"), [(date(2024, 1, 2), 10.0)]]
+
+    resultado = historico.actualizar(proveedor, ["XXXX", "AAPL"], hasta=date(2024, 1, 2), anios=1)
+
+    assert resultado == {"guardados": 1, "errores": {"XXXX": "sin datos"}}
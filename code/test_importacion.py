@@ -0,0 +1,102 @@
+import io
+from datetime import datetime, timedelta
+
+import pytest
+
+import base_datos
+import importacion
+import posiciones
+
+CSV = """fecha_compra,symbol,cantidad_acciones,valor_compra
+2024-01-02,AAPL,10,150.00
+2024-01-03,aapl,5,160
+2024-01-04,MSFT,0,300
+fecha-mala,MSFT,2,300
+2024-01-05,MSFT,2,300.50
+2024-01-06,,1,10
+"""
+
+
+@pytest.fixture
+def db_posiciones(db):
+    with base_datos.escritura() as conn:
+        posiciones.inicializar(conn)
+    return db
+
+
+def _tabla(sql):
+    with base_datos.conexion() as conn:
+        return conn.execute(sql).fetchall()
+
+
+def test_importar_csv_con_errores(db_posiciones):
+    """Test para verificar que las filas inválidas se informan sin cortar la importación"""
+    resultado = importacion.importar(io.StringIO(CSV), "csv", tamano_lote=2)
+
+    assert resultado["importadas"] == 3
+    assert resultado["rechazadas"] == 3
+    assert resultado["errores"] == [
+        {"fila": 4, "error": "La cantidad de acciones debe ser mayor a 0"},
+        {"fila": 5, "error": "Fecha inválida"},
+        {"fila": 7, "error": "El símbolo de la empresa es obligatorio"},
+    ]
+    assert _tabla("SELECT symbol, cantidad_acciones, valor_total FROM historial_compras ORDER BY id") == [
+        ("AAPL", 10, 1500.0), ("AAPL", 5, 800.0), ("MSFT", 2, 601.0)
+    ]
+    assert _tabla("SELECT symbol, cantidad_total, valor_usd_total FROM posiciones ORDER BY symbol") == [("AAPL", 15, 2300.0), ("MSFT", 2, 601.0)]
+
+
+def test_importar_ndjson(db_posiciones):
+    """Test para verificar la importación en NDJSON con líneas dañadas"""
+    futura = (datetime.now() + timedelta(days=2)).strftime('%Y-%m-%d')
+    ndjson = "\n".join([
+        '{"fecha_compra": "2024-01-02", "empresa": "GOOG", "cantidad_acciones": 3, "valor_compra": 100.5}',
+        '{esto no es json',
+        f'{{"fecha_compra": "{futura}", "symbol": "GOOG", "cantidad_acciones": 1, "valor_compra": 1}}',
+        '',
+        '[1, 2]',
+    ])
+
+    resultado = importacion.importar(io.StringIO(ndjson), "ndjson")
+
+    assert resultado["importadas"] == 1
+    assert [e["fila"] for e in resultado["errores"]] == [2, 3, 5]
+    assert _tabla("SELECT symbol, cantidad_total, valor_usd_total FROM posiciones") == [("GOOG", 3, 301.5)]
+
+
+def test_formato_no_soportado():
+    """Test para verificar que se rechaza un formato desconocido"""
+    with pytest.raises(ValueError, match="Formato no soportado"):
+        importacion.importar(io.StringIO(""), "xlsx")
+
+
+def test_linea_de_comandos(db_posiciones, tmp_path, capsys):
+    """Test para verificar la importación desde la línea de comandos"""
+    ruta = tmp_path / "compras.csv"
+    ruta.write_text(CSV, encoding="utf-8")
+
+    assert importacion.main([str(ruta)]) == 1
+    salida = capsys.readouterr()
+    assert "3 compra(s) importada(s), 3 rechazada(s)" in salida.out
+    assert "Fila 5: Fecha inválida" in salida.err
+
+
+def test_importar_valores_de_otro_tipo_o_enormes(db_posiciones):
+    """Test para verificar que tipos inesperados y números enormes son errores de fila"""
+    ndjson = "\n".join([
+        '{"fecha_compra": 20240101, "symbol": "AAPL", "cantidad_acciones": 1, "valor_compra": 1}',
+        '{"fecha_compra": "2024-01-02", "symbol": 123, "cantidad_acciones": 1, "valor_compra": 1}',
+        '{"fecha_compra": "2024-01-02", "symbol": "AAPL", "cantidad_acciones": 1e30, "valor_compra": 1}',
+        '{"fecha_compra": "2024-01-02", "symbol": "AAPL", "cantidad_acciones": 1, "valor_compra": 1e20}',
+        '{"fecha_compra": "2024-01-02", "symbol": "AAPL", "cantidad_acciones": 10000000, "valor_compra": 1e7}',
+        '{"fecha_compra": "2024-01-02", "symbol": "AAPL", "cantidad_acciones": [1], "valor_compra": true}',
+        '{"fecha_compra": "2024-01-02", "symbol": "AAPL", "cantidad_acciones": 2, "valor_compra": 10}',
+    ])
+
+    resultado = importacion.importar(io.StringIO(ndjson), "ndjson")
+
+    assert resultado["importadas"] == 1
+    assert [e["fila"] for e in resultado["errores"]] == [1, 2, 3, 4, 5, 6]
+    assert resultado["errores"][0]["error"] == "Fecha inválida"
+    assert resultado["errores"][2]["error"] == "La cantidad de acciones es demasiado grande"
+    assert _tabla("SELECT symbol, cantidad_total, valor_usd_total FROM posiciones") == [("AAPL", 2, 20.0)]
@@ -0,0 +1,92 @@
+import json
+
+from indice_simbolos import IndiceSimbolos
+
+CATALOGO = [
+    {"symbol": "AAPL", "name": "Apple Inc."},
+    {"symbol": "AA", "name": "Alcoa Corporation"},
+    {"symbol": "APLE", "name": "Apple Hospitality REIT, Inc."},
+    {"symbol": "MSFT", "name": "Microsoft Corporation"},
+    {"symbol": "GOOG", "name": "Alphabet Inc."},
+    {"symbol": "SIN", "name": ""},
+]
+
+
+def test_busqueda_por_simbolo():
+    """Test para verificar el orden de los prefijos de símbolo"""
+    indice = IndiceSimbolos()
+    indice.cargar(CATALOGO)
+
+    simbolos = [s["symbol"] for s in indice.buscar("aa")]
+    assert simbolos == ["AA", "AAPL"]
+    assert indice.buscar("AAPL")[0] == {"symbol": "AAPL", "nombre": "Apple Inc. (AAPL)"}
+
+
+def test_busqueda_por_nombre_y_palabra():
+    """Test para verificar que se busca por nombre y por cada palabra del nombre"""
+    indice = IndiceSimbolos()
+    indice.cargar(CATALOGO)
+
+    assert [s["symbol"] for s in indice.buscar("APPLE")] == ["AAPL", "APLE"]
+    assert [s["symbol"] for s in indice.buscar("CORP")] == ["AA", "MSFT"]
+    assert [s["symbol"] for s in indice.buscar("HOSP")] == ["APLE"]
+
+
+def test_sin_coincidencias_y_limite():
+    """Test para verificar el límite y el caso sin coincidencias"""
+    indice = IndiceSimbolos()
+    indice.cargar(CATALOGO)
+
+    assert indice.buscar("XYZ") is None
+    assert len(indice.buscar("A", limite=2)) == 2
+    assert len(indice) == 5
+
+
+def test_busqueda_corta_al_llegar_al_limite():
+    """Test para verificar que se recorren solo las claves necesarias para el límite"""
+    indice = IndiceSimbolos()
+    indice.cargar([{"symbol": f"A{i:04d}", "name": f"Empresa {i}"} for i in range(5000)] +
+                  [{"symbol": "A", "name": "Agilent Technologies"}])
+    recorridas = []
+    original = IndiceSimbolos._coincidencias
+
+    def coincidencias(claves, term):
+        for coincidencia in original(claves, term):
+            recorridas.append(coincidencia)
+            yield coincidencia
+    indice._coincidencias = coincidencias
+
+    assert [s["symbol"] for s in indice.buscar("A", limite=3)] == ["A", "A0000", "A0001"]
+    assert len(recorridas) == 3
+
+
+def test_el_mejor_no_es_el_primero_en_orden_alfabetico():
+    """Test para verificar que los símbolos ganan a nombres que van antes por orden alfabético"""
+    indice = IndiceSimbolos()
+    indice.cargar([{"symbol": "MS", "name": "Morgan Stanley"},
+                   {"symbol": "MSFT", "name": "Microsoft Corporation"}] +
+                  [{"symbol": f"X{i:02d}", "name": f"MSA{i:02d} Holdings"} for i in range(20)])
+
+    assert [s["symbol"] for s in indice.buscar("MS", limite=5)] == ["MS", "MSFT", "X00", "X01", "X02"]
+    assert [s["symbol"] for s in indice.buscar("HOLD", limite=2)] == ["X00", "X01"]
+
+
+def test_recordar_respuesta_remota():
+    """Test para verificar que se guardan los términos respondidos por la API"""
+    indice = IndiceSimbolos()
+    indice.recordar("NVIDIA", [{"symbol": "NVDA", "name": "NVIDIA Corporation"}])
+    indice.recordar("QQQQ", [])
+
+    assert indice.buscar("NVD") == [{"symbol": "NVDA", "nombre": "NVIDIA Corporation (NVDA)"}]
+    assert indice.buscar("QQQQ") == []
+
+
+def test_cargar_archivo(tmp_path):
+    """Test para verificar la carga del catálogo desde un archivo JSON"""
+    ruta = tmp_path / "simbolos.json"
+    ruta.write_text(json.dumps(CATALOGO), encoding="utf-8")
+
+    indice = IndiceSimbolos()
+    indice.cargar_archivo(str(ruta))
+
+    assert indice.buscar("GOOG")[0]["symbol"] == "GOOG"
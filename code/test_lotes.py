@@ -0,0 +1,146 @@
+from datetime import date
+
+import pytest
+
+import base_datos
+import historico
+import lotes
+import posiciones
+import rendimiento
+
+
+@pytest.fixture
+def compras(db):
+    with base_datos.escritura() as conn:
+        posiciones.inicializar(conn)
+        posiciones.registrar_compras(conn, [
+            ("2024-01-02", "AAPL", 10, 100.0),
+            ("2024-02-01", "AAPL", 10, 130.0),
+            ("2024-03-01", "AAPL", 10, 160.0),
+        ])
+    return db
+
+
+def _vender(cantidad, metodo, fecha="2024-04-01", precio=200.0):
+    with base_datos.escritura() as conn:
+        return posiciones.registrar_venta(conn, fecha, "AAPL", cantidad, precio, metodo)
+
+
+def _estado():
+    with base_datos.conexion() as conn:
+        return (
+            [(f, c) for f, c, _ in lotes.abiertos(conn, 1, "AAPL")],
+            conn.execute(
+                "SELECT cantidad_total, valor_usd_total, ganancia_realizada FROM posiciones"
+            ).fetchone(),
+        )
+
+
+def test_fifo_consume_los_mas_viejos(compras):
+    """Test para verificar que FIFO asigna el costo de los primeros lotes"""
+    venta = _vender(15, "fifo")
+
+    assert (venta["costo"], venta["ganancia"]) == (1650.0, 1350.0)
+    assert _estado() == ([("2024-02-01", 5), ("2024-03-01", 10)], (15, 2250.0, 1350.0))
+
+
+def test_lifo_consume_los_mas_nuevos(compras):
+    """Test para verificar que LIFO asigna el costo de los últimos lotes"""
+    venta = _vender(15, "lifo")
+
+    assert venta["costo"] == 2250.0
+    assert _estado() == ([("2024-01-02", 10), ("2024-02-01", 5)], (15, 1650.0, 750.0))
+
+
+def test_promedio_usa_el_costo_de_la_posicion(compras):
+    """Test para verificar el costo promedio y que las cantidades salen de los lotes viejos"""
+    venta = _vender(15, "promedio")
+
+    assert venta["costo"] == 1950.0
+    assert _estado() == ([("2024-02-01", 5), ("2024-03-01", 10)], (15, 1950.0, 1050.0))
+
+
+def test_promedio_y_despues_fifo_cuadran(compras):
+    """Test para verificar que tras un promedio los lotes valen lo mismo que la posición"""
+    _vender(15, "promedio")
+    with base_datos.conexion() as conn:
+        assert {c for _, _, c in lotes.abiertos(conn, 1, "AAPL")} == {130.0}
+
+    venta = _vender(10, "fifo", precio=150.0)
+    assert (venta["costo"], venta["ganancia"]) == (1300.0, 200.0)
+    cantidad, costo, realizada = _estado()[1]
+    assert (cantidad, costo, realizada) == (5, 650.0, 1250.0)
+    with base_datos.conexion() as conn:
+        assert sum(c * u for _, c, u in lotes.abiertos(conn, 1, "AAPL")) == costo
+    # Realizada más no realizada (a 150) es lo cobrado más lo que vale hoy
+    # menos lo invertido
+    no_realizada = cantidad * 150.0 - costo
+    assert realizada + no_realizada == pytest.approx(15 * 200.0 + 10 * 150.0 + 5 * 150.0 - 3900.0)
+
+
+def test_no_vende_lo_que_no_habia(compras):
+    """Test para verificar que no se venden más acciones de las compradas hasta la fecha"""
+    with pytest.raises(ValueError, match="No hay 25 acciones"):
+        _vender(25, "fifo", fecha="2024-02-15")
+    with pytest.raises(ValueError, match="Método no soportado"):
+        _vender(1, "hifo")
+
+    # Nada quedó a medias
+    assert _estado() == (
+        [("2024-01-02", 10), ("2024-02-01", 10), ("2024-03-01", 10)], (30, 3900.0, 0.0)
+    )
+
+
+def test_reconstruir_incluye_ventas(compras):
+    """Test para verificar que posiciones se rearma con compras y ventas"""
+    _vender(15, "fifo")
+    with base_datos.escritura() as conn:
+        conn.execute("DELETE FROM posiciones")
+        assert posiciones.reconstruir(conn)
+        assert posiciones.diferencias(conn) == []
+    assert _estado()[1] == (15, 2250.0, 1350.0)
+
+
+def test_migra_posiciones_y_lotes(db):
+    """Test para verificar que una base con compras y sin ventas arma sus lotes"""
+    with base_datos.escritura() as conn:
+        conn.execute(
+            "INSERT INTO historial_compras (fecha_compra, symbol, cantidad_acciones, valor_total) "
+            "VALUES ('2024-01-02', 'AAPL', 10, 1500.0)"
+        )
+        conn.execute("ALTER TABLE historial_compras ADD COLUMN cartera_id INTEGER NOT NULL DEFAULT 1")
+        conn.execute(
+            "CREATE TABLE posiciones (cartera_id INTEGER, symbol TEXT, cantidad_total, "
+            "valor_usd_total, PRIMARY KEY (cartera_id, symbol))"
+        )
+        conn.execute("INSERT INTO posiciones VALUES (1, 'AAPL', 10, 1500.0)")
+        posiciones.inicializar(conn)
+
+    with base_datos.conexion() as conn:
+        assert lotes.abiertos(conn, 1, "AAPL") == [("2024-01-02", 10, 150.0)]
+    assert _estado()[1] == (10, 1500.0, 0.0)
+
+
+def test_rendimiento_con_ventas(compras):
+    """Test para verificar que una venta es un retiro y no cambia el rendimiento del día"""
+    with base_datos.escritura() as conn:
+        rendimiento.inicializar(conn)
+        historico.guardar(conn, "AAPL", [(date(2024, 3, 29), 200.0), (date(2024, 4, 2), 220.0)])
+    _vender(15, "fifo")
+
+    with base_datos.escritura() as conn:
+        rendimiento.actualizar(conn)
+        resumen = rendimiento.resumen(conn)
+    serie = dict(zip(resumen["fechas"], resumen["valores"]))
+    # 30 acciones a 200; el 1 de abril se venden 15 a 200 y quedan 15
+    assert serie["2024-03-31"] == 6000.0
+    assert serie["2024-04-01"] == 3000.0
+    assert serie["2024-04-02"] == 3300.0
+    assert resumen["invertido"][-1] == 3900.0 - 3000.0
+
+    # La misma serie calculada desde cero
+    with base_datos.escritura() as conn:
+        conn.execute("DELETE FROM serie_cartera_estado")
+        conn.execute("DELETE FROM serie_cartera")
+        rendimiento.actualizar(conn)
+        assert rendimiento.resumen(conn) == resumen
@@ -0,0 +1,89 @@
+import gevent
+
+import metricas
+
+
+def test_histograma_acumula_por_limite():
+    """Test para verificar el formato de texto de un histograma"""
+    registro = metricas.Registro()
+    latencia = registro.histograma("latencia_segundos", "Latencia", ("ruta",), limites=(0.1, 1))
+    latencia.observar(0.05, ruta="/")
+    latencia.observar(0.5, ruta="/")
+    latencia.observar(3, ruta="/")
+
+    assert registro.exponer().splitlines() == [
+        "# HELP latencia_segundos Latencia",
+        "# TYPE latencia_segundos histogram",
+        'latencia_segundos_bucket{ruta="/",le="0.1"} 1',
+        'latencia_segundos_bucket{ruta="/",le="1"} 2',
+        'latencia_segundos_bucket{ruta="/",le="+Inf"} 3',
+        'latencia_segundos_sum{ruta="/"} 3.55',
+        'latencia_segundos_count{ruta="/"} 3',
+    ]
+
+
+def test_contador_y_medidor():
+    """Test para verificar contadores con etiquetas y medidores leídos al exponer"""
+    registro = metricas.Registro()
+    llamadas = registro.contador("llamadas_total", "Llamadas", ("estado",))
+    llamadas.sumar(estado=200)
+    llamadas.sumar(2, estado=429)
+    registro.medidor("en_uso", "En uso", lambda: {("a\"b",): 3}, ("pool",))
+
+    texto = registro.exponer()
+    assert 'llamadas_total{estado="200"} 1' in texto
+    assert 'llamadas_total{estado="429"} 2' in texto
+    assert 'en_uso{pool="a\\"b"} 3' in texto
+    assert llamadas.valor(estado=429) == 2
+
+
+def test_medidor_que_falla_no_corta_la_exposicion():
+    """Test para verificar que un medidor con error se omite"""
+    registro = metricas.Registro()
+    registro.medidor("roto", "Roto", lambda: 1 / 0)
+    registro.contador("sano_total", "Sano").sumar()
+
+    assert registro.exponer().splitlines()[-1] == "sano_total 1"
+
+
+def test_desglose_incluye_greenlets_del_pool():
+    """Test para verificar que el tiempo medido en un pool suma a la petición que lo lanzó"""
+    def tarea(_):
+        with metricas.cronometro(categoria="fmp"):
+            gevent.sleep(0.01)
+
+    metricas.iniciar_desglose()
+    with metricas.cronometro(categoria="sqlite"):
+        pass
+    list(metricas.pool_por_llamada("prueba", 2).imap_unordered(tarea, range(3)))
+    desglose = metricas.terminar_desglose()
+
+    assert desglose["fmp"][1] == 3
+    assert desglose["fmp"][0] >= 0.03
+    assert desglose["sqlite"][1] == 1
+    assert metricas.terminar_desglose() is None
+    cabecera = metricas.server_timing(desglose, 0.05)
+    assert cabecera.startswith('fmp;dur=')
+    assert cabecera.endswith("total;dur=50.00")
+
+
+def test_pool_cuenta_greenlets_en_uso():
+    """Test para verificar la saturación de los pools de larga vida y de una llamada"""
+    pool = metricas.pool("saturacion", 2)
+    assert metricas.pool("saturacion", 5) is pool
+    pool.spawn(gevent.sleep, 0.05)
+    # Los de una llamada suman lo que corre, no su tamaño
+    temporales = [metricas.pool_por_llamada("saturacion", 8) for _ in range(2)]
+    for temporal in temporales:
+        temporal.spawn(gevent.sleep, 0.05)
+
+    assert metricas._en_uso()["saturacion"] == 3
+    assert metricas._capacidad()["saturacion"] == 2
+    pool.join()
+    for temporal in temporales:
+        temporal.join()
+    gevent.sleep(0)
+    assert metricas._en_uso()["saturacion"] == 0
+
+    sin_limite = metricas.pool("sin_limite")
+    assert sin_limite.size is None and "sin_limite" not in metricas._capacidad()
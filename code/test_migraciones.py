@@ -0,0 +1,120 @@
+import base_datos
+import historial
+import migraciones
+import posiciones
+
+
+def _compras(conn):
+    return conn.execute(
+        "SELECT id, cartera_id, dia, symbol, cantidad, precio_micros FROM compras ORDER BY id"
+    ).fetchall()
+
+
+def _legado(conn, filas):
+    conn.executemany(
+        "INSERT INTO historial_compras "
+        "(fecha_compra, symbol, cantidad_acciones, valor_compra, precio_actual, valor_total) "
+        "VALUES (?, ?, ?, ?, 999.0, ?)",
+        filas
+    )
+
+
+def test_migra_historial_anterior(db):
+    """Test para verificar la conversión a enteros y la vista con las columnas de antes"""
+    with base_datos.escritura() as conn:
+        _legado(conn, [
+            ("2024-01-02", "AAPL", 10, 150.25, 1502.5),
+            ("2024-01-03 15:30:00", "MSFT", 7, None, 1500.0),  # solo el total
+            (None, "GOOG", 2, 10.0, 20.0),
+            ("2024-01-04", "BORRADA", 1, 1.0, 1.0),
+        ])
+        conn.execute("DELETE FROM historial_compras WHERE symbol = 'BORRADA'")
+        migraciones.aplicar(conn)
+
+    with base_datos.conexion() as conn:
+        assert migraciones.version(conn) == 2
+        assert _compras(conn) == [
+            (1, 1, 19724, "AAPL", 10, 150250000),
+            (2, 1, 19725, "MSFT", 7, 214285714),
+            (3, 1, None, "GOOG", 2, 10000000),
+        ]
+        assert conn.execute("SELECT * FROM historial_compras WHERE id = 1").fetchone() == (
+            1, 1, "2024-01-02", "AAPL", 10, 150.25, 1502.5
+        )
+
+    with base_datos.escritura() as conn:
+        migraciones.aplicar(conn)  # ya está al día
+        # Se sigue pudiendo escribir con las columnas de antes, y el id
+        # de la compra borrada no se reusa
+        conn.execute(
+            "INSERT INTO historial_compras (fecha_compra, symbol, cantidad_acciones, valor_total) "
+            "VALUES ('2024-02-01', 'AAPL', 4, 600.0)"
+        )
+        assert _compras(conn)[-1] == (5, 1, 19754, "AAPL", 4, 150000000)
+
+
+def test_migrar_por_lotes_con_escrituras(db):
+    """Test para verificar que lo que se escribe entre lotes llega a compras"""
+    with base_datos.escritura() as conn:
+        _legado(conn, [(f"2024-01-{i:02d}", "AAPL", i, 10.0, 10.0 * i) for i in range(1, 8)])
+
+    def otro_proceso(migracion, copiadas):
+        # La versión anterior de la aplicación sigue usando la tabla
+        if copiadas == 2:
+            with base_datos.escritura() as conn:
+                _legado(conn, [("2024-02-01", "MSFT", 3, 20.0, 60.0)])
+                conn.execute("UPDATE historial_compras SET cantidad_acciones = 100 WHERE id = 1")
+                conn.execute("UPDATE historial_compras SET valor_compra = 11.0 WHERE id = 6")
+                conn.execute("DELETE FROM historial_compras WHERE id IN (2, 5)")
+        avances.append(copiadas)
+
+    avances = []
+    assert migraciones.migrar(tamano_lote=2, informar=otro_proceso) == [1, 2]
+
+    assert avances[0] == 2 and len(avances) >= 3
+    with base_datos.conexion() as conn:
+        assert [(i, s, c, p) for i, _, _, s, c, p in _compras(conn)] == [
+            (1, "AAPL", 100, 10000000),
+            (3, "AAPL", 3, 10000000),
+            (4, "AAPL", 4, 10000000),
+            (6, "AAPL", 6, 11000000),
+            (7, "AAPL", 7, 10000000),
+            (8, "MSFT", 3, 20000000),
+        ]
+        assert conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'migracion_%'"
+        ).fetchall() == []
+        assert migraciones.pendientes(conn) == []
+
+
+def test_base_nueva_y_historial(db):
+    """Test para verificar que una base sin historial arranca con el libro nuevo"""
+    with base_datos.escritura() as conn:
+        conn.execute("DROP TABLE historial_compras")
+        posiciones.inicializar(conn)
+        historial.inicializar(conn)
+        posiciones.registrar_compras(conn, [("2024-01-02", "AAPL", 3, 0.1), ("2024-01-03", "AAPL", 3, 0.2)])
+
+    with base_datos.conexion() as conn:
+        assert migraciones.version(conn) == 2
+        compras = historial.consultar_historial(conn, ordenar_por="valor_total", direccion="desc")["compras"]
+        assert [(c["fecha_compra"], c["valor_compra"], c["valor_total"]) for c in compras] == [
+            ("2024-01-03", 0.2, 0.6), ("2024-01-02", 0.1, 0.3)
+        ]
+        assert posiciones.diferencias(conn) == []
+
+
+def test_main_informa_espacio_y_tiempos(db, capsys):
+    """Test para verificar el informe de la migración por línea de comandos"""
+    with base_datos.escritura() as conn:
+        conn.execute("ALTER TABLE historial_compras ADD COLUMN cartera_id INTEGER NOT NULL DEFAULT 1")
+        _legado(conn, [(f"2024-01-{i % 28 + 1:02d}", "AAPL", i, 10.0, 10.0 * i) for i in range(1, 50)])
+
+    assert migraciones.main(["--lote", "10"]) == 0
+    salida = capsys.readouterr().out
+    assert "Aplicada(s): 1" in salida
+    assert "49 fila(s) copiada(s)" in salida
+    assert "historial por fecha (primera página):" in salida and " ms" in salida
+
+    assert migraciones.main([]) == 0
+    assert "No hay migraciones pendientes" in capsys.readouterr().out
@@ -0,0 +1,127 @@
+import threading
+import time
+
+import pytest
+
+from cliente_fmp import LimiteSolicitudesError
+from planificador import BUSQUEDA, FONDO, INTERACTIVA, Cubeta, Planificador
+
+
+class _Cliente:
+    # Registra las llamadas; cotizaciones devuelve un precio por símbolo
+    def __init__(self, error=None):
+        self.llamadas = []
+        self.error = error
+
+    def cotizaciones(self, symbols):
+        self.llamadas.append(("quote", list(symbols)))
+        if self.error:
+            raise self.error
+        return [{"symbol": s, "price": 1.0} for s in symbols]
+
+    def buscar(self, term, limite=10):
+        self.llamadas.append(("search", term))
+        return []
+
+
+def _esperar_en_cola(planificador, cantidad):
+    limite = time.monotonic() + 2
+    while len(planificador._cola) < cantidad and time.monotonic() < limite:
+        time.sleep(0.005)
+
+
+def test_cubeta_repone_fichas_con_el_tiempo():
+    """Test para verificar la tasa y la capacidad de la cubeta"""
+    ahora = [0.0]
+    cubeta = Cubeta(tasa=2, capacidad=3, reloj=lambda: ahora[0])
+    for _ in range(3):
+        assert cubeta.espera() == 0
+        cubeta.tomar()
+    assert cubeta.espera() == pytest.approx(0.5)
+
+    ahora[0] = 10
+    assert cubeta.espera() == 0
+    assert cubeta.fichas == 3
+
+
+def test_prioridades_y_orden_de_llegada():
+    """Test para verificar que las consultas de usuarios pasan antes que el resto"""
+    cliente = _Cliente()
+    planificador = Planificador(cliente, Cubeta(tasa=1000, capacidad=1000))
+    planificador.pausar(60)
+    orden = []
+
+    def llamar(prioridad, nombre):
+        planificador.ejecutar(prioridad, orden.append, nombre)
+
+    hilos = []
+    for i, (prioridad, nombre) in enumerate(
+        [(BUSQUEDA, "busqueda"), (FONDO, "fondo 1"), (INTERACTIVA, "usuario"), (FONDO, "fondo 2")]
+    ):
+        hilos.append(threading.Thread(target=llamar, args=(prioridad, nombre)))
+        hilos[-1].start()
+        _esperar_en_cola(planificador, i + 1)
+    planificador.reiniciar()
+    for hilo in hilos:
+        hilo.join(2)
+
+    assert orden == ["usuario", "fondo 1", "fondo 2", "busqueda"]
+
+
+def test_cotizaciones_en_cola_se_juntan():
+    """Test para verificar que los pedidos en espera salen en un solo /quote"""
+    cliente = _Cliente()
+    planificador = Planificador(cliente, Cubeta(tasa=1000, capacidad=1000))
+    planificador.pausar(60)
+    resultados = {}
+
+    def pedir(nombre, symbols, prioridad):
+        resultados[nombre] = planificador.cotizaciones(symbols, prioridad)
+
+    fondo = threading.Thread(target=pedir, args=("fondo", ["AAA", "BBB"], FONDO))
+    fondo.start()
+    _esperar_en_cola(planificador, 1)
+    usuario = threading.Thread(target=pedir, args=("usuario", ["BBB", "CCC"], INTERACTIVA))
+    usuario.start()
+    time.sleep(0.05)
+    assert planificador._cola[0].prioridad == INTERACTIVA
+    planificador.reiniciar()
+    fondo.join(2)
+    usuario.join(2)
+
+    assert cliente.llamadas == [("quote", ["AAA", "BBB", "CCC"])]
+    assert [c["symbol"] for c in resultados["fondo"]] == ["AAA", "BBB"]
+    assert [c["symbol"] for c in resultados["usuario"]] == ["BBB", "CCC"]
+
+
+def test_429_pausa_hasta_retry_after():
+    """Test para verificar que un 429 detiene las llamadas y las demás fallan sin esperar de más"""
+    cliente = _Cliente(error=LimiteSolicitudesError(30))
+    planificador = Planificador(
+        cliente, Cubeta(tasa=1000, capacidad=1000), esperas_maximas={INTERACTIVA: 1}
+    )
+
+    with pytest.raises(LimiteSolicitudesError):
+        planificador.cotizaciones(["AAA"])
+    inicio = time.monotonic()
+    with pytest.raises(LimiteSolicitudesError) as error:
+        planificador.cotizaciones(["BBB"])
+
+    assert time.monotonic() - inicio < 0.5
+    assert 29 <= error.value.retry_after <= 30
+    assert cliente.llamadas == [("quote", ["AAA"])]
+    assert planificador.estadisticas()["pausado_por"] > 29
+
+
+def test_cliente_priorizado_respeta_la_cubeta():
+    """Test para verificar que las llamadas por encima de la tasa esperan su ficha"""
+    cliente = _Cliente()
+    planificador = Planificador(cliente, Cubeta(tasa=20, capacidad=1))
+    fondo = planificador.con_prioridad(FONDO)
+
+    inicio = time.monotonic()
+    for term in ("AA", "BB", "CC"):
+        fondo.buscar(term)
+
+    assert time.monotonic() - inicio >= 0.09
+    assert [term for _, term in cliente.llamadas] == ["AA", "BB", "CC"]
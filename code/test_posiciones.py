@@ -0,0 +1,71 @@
+import sqlite3
+
+import pytest
+
+import base_datos
+import posiciones
+
+
+def _posiciones(conn):
+    return conn.execute(
+        "SELECT symbol, cantidad_total, valor_usd_total FROM posiciones ORDER BY symbol"
+    ).fetchall()
+
+
+def test_inicializar_desde_historial(db):
+    """Test para verificar que la tabla se llena con el historial existente"""
+    with base_datos.escritura() as conn:
+        conn.execute(
+            "INSERT INTO historial_compras (symbol, cantidad_acciones, valor_total) "
+            "VALUES ('AAPL', 10, 1500.0), ('AAPL', 5, 800.0), ('MSFT', 2, 600.0)"
+        )
+        posiciones.inicializar(conn)
+
+    with base_datos.conexion() as conn:
+        assert _posiciones(conn) == [("AAPL", 15, 2300.0), ("MSFT", 2, 600.0)]
+
+
+def test_registrar_compra_actualiza_posicion(db):
+    """Test para verificar que cada compra suma a su posición"""
+    with base_datos.escritura() as conn:
+        posiciones.inicializar(conn)
+        posiciones.registrar_compra(conn, "2024-01-02", "AAPL", 10, 150.0)
+        posiciones.registrar_compra(conn, "2024-02-01", "AAPL", 5, 160.0)
+
+    with base_datos.conexion() as conn:
+        assert _posiciones(conn) == [("AAPL", 15, 2300.0)]
+        assert conn.execute("SELECT COUNT(*) FROM historial_compras").fetchone()[0] == 2
+        assert posiciones.diferencias(conn) == []
+
+
+def test_compra_fallida_no_deja_posicion(db):
+    """Test para verificar que compra y posición van en la misma transacción"""
+    with base_datos.escritura() as conn:
+        posiciones.inicializar(conn)
+
+    with pytest.raises(sqlite3.Error):
+        with base_datos.escritura() as conn:
+            posiciones.registrar_compra(conn, "2024-01-02", "AAPL", 10, 150.0)
+            conn.execute("INSERT INTO tabla_inexistente VALUES (1)")
+
+    with base_datos.conexion() as conn:
+        assert _posiciones(conn) == []
+
+
+def test_verificar_y_reconstruir(db, capsys):
+    """Test para verificar que se detecta y corrige una desviación"""
+    with base_datos.escritura() as conn:
+        posiciones.inicializar(conn)
+        posiciones.registrar_compra(conn, "2024-01-02", "AAPL", 10, 150.0)
+        conn.execute(
+            "INSERT INTO historial_compras (symbol, cantidad_acciones, valor_total) "
+            "VALUES ('MSFT', 2, 600.0)"
+        )
+
+    assert posiciones.main(["--verificar"]) == 1
+    assert "MSFT: posiciones=None historial=(2, 600.0)" in capsys.readouterr().out
+
+    assert posiciones.main([]) == 0
+    assert posiciones.main(["--verificar"]) == 0
+    with base_datos.conexion() as conn:
+        assert _posiciones(conn) == [("AAPL", 10, 1500.0), ("MSFT", 2, 600.0)]
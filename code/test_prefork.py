@@ -0,0 +1,145 @@
+import os
+import signal
+import subprocess
+import sys
+import textwrap
+import time
+
+import pytest
+import requests
+
+import prefork
+from benchmark import _puerto_libre
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_candidato_uno_solo_es_lider(tmp_path):
+    """Test para verificar que el bloqueo lo tiene un solo candidato a la vez"""
+    ruta = str(tmp_path / "precios.db.lider")
+    primero, segundo = prefork.Candidato(ruta), prefork.Candidato(ruta)
+
+    assert primero.intentar()
+    assert not segundo.intentar()
+    assert primero.intentar()  # quien ya lo tiene lo conserva
+
+    primero.renunciar()
+    assert segundo.intentar()
+    assert (primero.lider, segundo.lider) == (False, True)
+    segundo.renunciar()
+
+
+def test_reponer_atiende_lo_recogido_por_cualquiera():
+    """Test para verificar que lo recogido mientras se espera a otro también se reemplaza"""
+    maestro = prefork.Maestro(None, 2, None, salida=lambda *_: None)
+    lanzados = []
+    maestro._lanzar = lambda: lanzados.append(1)
+    maestro._activo = True
+
+    retirado = subprocess.Popen(["true"])
+    caido = subprocess.Popen(["true"])
+    maestro.hijos = {retirado.pid: 0.0, caido.pid: 0.0}
+    maestro._retirados.add(retirado.pid)
+    assert maestro._esperar(retirado.pid, time.monotonic() + 5)
+    _esperar(lambda: maestro._recoger() or not maestro.hijos)
+
+    maestro._reponer()
+    assert lanzados == [1]
+    assert maestro._retirados == set() and maestro._terminados == []
+
+
+# Maestro con una app WSGI que responde el pid del trabajador y la versión
+# que leyó al arrancar; los trabajadores vuelven a ejecutar el script
+APP = textwrap.dedent("""
+    from gevent import monkey
+    monkey.patch_all()
+    import os, sys
+    from gevent.pywsgi import WSGIServer
+    import prefork
+
+    with open(sys.argv[2]) as archivo:
+        VERSION = archivo.read()
+
+    def app(environ, responder):
+        responder("200 OK", [("Content-Type", "text/plain")])
+        return [f"{os.getpid()} {VERSION}".encode()]
+
+    def crear_servidor(listener):
+        return WSGIServer(listener, app, log=None)
+
+    heredado = prefork.listener_heredado()
+    if heredado is not None:
+        prefork.servir(crear_servidor, heredado, 1)
+        raise SystemExit(0)
+    maestro = prefork.Maestro(crear_servidor, 2, ("127.0.0.1", int(sys.argv[1])), gracia=1,
+                              comando=[sys.executable] + sys.argv)
+    raise SystemExit(maestro.ejecutar())
+""")
+
+
+def _respuestas(url, pedidos=20):
+    respuestas = set()
+    for _ in range(pedidos):
+        try:
+            pid, version = requests.get(url, headers={"Connection": "close"}, timeout=2).text.split()
+            respuestas.add((int(pid), version))
+        except requests.exceptions.ConnectionError:
+            time.sleep(0.1)
+    return respuestas
+
+
+def _pids(url, pedidos=20):
+    return {pid for pid, _ in _respuestas(url, pedidos)}
+
+
+def _esperar(condicion, segundos=15):
+    limite = time.monotonic() + segundos
+    while time.monotonic() < limite:
+        resultado = condicion()
+        if resultado:
+            return resultado
+        time.sleep(0.1)
+    return condicion()
+
+
+@pytest.fixture
+def maestro(tmp_path):
+    script = tmp_path / "app.py"
+    script.write_text(APP)
+    version = tmp_path / "version"
+    version.write_text("v1")
+    puerto = _puerto_libre()
+    proceso = subprocess.Popen(
+        [sys.executable, str(script), str(puerto), str(version)],
+        cwd=DIRECTORIO,
+        env=dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [DIRECTORIO, os.getenv("PYTHONPATH")]))),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    yield proceso, f"http://127.0.0.1:{puerto}/", version
+    if proceso.poll() is None:
+        proceso.kill()
+        proceso.wait()
+
+
+def test_maestro_reemplaza_recarga_y_se_detiene(maestro):
+    """Test para verificar el reemplazo de trabajadores caídos, SIGHUP y SIGTERM"""
+    proceso, url, version = maestro
+    iniciales = _esperar(lambda: _pids(url))
+    assert iniciales and proceso.pid not in iniciales
+
+    caido = next(iter(iniciales))
+    os.kill(caido, signal.SIGKILL)
+    # El que queda sigue atendiendo y el caído se reemplaza
+    assert _esperar(lambda: _pids(url) - iniciales)
+
+    # SIGHUP arranca trabajadores que leen de nuevo lo que hay en el disco
+    antes = _pids(url)
+    version.write_text("v2")
+    proceso.send_signal(signal.SIGHUP)
+    assert _esperar(lambda: not (_pids(url) & antes))
+    assert {v for _, v in _respuestas(url)} == {"v2"}
+
+    proceso.send_signal(signal.SIGTERM)
+    assert proceso.wait(15) == 0
+    with pytest.raises(requests.exceptions.ConnectionError):
+        requests.get(url, timeout=2)
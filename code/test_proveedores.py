@@ -0,0 +1,110 @@
+import json
+
+import gevent
+import pytest
+
+from cliente_fmp import LimiteSolicitudesError
+from planificador import FONDO
+from proveedores import Cotizador, Grabador, Latencias, ProveedorArchivo
+
+
+class _Proveedor:
+    # Responde un precio por símbolo después de `demora` segundos
+    def __init__(self, nombre, demora=0.0, precio=1.0, error=None):
+        self.nombre = nombre
+        self.demora = demora
+        self.precio = precio
+        self.error = error
+        self.llamadas = 0
+
+    def cotizaciones(self, symbols, prioridad=None):
+        self.llamadas += 1
+        gevent.sleep(self.demora)
+        if self.error:
+            raise self.error
+        return [{"symbol": s, "price": self.precio} for s in symbols]
+
+
+def test_latencias_p95():
+    """Test para verificar el p95 y que hace falta un mínimo de muestras"""
+    latencias = Latencias(ventana=100, min_muestras=10)
+    for i in range(9):
+        latencias.observar(i / 100)
+    assert latencias.p95() is None
+
+    for i in range(9, 100):
+        latencias.observar(i / 100)
+    assert latencias.p95() == 0.95
+    # La ventana descarta las más viejas
+    for _ in range(100):
+        latencias.observar(0.01)
+    assert latencias.estadisticas() == {"muestras": 100, "p95": 0.01}
+
+
+def test_cubre_al_primero_cuando_supera_su_p95():
+    """Test para verificar que el segundo responde si el primero tarda de más"""
+    lento, rapido = _Proveedor("lento", demora=0.5, precio=1.0), _Proveedor("rapido", precio=2.0)
+    cotizador = Cotizador([lento, rapido], espera_inicial=0.05)
+
+    assert cotizador.cotizaciones(["AAPL"]) == [{"symbol": "AAPL", "price": 2.0}]
+    assert (lento.llamadas, rapido.llamadas) == (1, 1)
+
+    # Sin pasar su p95 el primero responde solo
+    lento.demora = 0.0
+    assert cotizador.cotizaciones(["AAPL"]) == [{"symbol": "AAPL", "price": 1.0}]
+    assert rapido.llamadas == 1
+
+
+def test_el_p95_observado_decide_cuando_cubrir():
+    """Test para verificar que la espera sale de las latencias del proveedor"""
+    primero, segundo = _Proveedor("primero", demora=0.02), _Proveedor("segundo", precio=2.0)
+    cotizador = Cotizador([primero, segundo], espera_inicial=0.001, espera_minima=0, min_muestras=5)
+    for _ in range(5):
+        cotizador.latencias["primero"].observar(0.2)
+
+    # 0.02 s está por debajo del p95 de 0.2 s: no se cubre
+    assert cotizador.cotizaciones(["AAPL"])[0]["price"] == 1.0
+    assert segundo.llamadas == 0
+
+
+def test_sin_cobertura_en_segundo_plano_pero_con_respaldo():
+    """Test para verificar que el refresco no duplica pedidos y que un error pasa al siguiente"""
+    lento, respaldo = _Proveedor("lento", demora=0.1), _Proveedor("respaldo", precio=2.0)
+    cotizador = Cotizador([lento, respaldo], espera_inicial=0.01)
+
+    assert cotizador.cotizaciones(["AAPL"], FONDO)[0]["price"] == 1.0
+    assert respaldo.llamadas == 0
+
+    lento.error = LimiteSolicitudesError(30)
+    assert cotizador.cotizaciones(["AAPL"], FONDO)[0]["price"] == 2.0
+
+
+def test_sin_respuesta_valida():
+    """Test para verificar qué se devuelve cuando ningún proveedor tiene el precio"""
+    vacio = _Proveedor("vacio")
+    vacio.cotizaciones = lambda symbols, prioridad=None: []
+    caido = _Proveedor("caido", error=LimiteSolicitudesError(30))
+
+    assert Cotizador([vacio, caido]).cotizaciones(["ZZZZ"]) == []
+    # Lo que responda el respaldo no tapa el error del primero
+    with pytest.raises(LimiteSolicitudesError):
+        Cotizador([caido, vacio]).cotizaciones(["ZZZZ"])
+    with pytest.raises(LimiteSolicitudesError) as exc_info:
+        Cotizador([caido, _Proveedor("otro", error=ValueError("x"))]).cotizaciones(["AAPL"])
+    assert exc_info.value.retry_after == 30
+
+
+def test_grabar_y_repetir(tmp_path):
+    """Test para verificar que lo grabado se puede repetir sin conexión"""
+    ruta = str(tmp_path / "precios.json")
+    grabador = Grabador(_Proveedor("fmp", precio=150.0), ruta)
+    archivo = ProveedorArchivo(ruta)
+    assert archivo.cotizaciones(["AAPL"]) == []
+
+    grabador.cotizaciones(["AAPL", "MSFT"])
+    assert archivo.cotizaciones(["MSFT", "GOOG"]) == [{"symbol": "MSFT", "price": 150.0}]
+
+    # También sirve una respuesta de /quote guardada tal cual
+    with open(ruta, "w") as f:
+        json.dump([{"symbol": "GOOG", "price": 99.5, "name": "Alphabet"}], f)
+    assert archivo.cotizaciones(["GOOG"]) == [{"symbol": "GOOG", "price": 99.5}]
@@ -0,0 +1,58 @@
+import gevent
+
+from refrescador import Refrescador
+
+
+def test_ciclo_refresca_por_lotes():
+    """Test para verificar que un ciclo reparte los símbolos en lotes"""
+    lotes = []
+    refrescador = Refrescador(
+        lambda: ["AAPL", "MSFT", "GOOG", "AMZN", "META"],
+        lambda lote: lotes.append(lote) or {s: 1.0 for s in lote},
+        tamano_lote=2, pausa=0
+    )
+
+    refrescador.ciclo()
+
+    assert lotes == [["AAPL", "MSFT"], ["GOOG", "AMZN"], ["META"]]
+    stats = refrescador.estadisticas()
+    assert stats["ciclos"] == 1
+    assert stats["simbolos_refrescados"] == 5
+    assert stats["en_curso"] == 0
+    assert stats["ultimo_ciclo"] is not None
+
+
+def test_solicitar_no_duplica_refrescos():
+    """Test para verificar que un símbolo en curso no se vuelve a pedir"""
+    llamadas = []
+
+    def refrescar(lote):
+        llamadas.append(lote)
+        gevent.sleep(0.01)
+        return {}
+
+    refrescador = Refrescador(lambda: [], refrescar)
+
+    assert refrescador.solicitar(["AAPL", "MSFT"]) == ["AAPL", "MSFT"]
+    assert refrescador.en_curso("AAPL")
+    assert refrescador.solicitar(["AAPL", "GOOG"]) == ["GOOG"]
+    gevent.sleep(0.05)
+
+    assert llamadas == [["AAPL", "MSFT"], ["GOOG"]]
+    assert not refrescador.en_curso("AAPL")
+
+
+def test_errores_se_cuentan():
+    """Test para verificar que un lote que falla no frena el ciclo"""
+    def refrescar(lote):
+        if "MALO" in lote:
+            raise ValueError("Error al obtener datos de la API: 500")
+        return {s: 1.0 for s in lote}
+
+    refrescador = Refrescador(lambda: ["MALO", "AAPL"], refrescar, tamano_lote=1, pausa=0)
+    refrescador.ciclo()
+
+    stats = refrescador.estadisticas()
+    assert stats["errores"] == 1
+    assert stats["simbolos_refrescados"] == 1
+    assert stats["en_curso"] == 0
@@ -0,0 +1,147 @@
+from datetime import date
+
+import numpy as np
+import pytest
+
+import base_datos
+import historico
+import posiciones
+import rendimiento
+
+
+@pytest.fixture
+def cartera(db):
+    with base_datos.escritura() as conn:
+        posiciones.inicializar(conn)
+        rendimiento.inicializar(conn)
+        posiciones.registrar_compras(conn, [("2024-01-02", "AAPL", 10, 100.0)])
+        historico.guardar(conn, "AAPL", [
+            (date(2024, 1, 2), 100.0), (date(2024, 1, 3), 110.0), (date(2024, 1, 5), 121.0)
+        ])
+    return db
+
+
+def _actualizar():
+    with base_datos.escritura() as conn:
+        return rendimiento.actualizar(conn)
+
+
+def _serie():
+    with base_datos.conexion() as conn:
+        return conn.execute(
+            "SELECT dia, valor, aporte, invertido, indice FROM serie_cartera ORDER BY dia"
+        ).fetchall()
+
+
+def _recalcular_todo():
+    # La misma serie calculada desde cero, para comparar con la incremental
+    with base_datos.escritura() as conn:
+        conn.execute("DELETE FROM serie_cartera_estado")
+        conn.execute("DELETE FROM serie_cartera")
+        rendimiento.actualizar(conn)
+    return _serie()
+
+
+def test_serie_diaria(cartera):
+    """Test para verificar el valor diario con el último cierre conocido"""
+    assert _actualizar() == date(2024, 1, 2)
+
+    with base_datos.conexion() as conn:
+        resumen = rendimiento.resumen(conn)
+    assert resumen["fechas"] == ["2024-01-02", "2024-01-03", "2024-01-04", "2024-01-05"]
+    assert resumen["valores"] == [1000.0, 1100.0, 1100.0, 1210.0]
+    assert resumen["invertido"] == [1000.0] * 4
+    assert resumen["twr"] == pytest.approx(0.21)
+    # Un solo aporte y menos de un año: coincide con el rendimiento del período
+    assert resumen["mwr"] == pytest.approx(0.21)
+    # Sin cambios no se recalcula nada
+    assert _actualizar() is None
+
+
+def test_cierres_nuevos_solo_recalculan_el_final(cartera):
+    """Test para verificar que un día nuevo de precios solo agrega el tramo final"""
+    _actualizar()
+    antes = _serie()
+    with base_datos.escritura() as conn:
+        historico.guardar(conn, "AAPL", [(date(2024, 1, 8), 133.1)])
+
+    assert _actualizar() == date(2024, 1, 6)
+    despues = _serie()
+    assert despues[:len(antes)] == antes
+    assert len(despues) == len(antes) + 3
+    assert despues == _recalcular_todo()
+
+
+def test_compra_recalcula_desde_su_fecha(cartera):
+    """Test para verificar que una compra solo recalcula desde el día en que ocurrió"""
+    _actualizar()
+    antes = _serie()
+    with base_datos.escritura() as conn:
+        posiciones.registrar_compras(conn, [("2024-01-04", "AAPL", 10, 110.0)])
+
+    assert _actualizar() == date(2024, 1, 4)
+    despues = _serie()
+    assert despues[:2] == antes[:2]
+    assert [fila[1] for fila in despues] == [1000.0, 1100.0, 2200.0, 2420.0]
+    assert despues == _recalcular_todo()
+
+    with base_datos.conexion() as conn:
+        resumen = rendimiento.resumen(conn)
+    # El aporte no cuenta como rendimiento
+    assert resumen["twr"] == pytest.approx(0.21)
+    assert resumen["invertido"][-1] == 2100.0
+
+
+def test_bloques_de_simbolos(cartera, monkeypatch):
+    """Test para verificar que valuar de a un símbolo por bloque da la misma serie"""
+    with base_datos.escritura() as conn:
+        posiciones.registrar_compras(conn, [("2024-01-03", "MSFT", 5, 50.0)])
+        historico.guardar(conn, "MSFT", [(date(2024, 1, 4), 60.0)])
+    completa = _recalcular_todo()
+
+    monkeypatch.setattr(rendimiento, "COLUMNAS_POR_BLOQUE", 1)
+    assert _recalcular_todo() == pytest.approx(completa)
+    assert [fila[1] for fila in completa] == [1000.0, 1350.0, 1400.0, 1510.0]
+
+
+def test_memoriza_por_version(cartera):
+    """Test para verificar que sin cambios el resumen se reutiliza"""
+    rendimientos = rendimiento.Rendimientos()
+    primero = rendimientos.obtener()
+    assert rendimientos.obtener() is primero
+    assert (rendimientos.calculos, rendimientos.aciertos) == (1, 1)
+
+    with base_datos.escritura() as conn:
+        historico.guardar(conn, "AAPL", [(date(2024, 1, 8), 133.1)])
+    assert rendimientos.obtener()["fechas"][-1] == "2024-01-08"
+    assert rendimientos.calculos == 2
+
+
+def test_calcula_sin_el_bloqueo_de_escritura(cartera, monkeypatch):
+    """Test para verificar que el cálculo lee sin bloquear las escrituras y guarda solo el tramo"""
+    original = rendimiento.pendiente
+    bloqueado = []
+
+    def pendiente(conn, cartera_id):
+        bloqueado.append(base_datos.pool._lock_escritura.locked())
+        return original(conn, cartera_id)
+    monkeypatch.setattr(rendimiento, "pendiente", pendiente)
+
+    rendimientos = rendimiento.Rendimientos()
+    assert rendimientos.obtener()["valores"][-1] == 1210.0
+    assert bloqueado == [False]
+
+    # Otro proceso ya la puso al día: se calcula pero no hace falta escribir
+    rendimientos.limpiar()
+    version = base_datos.pool.version
+    rendimientos.obtener()
+    assert base_datos.pool.version == version
+    assert rendimientos._candado(1) is rendimientos._candado(1)
+    assert rendimientos._candado(1) is not rendimientos._candado(2)
+
+
+def test_tasa_interna():
+    """Test para verificar la tasa anual ponderada por dinero"""
+    dias = np.array([0, 365])
+    assert rendimiento.tasa_interna(dias, np.array([-100.0, 110.0])) == pytest.approx(0.10)
+    assert rendimiento.tasa_interna(dias, np.array([-100.0, -10.0])) is None
@@ -0,0 +1,89 @@
+from datetime import date
+
+import numpy as np
+import pytest
+
+import base_datos
+import historico
+import posiciones
+import riesgo
+
+
+def test_covarianzas_de_a_pares():
+    """Test para verificar la covarianza y la correlación contra NumPy, con y sin huecos"""
+    azar = np.random.default_rng(1)
+    rendimientos = azar.normal(0, 0.01, (60, 4))
+    cov, corr = riesgo.covarianzas(rendimientos)
+    assert cov == pytest.approx(np.cov(rendimientos, rowvar=False))
+    assert corr == pytest.approx(np.corrcoef(rendimientos, rowvar=False))
+
+    # Un símbolo que empezó a cotizar después: cada par usa las ruedas en común
+    rendimientos[:20, 3] = np.nan
+    cov, corr = riesgo.covarianzas(rendimientos)
+    assert cov[0, 3] == pytest.approx(np.cov(rendimientos[20:, 0], rendimientos[20:, 3])[0, 1])
+    assert corr[3, 1] == pytest.approx(np.corrcoef(rendimientos[20:, 3], rendimientos[20:, 1])[0, 1])
+    assert cov[0, 1] == pytest.approx(np.cov(rendimientos[:, 0], rendimientos[:, 1])[0, 1])
+
+
+def test_volatilidad_beta_y_caida():
+    """Test para verificar la volatilidad móvil, la beta y la máxima caída"""
+    azar = np.random.default_rng(2)
+    referencia = azar.normal(0, 0.01, 50)
+    rendimientos = np.column_stack((2 * referencia, referencia + azar.normal(0, 0.001, 50)))
+
+    vol = riesgo.volatilidad_movil(rendimientos, 10)
+    assert np.isnan(vol[:9]).all()
+    esperada = np.std(rendimientos[-10:, 0], ddof=1) * np.sqrt(riesgo.RUEDAS_POR_ANIO)
+    assert vol[-1, 0] == pytest.approx(esperada)
+    assert np.isnan(riesgo.volatilidad_movil(rendimientos[:5], 10)).all()
+
+    betas = riesgo.beta(rendimientos, referencia)
+    assert betas[0] == pytest.approx(2.0)
+    assert betas[1] == pytest.approx(1.0, abs=0.1)
+
+    caida, fondo = riesgo.maxima_caida(np.array([100.0, 120.0, 90.0, 130.0, 117.0]))
+    assert (caida, fondo) == (pytest.approx(-0.25), 2)
+    caidas, fondos = riesgo.maxima_caida(np.array([[np.nan, np.nan], [1.0, np.nan], [2.0, np.nan]]))
+    assert caidas[0] == 0 and np.isnan(caidas[1]) and list(fondos) == [0, -1]
+
+
+def test_calcular_y_memorizar(db):
+    """Test para verificar el análisis de la cartera y que se memoriza por versión"""
+    hoy = date.today()
+    proveedor = historico.ProveedorSimulado()
+    with base_datos.escritura() as conn:
+        posiciones.inicializar(conn)
+        historico.inicializar(conn)
+        posiciones.registrar_compras(conn, [("2024-01-02", "AAPL", 10, 100.0),
+                                            ("2024-01-02", "MSFT", 5, 100.0),
+                                            ("2024-01-02", "NADA", 1, 1.0)])
+        for symbol in ("AAPL", "MSFT", "SPY"):
+            historico.guardar(conn, symbol, proveedor.cierres(symbol, date(hoy.year - 1, 1, 1), hoy))
+
+    riesgos = riesgo.Riesgos()
+    resultado = riesgos.obtener(ventana=21)
+    assert resultado["simbolos"] == ["AAPL", "MSFT"]
+    assert resultado["sin_datos"] == ["NADA"]
+    assert resultado["benchmark"] == "SPY"
+    assert resultado["correlacion"][0][0] == pytest.approx(1.0)
+    assert resultado["correlacion"][0][1] == resultado["correlacion"][1][0]
+    assert len(resultado["volatilidad"]["fechas"]) == len(resultado["volatilidad"]["cartera"])
+    assert resultado["volatilidad"]["cartera"][-1] > 0
+    assert resultado["beta"]["cartera"] is not None
+    assert -1 < resultado["maxima_caida"]["cartera"] <= 0
+
+    # Sin compras, ventas ni cierres nuevos se responde de memoria
+    assert riesgos.obtener(ventana=21) is resultado
+    assert (riesgos.aciertos, riesgos.calculos) == (1, 1)
+    assert riesgos.obtener(ventana=10) is not resultado
+    with base_datos.escritura() as conn:
+        historico.guardar(conn, "MSFT", [(hoy, 500.0)])
+    assert riesgos.obtener(ventana=21)["volatilidad"]["por_simbolo"]["MSFT"] > \
+        resultado["volatilidad"]["por_simbolo"]["MSFT"]
+    assert riesgos.calculos == 3
+
+    # Sin cierres se responde igual, con los valores vacíos
+    with base_datos.conexion() as conn:
+        vacio = riesgo.calcular(conn, hasta=date(1990, 1, 1))
+    assert vacio["simbolos"] == [] and vacio["correlacion"] == []
+    assert vacio["benchmark"] is None and vacio["maxima_caida"]["cartera"] is None
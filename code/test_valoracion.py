@@ -0,0 +1,94 @@
+import random
+from decimal import Decimal
+
+import valoracion
+
+
+def _como_texto(filas):
+    # Compara también la forma: "-0.00" y "0" no son lo mismo en el JSON
+    return [{k: str(v) for k, v in fila.items()} for fila in filas]
+
+
+def _referencia(filas, precios):
+    return [valoracion.fila_decimal(fila, precios) for fila in filas]
+
+
+def test_igual_a_decimal_en_casos_limite():
+    """Test para verificar que el cálculo vectorizado redondea igual que quantize"""
+    filas = [
+        ("AAPL", 10, 1507.5, 150.75),
+        ("EMPA", 1, 0.005, 0.005),            # empate: al par hacia abajo
+        ("EMPB", 1, 0.015, 0.015),            # empate: al par hacia arriba
+        ("NEGC", 1, 100.001, 100.0),          # pérdida que redondea a "-0.00"
+        ("SUMA", 3, 30.299999999999997, 10.1),  # suma de floats con muchos decimales
+        ("SINP", 5, 500.0, 100.0),            # sin precio
+        ("CERO", 5, 0.0, 0.0),                # valor cero: división inválida
+        ("DECI", 2, Decimal("200.50"), Decimal("100.25")),
+        ("NULO", 2, 200.0, 100.0),            # precio None
+        ("GRAN", 10 ** 7, 12345678901.5, 1234.57),
+    ]
+    precios = {
+        "AAPL": 150.75, "EMPA": 0.0, "EMPB": 0.0, "NEGC": 100.0, "SUMA": 10.1,
+        "CERO": 5.0, "DECI": Decimal("101.125"), "NULO": None, "GRAN": 2000.0,
+    }
+
+    resultado = valoracion.valorar(filas, precios).filas()
+
+    assert _como_texto(resultado) == _como_texto(_referencia(filas, precios))
+    assert str(resultado[3]["ganancia_perdida"]) == "-0.00"
+
+
+def test_igual_a_decimal_con_carteras_aleatorias():
+    """Test para verificar la equivalencia con Decimal en muchas posiciones"""
+    azar = random.Random(13)
+    filas, precios = [], {}
+    for i in range(3000):
+        symbol = f"S{i}"
+        compras = [(azar.randint(1, 500), round(azar.uniform(0.01, 900), 2))
+                   for _ in range(azar.randint(1, 6))]
+        cantidad = sum(c for c, _ in compras)
+        valor = 0.0
+        for c, p in compras:
+            valor += c * p
+        filas.append((symbol, cantidad, valor, round(valor / cantidad, 2)))
+        if azar.random() < 0.95:
+            precios[symbol] = round(azar.uniform(0.01, 900), azar.randint(0, 6))
+
+    valoracion_ = valoracion.valorar(filas, precios)
+
+    assert _como_texto(valoracion_.filas()) == _como_texto(_referencia(filas, precios))
+    # Casi todo debería resolverse sin Decimal
+    assert len(valoracion_.respaldo) < len(filas) * 0.05
+
+
+def test_totales():
+    """Test para verificar los totales de la cartera"""
+    filas = [("AAPL", 10, 1000.0, 100.0), ("MSFT", 5, 1500.0, 300.0)]
+    totales = valoracion.valorar(filas, {"AAPL": 110.0, "MSFT": 290.0}).totales()
+
+    assert totales == {
+        "valor_usd_total": Decimal("2500.00"),
+        "ganancia_perdida": Decimal("50.00"),
+        "valor_actual": Decimal("2550.00"),
+    }
+
+
+def test_formatear():
+    """Test para verificar el formato de los montos para mostrar"""
+    assert valoracion.formatear([Decimal("1234567.89"), Decimal("-0.00"), 10, Decimal("-1500.5")]) == [
+        "1,234,567.89", "-0.00", "10.00", "-1,500.50"
+    ]
+
+
+def test_formatear_filas():
+    """Test para verificar que cada fila recibe los textos de sus columnas"""
+    filas = valoracion.valorar([("AAPL", 10, 1000.0, 100.0)], {"AAPL": 150.0}).filas()
+
+    assert valoracion.formatear_filas(filas) == [{
+        "cantidad_total": "10.00",
+        "valor_usd_total": "1,000.00",
+        "precio_costo": "100.00",
+        "precio_actual": "150.00",
+        "ganancia_perdida": "500.00",
+        "porcentaje": "50.00",
+    }]
@@ -0,0 +1,113 @@
+import re
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from libro import ESCALA
+from lotes import METODOS
+
+# Mismas reglas que valida el formulario de index.html
+SIMBOLO_VALIDO = re.compile(r"^[A-Z0-9]+(\.[A-Z0-9]+)*$")
+
+# Las compras se guardan como enteros de SQLite (64 bits): la cantidad, el
+# precio en micros y también su producto, que suman las consultas de totales
+MAX_ENTERO = 2 ** 63 - 1
+MAX_VALOR = Decimal(MAX_ENTERO) / ESCALA
+
+
+def _texto(valor):
+    # Los campos de un JSON pueden llegar como números, listas o null
+    if valor is None or isinstance(valor, (bool, dict, list)):
+        return ""
+    return str(valor).strip()
+
+
+def validar_fecha_compra(valor, operacion="compra"):
+    if valor is not None and not isinstance(valor, str):
+        raise ValueError("Fecha inválida")
+    if not valor:
+        raise ValueError(f"La fecha de {operacion} es obligatoria")
+    try:
+        fecha = datetime.strptime(valor.strip(), '%Y-%m-%d')
+    except ValueError:
+        raise ValueError("Fecha inválida")
+    if fecha > datetime.now():
+        raise ValueError("La fecha no puede ser futura")
+    return fecha.strftime('%Y-%m-%d')
+
+
+def validar_symbol(valor):
+    if valor is not None and not isinstance(valor, str):
+        raise ValueError("El símbolo de la empresa debe ser un texto")
+    symbol = (valor or "").strip().upper()
+    if not symbol:
+        raise ValueError("El símbolo de la empresa es obligatorio")
+    if not SIMBOLO_VALIDO.match(symbol):
+        raise ValueError(
+            "El símbolo de la empresa debe contener solo letras mayúsculas, "
+            "números, y opcionalmente puntos ('.')"
+        )
+    return symbol
+
+
+def validar_cantidad(valor):
+    try:
+        cantidad = Decimal(_texto(valor))
+    except InvalidOperation:
+        raise ValueError("La cantidad de acciones debe ser un número")
+    if not cantidad.is_finite():
+        raise ValueError("La cantidad de acciones debe ser un número")
+    if cantidad <= 0:
+        raise ValueError("La cantidad de acciones debe ser mayor a 0")
+    if cantidad != cantidad.to_integral_value():
+        raise ValueError("La cantidad de acciones debe ser un número entero")
+    if cantidad > MAX_ENTERO:
+        raise ValueError("La cantidad de acciones es demasiado grande")
+    return int(cantidad)
+
+
+def validar_valor_compra(valor, operacion="compra"):
+    try:
+        valor_compra = Decimal(_texto(valor))
+    except InvalidOperation:
+        raise ValueError(f"El valor de {operacion} debe ser un número")
+    if not valor_compra.is_finite():
+        raise ValueError(f"El valor de {operacion} debe ser un número")
+    if valor_compra <= 0:
+        raise ValueError(f"El valor de {operacion} debe ser mayor a 0")
+    if valor_compra > MAX_VALOR:
+        raise ValueError(f"El valor de {operacion} es demasiado grande")
+    return float(valor_compra)
+
+
+def _validar_total(cantidad, valor, operacion):
+    # cantidad * precio en micros también tiene que entrar en un entero
+    if cantidad * round(Decimal(str(valor)) * ESCALA) > MAX_ENTERO:
+        raise ValueError(f"El total de la {operacion} es demasiado grande")
+
+
+def validar_compra(datos):
+    # datos: dict con las columnas del formulario (empresa o symbol)
+    compra = (
+        validar_fecha_compra(datos.get("fecha_compra")),
+        validar_symbol(datos.get("symbol") or datos.get("empresa")),
+        validar_cantidad(datos.get("cantidad_acciones")),
+        validar_valor_compra(datos.get("valor_compra")),
+    )
+    _validar_total(compra[2], compra[3], "compra")
+    return compra
+
+
+def validar_venta(datos):
+    # Como validar_compra; sin método el costo se asigna por FIFO
+    metodo = (_texto(datos.get("metodo")) or METODOS[0]).lower()
+    if metodo not in METODOS:
+        raise ValueError(f"Método no soportado: {metodo} (usar {', '.join(METODOS)})")
+    venta = (
+        validar_fecha_compra(datos.get("fecha_venta"), "venta"),
+        validar_symbol(datos.get("symbol") or datos.get("empresa")),
+        validar_cantidad(datos.get("cantidad_acciones")),
+        validar_valor_compra(datos.get("precio_venta"), "venta"),
+        metodo,
+    )
+    _validar_total(venta[2], venta[3], "venta")
+    return venta
@@ -0,0 +1,262 @@
+from decimal import Decimal
+
+import numpy as np
+
+# Los montos se llevan en millonésimas de dólar (micros) y los resultados en
+# centavos, siempre como int64: un centavo son 10**4 micros
+ESCALA = 10 ** 6
+MICROS_POR_CENTAVO = 10 ** 4
+# Hasta acá un float con seis decimales se pasa a micros sin error; montos
+# más grandes (o con más decimales) se calculan con Decimal
+MAXIMO_EXACTO = 1e9
+# Límite para productos y cocientes intermedios antes de desbordar int64
+MAXIMO_INT64 = 1e18
+
+CENTAVO = Decimal('0.01')
+
+COLUMNAS_MONTOS = (
+    "cantidad_total", "valor_usd_total", "precio_costo",
+    "precio_actual", "ganancia_perdida", "porcentaje"
+)
+
+
+def fila_decimal(row, precios):
+    # Cálculo fila a fila con Decimal: la referencia exacta que el cálculo
+    # vectorizado tiene que reproducir y el respaldo para lo que no cubre
+    symbol, cantidad_total, valor_usd_total, precio_costo = row
+
+    try:
+        precio_actual = Decimal(str(precios[symbol]))
+        valor_actual_total = precio_actual * Decimal(str(cantidad_total))
+        ganancia_perdida = valor_actual_total - Decimal(str(valor_usd_total))
+        porcentaje = (ganancia_perdida / Decimal(str(valor_usd_total)) * 100).quantize(CENTAVO)
+    except Exception:
+        precio_actual = Decimal('0')
+        ganancia_perdida = Decimal('0')
+        porcentaje = Decimal('0')
+
+    return {
+        'accion': symbol,
+        'cantidad_total': cantidad_total,
+        'valor_usd_total': Decimal(str(valor_usd_total)).quantize(CENTAVO),
+        'precio_costo': Decimal(str(precio_costo)).quantize(CENTAVO),
+        'precio_actual': precio_actual.quantize(CENTAVO),
+        'ganancia_perdida': ganancia_perdida.quantize(CENTAVO),
+        'porcentaje': porcentaje
+    }
+
+
+def _a_flotantes(valores):
+    # Devuelve (float64, admitidos): solo int, float y Decimal con pocos dígitos
+    # entran al cálculo vectorizado; el resto (None, textos...) va a Decimal
+    tipos = set(map(type, valores))
+    if tipos <= {int, float}:
+        return np.asarray(valores, dtype=np.float64), np.ones(len(valores), dtype=bool)
+
+    flotantes = np.zeros(len(valores), dtype=np.float64)
+    admitidos = np.zeros(len(valores), dtype=bool)
+    for i, valor in enumerate(valores):
+        if type(valor) in (int, float):
+            flotantes[i] = valor
+            admitidos[i] = True
+        elif isinstance(valor, Decimal) and valor.is_finite():
+            signo, digitos, exponente = valor.as_tuple()
+            if exponente >= -6 and len(digitos) + exponente <= 15:
+                flotantes[i] = float(valor)
+                admitidos[i] = True
+    return flotantes, admitidos
+
+
+def _a_micros(valores):
+    # (micros, admitidos, error): con error 0, Decimal(str(valor)) es justo
+    # micros / 10**6; un float con más de seis decimales queda con error 1,
+    # a menos de un micro del valor que ve Decimal
+    flotantes, admitidos = _a_flotantes(valores)
+    with np.errstate(invalid="ignore"):
+        admitidos &= np.isfinite(flotantes) & (np.abs(flotantes) < MAXIMO_EXACTO)
+        # -0.0 se imprime "-0.00" con Decimal: queda para el respaldo
+        admitidos &= ~((flotantes == 0) & np.signbit(flotantes))
+        flotantes = np.where(admitidos, flotantes, 0)
+        micros = np.rint(flotantes * ESCALA)
+        inexactos = micros / ESCALA != flotantes
+        # Aproximado a cero perdería el signo y el "no es cero"
+        admitidos &= ~(inexactos & (micros == 0))
+    return micros.astype(np.int64), admitidos, inexactos.astype(np.int64)
+
+
+def _cerca_de_empate(micros, error):
+    # Con error el redondeo a centavos puede diferir del de Decimal solo si
+    # cae a menos de `error` micros de medio centavo
+    medio = MICROS_POR_CENTAVO // 2
+    return (error > 0) & (np.abs(micros % MICROS_POR_CENTAVO - medio) <= error)
+
+
+def _redondear(cociente, resto, divisor):
+    # cociente + resto/divisor redondeado al par, como quantize por defecto
+    doble = 2 * resto
+    return cociente + ((doble > divisor) | ((doble == divisor) & (cociente % 2 == 1)))
+
+
+def _dividir(numerador, divisor):
+    cociente, resto = np.divmod(numerador, divisor)
+    return _redondear(cociente, resto, divisor)
+
+
+def _porcentaje(ganancia, valor):
+    # ganancia / valor * 100 en centésimos, dígito a dígito para no desbordar;
+    # devuelve (cociente, resto) sin redondear
+    cociente, resto = np.divmod(ganancia, valor)
+    for _ in range(4):
+        digito, resto = np.divmod(resto * 10, valor)
+        cociente = cociente * 10 + digito
+    return cociente, resto
+
+
+def _a_decimal(centavos, negativo=False):
+    decimal = Decimal(centavos).scaleb(-2)
+    return decimal.copy_negate() if negativo and not centavos else decimal
+
+
+def _formatear_centavos(centavos, negativos):
+    enteros, resto = np.divmod(np.abs(centavos), 100)
+    return [
+        f"{'-' if negativo else ''}{entero:,}.{decimales:02d}"
+        for negativo, entero, decimales in zip(negativos.tolist(), enteros.tolist(), resto.tolist())
+    ]
+
+
+def formatear(valores):
+    """Convierte montos con dos decimales en textos "1,234.50" de una vez."""
+    flotantes = np.asarray(valores, dtype=np.float64)
+    centavos = np.rint(flotantes * 100).astype(np.int64)
+    return _formatear_centavos(centavos, np.signbit(flotantes))
+
+
+def formatear_filas(filas, columnas=COLUMNAS_MONTOS):
+    # Una lista de dicts con los textos de cada columna, en el orden de filas
+    textos = {columna: formatear([fila[columna] for fila in filas]) for columna in columnas}
+    return [{columna: textos[columna][i] for columna in columnas} for i in range(len(filas))]
+
+
+class Valoracion:
+    """Valoriza toda la cartera de una sola pasada con aritmética entera.
+
+    `filas` son tuplas (symbol, cantidad_total, valor_usd_total, precio_costo)
+    y `precios` un dict {symbol: precio}. Los montos se llevan a micros en
+    arreglos int64 y se redondean a centavos igual que quantize(0.01); las
+    filas en las que eso no se puede garantizar se calculan con `fila_decimal`.
+    """
+
+    def __init__(self, filas, precios):
+        filas = list(filas)
+        self.symbols = [row[0] for row in filas]
+        self.cantidades_originales = [row[1] for row in filas]
+
+        cantidades, cantidades_ok = _a_flotantes(self.cantidades_originales)
+        with np.errstate(invalid="ignore"):
+            cantidades_ok &= (np.abs(cantidades) < MAXIMO_EXACTO) & (cantidades == np.floor(cantidades))
+        cantidades = np.where(cantidades_ok, cantidades, 0).astype(np.int64)
+        valor, valor_ok, error_valor = _a_micros([row[2] for row in filas])
+        costo, costo_ok, error_costo = _a_micros([row[3] for row in filas])
+        con_precio = np.array([s in precios for s in self.symbols], dtype=bool)
+        precio, precio_ok, error_precio = _a_micros([precios.get(s, 0) for s in self.symbols])
+
+        # Sin precio o con valor cero, Decimal falla y la fila queda en cero
+        calculable = con_precio & (valor != 0)
+        rapidas = cantidades_ok & valor_ok & costo_ok & (valor >= 0) & (~con_precio | precio_ok)
+        with np.errstate(over="ignore", invalid="ignore"):
+            producto = np.abs(precio.astype(np.float64) * cantidades)
+            rapidas &= ~calculable | (
+                (producto < MAXIMO_INT64)
+                & ((producto + valor) * MICROS_POR_CENTAVO / np.where(valor, valor, 1) < MAXIMO_INT64)
+            )
+        calculable &= rapidas
+
+        precio = np.where(calculable, precio, 0)
+        cantidades = np.where(calculable, cantidades, 0)
+        divisor = np.where(calculable, valor, 1)
+        ganancia = precio * cantidades - np.where(calculable, valor, 0)
+        cociente, resto = _porcentaje(ganancia, divisor)
+
+        # Los redondeos que con los valores aproximados quedan demasiado cerca
+        # de un empate (o del cero, por el signo) se dejan a Decimal
+        error_precio = np.where(calculable, error_precio, 0)
+        error_ganancia = error_precio * np.abs(cantidades) + np.where(calculable, error_valor, 0)
+        with np.errstate(over="ignore", invalid="ignore"):
+            margen = 2 * MICROS_POR_CENTAVO * (
+                error_ganancia + np.abs(ganancia) / divisor * error_valor
+            ) * 1.01 + 2
+            dudosas = (
+                _cerca_de_empate(valor, error_valor)
+                | _cerca_de_empate(costo, error_costo)
+                | _cerca_de_empate(precio, error_precio)
+                | _cerca_de_empate(ganancia, error_ganancia)
+                | ((error_ganancia > 0) & (np.abs(ganancia) <= error_ganancia))
+                | (calculable & ((error_ganancia > 0) | (error_valor > 0))
+                   & (np.abs(2 * resto - divisor) <= margen))
+            )
+        rapidas &= ~dudosas
+        calculable &= rapidas
+
+        def solo_rapidas(arreglo):
+            return np.where(rapidas, arreglo, 0)
+
+        self.valor_usd_total = solo_rapidas(_dividir(valor, MICROS_POR_CENTAVO))
+        self.precio_costo = solo_rapidas(_dividir(costo, MICROS_POR_CENTAVO))
+        self.precio_actual = np.where(calculable, _dividir(precio, MICROS_POR_CENTAVO), 0)
+        self.ganancia_perdida = np.where(calculable, _dividir(ganancia, MICROS_POR_CENTAVO), 0)
+        self.porcentaje = np.where(calculable, _redondear(cociente, resto, divisor), 0)
+        # Un resultado negativo que redondea a cero Decimal lo muestra "-0.00"
+        self.ganancia_negativa = calculable & (ganancia < 0)
+        self.calculable = calculable
+
+        # Lo que no entró al cálculo vectorizado (en los arreglos queda en
+        # cero) se resuelve con Decimal
+        self.respaldo = {
+            i: fila_decimal(filas[i], precios) for i in np.flatnonzero(~rapidas).tolist()
+        }
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def filas(self):
+        # Los mismos dicts con Decimal que devolvía el cálculo fila a fila
+        columnas = zip(
+            self.valor_usd_total.tolist(), self.precio_costo.tolist(),
+            self.precio_actual.tolist(), self.ganancia_perdida.tolist(),
+            self.porcentaje.tolist(), self.ganancia_negativa.tolist(),
+            self.calculable.tolist()
+        )
+        resultado = []
+        for i, (valor, costo, precio, ganancia, porcentaje, negativa, calculable) in enumerate(columnas):
+            fila = self.respaldo.get(i)
+            if fila is None:
+                fila = {
+                    'accion': self.symbols[i],
+                    'cantidad_total': self.cantidades_originales[i],
+                    'valor_usd_total': _a_decimal(valor),
+                    'precio_costo': _a_decimal(costo),
+                    'precio_actual': _a_decimal(precio),
+                    'ganancia_perdida': _a_decimal(ganancia, negativa),
+                    'porcentaje': _a_decimal(porcentaje, negativa) if calculable else Decimal('0')
+                }
+            resultado.append(fila)
+        return resultado
+
+    def totales(self):
+        # Sumas en centavos con enteros de Python, que no desbordan, más las
+        # filas calculadas con Decimal
+        invertido = _a_decimal(sum(self.valor_usd_total.tolist()))
+        ganancia = _a_decimal(sum(self.ganancia_perdida.tolist()))
+        for fila in self.respaldo.values():
+            invertido += fila["valor_usd_total"]
+            ganancia += fila["ganancia_perdida"]
+        return {
+            "valor_usd_total": invertido,
+            "ganancia_perdida": ganancia,
+            "valor_actual": invertido + ganancia,
+        }
+
+
+def valorar(filas, precios):
+    return Valoracion(filas, precios)